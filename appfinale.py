@@ -5,7 +5,7 @@ from io import BytesIO
 import os
 import streamlit as st
 from modules.loader import load_pdf
-from modules.rag_core import full_rag_pipeline
+from modules.rag_core import stream_rag_pipeline
 from modules.feedback import handle_feedback
 from modules.splitter import splitdocuments
 from modules.vector_store import load_index
@@ -291,23 +291,25 @@ with st.expander("📂 Gestion documentaire – Voir et ajouter des documents"):
 
     # 3. Bouton pour réindexer après ajout
     if st.button("🔄 Réindexer après ajout de documents"):
-        with st.spinner("📥 Lecture des documents, découpage et indexation en cours..."):
-            # Charger les PDF
-            all_documents = []
-            for pdf_path in pdf_files:
-                docs = load_pdf(pdf_path)
-                all_documents.extend(docs)
-
-            st.write(f"📚 **{len(all_documents)} pages extraites** avant découpage.")
-
-            # Chunking
-            chunks = splitdocuments(all_documents)
-            st.write(f"🧩 **{len(chunks)} chunks générés** pour l'indexation.")
-
-            # Ingestion finale
-            prepare_index_from_directory(data_dir, index_path)
-
-        st.success("✅ Index vectoriel reconstruit avec succès à partir des documents !")
+        with st.spinner("📥 Lecture des nouveaux documents, découpage et indexation en cours..."):
+            # Ingestion incrémentale : seuls les fichiers nouveaux ou modifiés sont vectorisés
+            report = prepare_index_from_directory(data_dir, index_path)
+
+        st.write(f"🧩 **{report['chunks_embedded']} chunks vectorisés** "
+                 f"({report['files_new']} nouveaux, {report['files_changed']} modifiés, "
+                 f"{report['files_deleted']} supprimés).")
+        st.write(f"⏭️ **{report['files_skipped']} documents inchangés ignorés** "
+                 f"({report['chunks_reused']} chunks réutilisés) • ⏱️ {report['duration_seconds']:.2f}s")
+        if report["file_timings"]:
+            slowest = report["file_timings"][0]
+            st.write(f"🐢 Parsing le plus long : `{os.path.basename(slowest['file'])}` "
+                     f"({slowest['pages']} pages, {slowest['parse_seconds']:.2f}s)")
+        if report.get("benchmark"):
+            bench = report["benchmark"]
+            st.write(f"📏 Index **{bench['index_type']}** ({bench['ntotal']} vecteurs) • "
+                     f"recall@{bench['k']} = {bench['recall_at_k']:.3f} • "
+                     f"p50 = {bench['p50_ms']:.2f} ms • p99 = {bench['p99_ms']:.2f} ms")
+        st.success("✅ Index vectoriel mis à jour avec succès à partir des documents !")
         
         
 # --------------------------------------------------------------------
@@ -340,6 +342,20 @@ with col_btn2:
         use_container_width=True,
         type="primary"
     )
+    force_regenerate = st.checkbox(
+        "🔄 Forcer une nouvelle génération",
+        help="Ignore les propositions en cache pour un brief similaire."
+    )
+
+def result_card_html(result_text: str) -> str:
+    return f"""
+    <div class="modern-card">
+        <h3 class="section-header">📄 Proposition Générée</h3>
+        <div style="white-space: pre-wrap; font-size: 1rem; line-height: 1.5;">
+            {result_text}
+        </div>
+    </div>
+    """
 
 # ---------------------------------------------------------------------------------
 # TRAITEMENT ET RÉSULTATS
@@ -349,11 +365,20 @@ if generate_button:
         st.session_state["proposal_ready"] = True
         
         with st.spinner("🔍 Analyse des documents en cours..."):
-            # Ton code existant pour RAG
-            result, top_chunks = full_rag_pipeline(user_query)
-            st.session_state["last_result"] = result
-            st.session_state["last_chunks"] = top_chunks
-            st.session_state["last_query"] = user_query
+            # Recherche + reranking ; la proposition arrive ensuite en streaming
+            fragments, top_chunks = stream_rag_pipeline(user_query, use_answer_cache=not force_regenerate)
+
+        # Affichage progressif dans la carte résultat, remplacée ensuite par l'affichage final
+        live_card = st.empty()
+        result = ""
+        for fragment in fragments:
+            result += fragment
+            live_card.markdown(result_card_html(result + "▌"), unsafe_allow_html=True)
+        live_card.empty()
+
+        st.session_state["last_result"] = result
+        st.session_state["last_chunks"] = top_chunks
+        st.session_state["last_query"] = user_query
     else:
         st.markdown("""
             <div class="status-warning">
@@ -368,14 +393,7 @@ if generate_button:
 if "last_result" in st.session_state and st.session_state.get("last_result", "").strip():
     result_text = st.session_state["last_result"]
     
-    st.markdown(f"""
-    <div class="modern-card">
-        <h3 class="section-header">📄 Proposition Générée</h3>
-        <div style="white-space: pre-wrap; font-size: 1rem; line-height: 1.5;">
-            {result_text}
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(result_card_html(result_text), unsafe_allow_html=True)
 
     # --- GÉNÉRER PDF EN MEMOIRE  ---
     try:
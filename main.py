@@ -2,48 +2,351 @@
 
 import os
 import glob
-from modules.loader import load_pdf
-from modules.splitter import splitdocuments
-from modules.embedder import get_embedding_model
-from modules.vector_store import build_faiss_index, save_index
+import time
+from modules.loader import load_and_split_pdfs
+from modules.resources import get_shared_embedder, invalidate_shared_index
+from modules.vector_store import build_faiss_index, save_index, load_index, index_vectors
+from modules.index_factory import (
+    INDEX_TYPES, QUANTIZATIONS, describe_index, needs_rebuild, supports_inplace_update,
+    apply_search_params, benchmark_index, check_filtered_search, compare_index_types, index_footprint,
+    quantization_report
+)
+from modules.retrieval import benchmark_retrieval, queries_from_metrics, retrieve
+from modules.reranker import benchmark_reranker_backends, RERANKER_BATCH_SIZE, RERANKER_MAX_LENGTH
+from modules.taxonomy import get_taxonomy_tagger, taxonomy_hash, tag_by_source, TAXONOMY_METADATA_KEY
+from modules.keyword_boosts import get_keyword_booster, BOOST_METADATA_KEY
+from modules.manifest import (
+    file_hash, relative_key, make_chunk_ids, load_manifest, save_manifest,
+    empty_manifest, record_file, diff_manifest
+)
 from fpdf import FPDF
 from pptx import Presentation
 from pptx.util import Inches, Pt
 
-def prepare_index_from_directory(data_dir: str, index_path: str):
+def prepare_index_from_directory(data_dir: str, index_path: str, full_rebuild: bool = False,
+                                 max_workers: int = None, index_type: str = None, # type: ignore
+                                 index_params: dict = None, benchmark: bool = False, # type: ignore
+                                 benchmark_k: int = 4) -> dict:
     """
-    Ingestion complète : PDF → chunks → embeddings → FAISS index
+    Ingestion incrémentale : PDF → chunks → embeddings → FAISS index
+
+    Seuls les fichiers nouveaux ou modifiés (hash différent dans le manifeste) sont relus et
+    vectorisés ; les vecteurs des fichiers supprimés sont retirés de l'index.
+    Sans manifeste (ou avec full_rebuild=True), l'index est reconstruit entièrement.
+    L'extraction des PDF se fait dans un pool de `max_workers` processus.
+
+    `index_type` ("flat", "ivf_flat", "hnsw" ; None = conserver le type existant) et `index_params`
+    choisissent la structure FAISS et le stockage des vecteurs (quantization="fp16" / "sq8" / "pq",
+    rescore=True pour re-scorer les candidats en float32). Les index approchés sont reconstruits à partir des vecteurs en cache
+    quand des chunks sont retirés (ils ne supportent pas la suppression en place).
+    Avec `benchmark=True`, le rapport contient recall@k vs recherche exacte et latences p50 / p99.
+    Les chunks sont étiquetés avec les labels de config/taxonomie.json ; si la taxonomie change,
+    les chunks existants sont ré-étiquetés sans être revectorisés.
+    De même, les mots-clés de boost du reranking (config/boost_keywords.json) sont cherchés à l'ingestion ;
+    si la liste change, seule cette métadonnée est recalculée.
+
+    Returns:
+        Rapport d'ingestion (fichiers traités / ignorés, chunks vectorisés / réutilisés / supprimés)
     """
+    start_time = time.time()
     print("🔄 Ingestion des documents depuis :", data_dir)
 
-    all_documents = []
+    pdf_files = sorted(glob.glob(os.path.join(data_dir, "**", "*.pdf"), recursive=True))
+    print(f"📄 {len(pdf_files)} fichiers PDF trouvés.")
 
-    #pdf_files = glob.glob(os.path.join(data_dir, "**", "*.pdf"), recursive=True)
-    pdf_files = glob.glob(os.path.join("data", "**", "*.pdf"), recursive=True)
+    paths_by_key = {relative_key(path, data_dir): path for path in pdf_files}
+    current_hashes = {key: file_hash(path) for key, path in paths_by_key.items()}
 
+    manifest = empty_manifest() if full_rebuild else load_manifest(index_path)
+    incremental = bool(manifest["files"]) and os.path.exists(os.path.join(index_path, "index.faiss"))
+    if not incremental:
+        manifest = empty_manifest()
 
-    print(f"📄 {len(pdf_files)} fichiers PDF trouvés.")
+    diff = diff_manifest(manifest, current_hashes)
+    to_process = diff["new"] + diff["changed"]
+    print(f"🧮 Nouveaux: {len(diff['new'])} • Modifiés: {len(diff['changed'])} • "
+          f"Inchangés: {len(diff['unchanged'])} • Supprimés: {len(diff['deleted'])}")
+
+    # 1. Lecture + découpage parallèles des seuls fichiers à (ré)indexer
+    chunks_per_file, timings = load_and_split_pdfs(
+        [paths_by_key[key] for key in to_process], max_workers=max_workers
+    )
+    for timing in timings:
+        print(f"📥 {timing['file']} : {timing['pages']} pages, {timing['chunks']} chunks, "
+              f"parsing {timing['parse_seconds']:.2f}s")
+
+    tagger = get_taxonomy_tagger()
+    current_taxonomy = taxonomy_hash()
+    retag = incremental and manifest.get("taxonomy_hash") != current_taxonomy
+    booster = get_keyword_booster()
+    reboost = incremental and manifest.get("boost_keywords_hash") != booster.keywords_hash
+
+    new_chunks = []
+    new_ids = []
+    chunk_ids_by_key = {}
+    for key, chunks in zip(to_process, chunks_per_file):
+        tagger.tag_documents(chunks)
+        booster.annotate(chunks)
+        ids = make_chunk_ids(key, current_hashes[key], len(chunks))
+        chunk_ids_by_key[key] = ids
+        new_chunks.extend(chunks)
+        new_ids.extend(ids)
+
+    print(f" Total de chunks à vectoriser : {len(new_chunks)}")
+
+    # 2. Vecteurs à retirer : fichiers modifiés ou supprimés
+    ids_to_remove = [
+        chunk_id
+        for key in diff["changed"] + diff["deleted"]
+        for chunk_id in manifest["files"][key]["chunk_ids"]
+    ]
+
+    report = {
+        "mode": "incremental" if incremental else "full",
+        "files_total": len(pdf_files),
+        "files_new": len(diff["new"]),
+        "files_changed": len(diff["changed"]),
+        "files_deleted": len(diff["deleted"]),
+        "files_skipped": len(diff["unchanged"]),
+        "chunks_embedded": len(new_chunks),
+        "chunks_removed": 0,
+        "chunks_reused": sum(len(manifest["files"][key]["chunk_ids"]) for key in diff["unchanged"]),
+        "parse_seconds": round(sum(timing["parse_seconds"] for timing in timings), 3),
+        # Fichiers les plus lents à parser en premier, pour repérer un PDF surdimensionné
+        "file_timings": sorted(timings, key=lambda timing: timing["parse_seconds"], reverse=True),
+        "chunks_retagged": 0,
+        "chunks_reboosted": 0,
+        "duration_seconds": 0.0
+    }
 
-    for pdf_path in pdf_files:
-        print(f"📥 Chargement : {pdf_path}")
-        docs = load_pdf(pdf_path)
-        all_documents.extend(docs)
+    if incremental and not to_process and not ids_to_remove and not retag and not reboost \
+            and index_type is None and not index_params:
+        report["duration_seconds"] = round(time.time() - start_time, 3)
+        print("✅ Index déjà à jour, aucune vectorisation nécessaire.")
+        return report
 
-    print(f"🧾 Total de pages extraites : {len(all_documents)}")
+    embedder = get_shared_embedder()
+    cache_hits, cache_misses = embedder.cache.hits, embedder.cache.misses
 
-    chunks = splitdocuments(all_documents)
-    print(f" Total de chunks générés : {len(chunks)}")
+    if incremental:
+        index = load_index(index_path, embedder, mmap=False)
+        current_type, current_params = describe_index(index.index)
+        target_type = index_type or current_type
+        # Les paramètres existants (quantification, M, nlist...) sont conservés sauf demande explicite
+        target_params = dict(current_params if target_type == current_type else {}, **(index_params or {}))
+        present_ids = set(index.index_to_docstore_id.values())
+        ids_to_remove = [chunk_id for chunk_id in ids_to_remove if chunk_id in present_ids]
+
+        updated_docs = {}
+        if retag or reboost:
+            # Taxonomie ou mots-clés de boost modifiés : seules ces métadonnées des chunks conservés sont recalculées
+            removed = set(ids_to_remove)
+            kept = [chunk_id for chunk_id in index.index_to_docstore_id.values() if chunk_id not in removed]
+            updated_docs = {chunk_id: index.docstore.search(chunk_id) for chunk_id in kept}
+            if retag:
+                tag_by_source(list(updated_docs.values()), tagger)
+                report["chunks_retagged"] = len(updated_docs)
+                print(f"🏷️ Taxonomie modifiée : {len(updated_docs)} chunks ré-étiquetés.")
+            if reboost:
+                booster.annotate(list(updated_docs.values()))
+                report["chunks_reboosted"] = len(updated_docs)
+                print(f"🚀 Mots-clés de boost modifiés : {len(updated_docs)} chunks mis à jour.")
+
+        if not needs_rebuild(index.index, index_type, index_params) and \
+                (supports_inplace_update(index.index) or not ids_to_remove):
+            if ids_to_remove:
+                index.delete(ids_to_remove)
+            if retag and updated_docs and hasattr(index.docstore, "set_taxonomy"):
+                index.docstore.set_taxonomy({
+                    chunk_id: doc.metadata[TAXONOMY_METADATA_KEY] for chunk_id, doc in updated_docs.items()
+                })
+            if reboost and updated_docs and hasattr(index.docstore, "set_metadata_field"):
+                index.docstore.set_metadata_field(BOOST_METADATA_KEY, {
+                    chunk_id: doc.metadata[BOOST_METADATA_KEY] for chunk_id, doc in updated_docs.items()
+                })
+            if new_chunks:
+                index.add_documents(new_chunks, ids=new_ids)
+            apply_search_params(index.index, index_params)
+            report["index_rebuilt"] = False
+        else:
+            # Reconstruction de la structure FAISS : les vecteurs conservés sortent du cache d'embeddings
+            removed = set(ids_to_remove)
+            kept_ids = [index.index_to_docstore_id[i] for i in range(index.index.ntotal)]
+            kept_ids = [chunk_id for chunk_id in kept_ids if chunk_id not in removed]
+            kept_docs = [updated_docs.get(chunk_id) or index.docstore.search(chunk_id) for chunk_id in kept_ids]
+            index = build_faiss_index(kept_docs + new_chunks, embedder, ids=kept_ids + new_ids,
+                                      index_type=target_type, index_params=target_params)
+            report["index_rebuilt"] = True
+        report["chunks_removed"] = len(ids_to_remove)
+    else:
+        if not new_chunks:
+            print("⚠️ Aucun chunk à indexer, index non créé.")
+            report["duration_seconds"] = round(time.time() - start_time, 3)
+            return report
+        index = build_faiss_index(new_chunks, embedder, ids=new_ids,
+                                  index_type=index_type or "flat", index_params=index_params)
+        report["index_rebuilt"] = True
+
+    report["index_type"], report["index_params"] = describe_index(index.index)
+    report["index_size"] = int(index.index.ntotal)
+    report.update(index_footprint(index.index))
 
-    embedder = get_embedding_model()
-    index = build_faiss_index(chunks, embedder)
     save_index(index, index_path)
 
-    print("✅ Index vectoriel FAISS créé et sauvegardé avec succès.")
-    
+    # Vecteurs relus dans le cache d'embeddings vs calculés par le modèle
+    report["embeddings_from_cache"] = embedder.cache.hits - cache_hits
+    report["embeddings_computed"] = embedder.cache.misses - cache_misses
+
+    # Benchmark sur le corpus réel : recall@k vs recherche exacte, latences p50 / p99
+    if benchmark and index.index.ntotal:
+        bench = benchmark_index(index.index, index_vectors(index), k=benchmark_k)
+        report["benchmark"] = bench
+        print(f"📏 Benchmark {bench['index_type']} : recall@{bench['k']} = {bench['recall_at_k']:.4f}, "
+              f"p50 = {bench['p50_ms']:.3f} ms, p99 = {bench['p99_ms']:.3f} ms")
+
+    # 3. Mise à jour du manifeste
+    for key in diff["deleted"]:
+        manifest["files"].pop(key, None)
+    for key in to_process:
+        record_file(manifest, key, current_hashes[key], chunk_ids_by_key[key])
+    manifest["taxonomy_hash"] = current_taxonomy
+    manifest["boost_keywords_hash"] = booster.keywords_hash
+    save_manifest(index_path, manifest)
 
+    # Les sessions remappent l'index à jour au prochain appel (chargement quasi instantané)
+    invalidate_shared_index(index_path)
+
+    report["duration_seconds"] = round(time.time() - start_time, 3)
+    print(f"✅ Index vectoriel FAISS mis à jour ({report['mode']}) : {report['chunks_embedded']} chunks vectorisés, "
+          f"{report['chunks_reused']} réutilisés, {report['chunks_removed']} supprimés.")
+    return report
+
+
+
+
+def compare_index_types_on_corpus(index_path: str, k: int = 4, num_queries: int = 100) -> list:
+    """
+    Compare flat / IVF / HNSW sur les vecteurs de l'index existant, sans rien sauvegarder.
+    """
+    index = load_index(index_path, get_shared_embedder())
+    results = compare_index_types(index_vectors(index), k=k, num_queries=num_queries)
+    for result in results:
+        print(f"📏 {result['index_type']:<9} recall@{result['k']} = {result['recall_at_k']:.4f} • "
+              f"p50 = {result['p50_ms']:.3f} ms • p99 = {result['p99_ms']:.3f} ms • "
+              f"construction = {result['build_seconds']:.2f}s")
+    return results
+
+
+def quantization_report_on_corpus(index_path: str, index_type: str = "flat", k: int = 4) -> list:
+    """
+    Compare float16 / SQ8 / PQ (avec ou sans re-score) au float32 sur les vecteurs de l'index existant.
+    """
+    index = load_index(index_path, get_shared_embedder())
+    results = quantization_report(index_vectors(index), index_type=index_type, k=k)
+    for result in results:
+        storage = result["index_params"]["quantization"] + (" + rescore" if result["index_params"]["rescore"] else "")
+        print(f"🗜️ {storage:<14} disque = {result['disk_bytes'] / 1024:.0f} Ko ({result['disk_ratio']:.0%}) • "
+              f"RAM estimée = {result['estimated_ram_bytes'] / 1024:.0f} Ko ({result['estimated_ram_ratio']:.0%}) • "
+              f"recall@{result['k']} = {result['recall_at_k']:.4f} ({result['recall_delta']:+.4f})")
+    return results
+
+
+def check_filtered_search_on_corpus(index_path: str) -> list:
+    """
+    Vérifie le pré-filtrage FAISS (partitions de la taxonomie) sur chaque type d'index × stockage,
+    avec les vecteurs de l'index existant.
+    """
+    index = load_index(index_path, get_shared_embedder())
+    results = check_filtered_search(index_vectors(index))
+    for result in results:
+        storage = result["quantization"] + (" + rescore" if result["rescore"] else "")
+        status = "✅" if result["ok"] else f"❌ {result.get('error', '')}"
+        mode = "" if result.get("prefiltered", True) else " (filtrage après coup)"
+        print(f"🔎 {result['index_type']:<9} {storage:<14} {status}{mode}")
+    return results
+
+
+def retrieval_benchmark_on_corpus(index_path: str, queries: list = None, k_values: tuple = (4, 8, 12, 16, 20)) -> dict: # type: ignore
+    """
+    Rappel dense vs hybride (BM25 + FAISS) selon faiss_k, sur les requêtes de l'historique des métriques.
+    """
+    queries = queries or queries_from_metrics()
+    if not queries:
+        print("⚠️ Aucune requête disponible pour le benchmark (historique des métriques vide).")
+        return {}
+    index = load_index(index_path, get_shared_embedder())
+    return benchmark_retrieval(index, queries, k_values=k_values)
+
+
+def reranker_benchmark_on_corpus(index_path: str, queries: list = None, faiss_k: int = 20, # type: ignore
+                                 batch_size: int = RERANKER_BATCH_SIZE, max_length: int = RERANKER_MAX_LENGTH) -> dict:
+    """
+    Latence et accord de classement du reranker PyTorch vs ONNX int8, sur les candidats FAISS
+    des requêtes de l'historique des métriques.
+    """
+    queries = queries or queries_from_metrics()
+    if not queries:
+        print("⚠️ Aucune requête disponible pour le benchmark (historique des métriques vide).")
+        return {}
+    index = load_index(index_path, get_shared_embedder())
+    candidates = [(query, retrieve(index, query, k=faiss_k)) for query in queries]
+    return benchmark_reranker_backends(candidates, batch_size=batch_size, max_length=max_length)
 
 
 if __name__ == "__main__":
+    import argparse
     DATA_DIR = "data"
     INDEX_PATH = "vector_store/propales_index"
-    prepare_index_from_directory(DATA_DIR, INDEX_PATH)
+
+    parser = argparse.ArgumentParser(description="Ingestion des PDF dans l'index FAISS")
+    parser.add_argument("--full", action="store_true", help="reconstruction complète (ignore le manifeste)")
+    parser.add_argument("--workers", type=int, default=None, help="processus d'extraction PDF")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=None)
+    parser.add_argument("--nlist", type=int, default=None, help="IVF : nombre de listes")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF : listes visitées par requête")
+    parser.add_argument("--hnsw-m", type=int, default=None, help="HNSW : voisins par nœud")
+    parser.add_argument("--ef-construction", type=int, default=None)
+    parser.add_argument("--ef-search", type=int, default=None)
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default=None)
+    parser.add_argument("--pq-m", type=int, default=None, help="PQ : nombre de sous-quantificateurs")
+    parser.add_argument("--pq-nbits", type=int, default=None, help="PQ : bits par code")
+    parser.add_argument("--rescore", action="store_true", default=None, help="re-score float32 des candidats")
+    parser.add_argument("--rescore-k-factor", type=int, default=None)
+    parser.add_argument("--benchmark", action="store_true",
+                        help="après l'ingestion : recall@k vs recherche exacte et latences p50 / p99")
+    parser.add_argument("--compare", action="store_true", help="benchmark flat / IVF / HNSW sur l'index existant")
+    parser.add_argument("--quantization-report", action="store_true",
+                        help="compare float16 / SQ8 / PQ au float32 sur l'index existant")
+    parser.add_argument("--check-filtered-search", action="store_true",
+                        help="vérifie la recherche filtrée sur chaque type d'index × stockage")
+    parser.add_argument("--retrieval-benchmark", action="store_true",
+                        help="rappel dense vs hybride (BM25 + FAISS) selon faiss_k")
+    parser.add_argument("--reranker-benchmark", action="store_true",
+                        help="latence et accord du reranker PyTorch vs ONNX int8")
+    parser.add_argument("--reranker-batch-size", type=int, default=RERANKER_BATCH_SIZE)
+    parser.add_argument("--reranker-max-length", type=int, default=RERANKER_MAX_LENGTH,
+                        help="tokens max par paire requête/chunk (0 : limite du modèle)")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_index_types_on_corpus(INDEX_PATH)
+    elif args.quantization_report:
+        quantization_report_on_corpus(INDEX_PATH, index_type=args.index_type or "flat")
+    elif args.check_filtered_search:
+        check_filtered_search_on_corpus(INDEX_PATH)
+    elif args.retrieval_benchmark:
+        retrieval_benchmark_on_corpus(INDEX_PATH)
+    elif args.reranker_benchmark:
+        reranker_benchmark_on_corpus(INDEX_PATH, batch_size=args.reranker_batch_size, max_length=args.reranker_max_length)
+    else:
+        params = {
+            "nlist": args.nlist, "nprobe": args.nprobe, "M": args.hnsw_m,
+            "ef_construction": args.ef_construction, "ef_search": args.ef_search,
+            "quantization": args.quantization, "pq_m": args.pq_m, "pq_nbits": args.pq_nbits,
+            "rescore": args.rescore, "rescore_k_factor": args.rescore_k_factor
+        }
+        params = {key: value for key, value in params.items() if value is not None}
+        prepare_index_from_directory(
+            DATA_DIR, INDEX_PATH, full_rebuild=args.full, max_workers=args.workers,
+            index_type=args.index_type, index_params=params or None, benchmark=args.benchmark
+        )
@@ -0,0 +1,126 @@
+# modules/answer_cache.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_ANSWER_CACHE_SIZE = 128
+
+
+class SemanticAnswerCache:
+    """
+    Cache sémantique des propositions générées : (vecteur de la requête → proposition, IDs des chunks du contexte).
+
+    Un brief proche d'un brief déjà traité (similarité cosinus ≥ `threshold`) dont la recherche
+    retourne exactement les mêmes chunks reçoit la proposition en cache, sans appel au LLM.
+    Les entrées expirent après `ttl_seconds` ; au-delà de `maxsize`, la moins récemment utilisée est retirée.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_SIMILARITY_THRESHOLD, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 maxsize: int = DEFAULT_ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.bypassed = 0
+        self.context_mismatches = 0
+        self.expired = 0
+        self.evictions = 0
+        self._hit_similarity_sum = 0.0
+
+    @staticmethod
+    def _unit(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _purge_expired(self, now: float):
+        for entry_id in [entry_id for entry_id, entry in self._entries.items()
+                         if now - entry["created_at"] > self.ttl_seconds]:
+            del self._entries[entry_id]
+            self.expired += 1
+
+    def lookup(self, vector: np.ndarray, chunk_ids: Sequence[str], model: str) -> Optional[str]:
+        """
+        Proposition en cache pour une requête proche avec le même contexte, ou None.
+        """
+        with self._lock:
+            self.lookups += 1
+            self._purge_expired(time.time())
+            if not self._entries:
+                return None
+
+            entry_ids = list(self._entries)
+            similarities = np.vstack([self._entries[i]["vector"] for i in entry_ids]) @ self._unit(vector)
+            context = tuple(chunk_ids)
+            near = False
+            for position in np.argsort(-similarities):
+                if similarities[position] < self.threshold:
+                    break
+                near = True
+                entry = self._entries[entry_ids[position]]
+                if entry["chunk_ids"] == context and entry["model"] == model:
+                    self._entries.move_to_end(entry_ids[position])
+                    self.hits += 1
+                    self._hit_similarity_sum += float(similarities[position])
+                    return entry["proposal"]
+            if near:
+                # Brief proche mais contexte différent : la proposition en cache ne s'applique pas
+                self.context_mismatches += 1
+            return None
+
+    def store(self, vector: np.ndarray, chunk_ids: Sequence[str], model: str, proposal: str):
+        with self._lock:
+            self._entries[self._next_id] = {
+                "vector": self._unit(vector),
+                "chunk_ids": tuple(chunk_ids),
+                "model": model,
+                "proposal": proposal,
+                "created_at": time.time()
+            }
+            self._next_id += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "bypassed": self.bypassed,
+            "context_mismatches": self.context_mismatches,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "avg_hit_similarity": round(self._hit_similarity_sum / self.hits, 4) if self.hits else 0.0
+        }
+
+
+# Instance globale (partagée par toutes les sessions Streamlit du process)
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("SKILLIA_ANSWER_CACHE_THRESHOLD", DEFAULT_SIMILARITY_THRESHOLD)),
+    ttl_seconds=float(os.getenv("SKILLIA_ANSWER_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+    maxsize=int(os.getenv("SKILLIA_ANSWER_CACHE_SIZE", DEFAULT_ANSWER_CACHE_SIZE))
+)
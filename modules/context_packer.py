@@ -0,0 +1,139 @@
+# modules/context_packer.py
+
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from modules.resources import resources
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("SKILLIA_CONTEXT_TOKEN_BUDGET", "3000"))
+CHUNK_SEPARATOR = "\n\n"
+MIN_OVERLAP_CHARS = 20   # en dessous, une coïncidence de texte n'est pas un recouvrement du découpage
+MAX_OVERLAP_CHARS = 300  # chunk_overlap du découpage (150) avec une marge pour les séparateurs
+
+
+def _encoding(model: str) -> Any:
+    def _load():
+        try:
+            import tiktoken
+        except ImportError:
+            print("⚠️ tiktoken non installé : tokens estimés à 4 caractères par token.")
+            return None
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    return resources.get(f"tokenizer:{model}", _load)
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """
+    Nombre de tokens du texte pour le tokenizer du modèle (estimation si tiktoken est absent).
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def overlap_length(first: str, second: str, max_overlap: int = MAX_OVERLAP_CHARS) -> int:
+    """
+    Longueur du plus long suffixe de `first` qui est aussi un préfixe de `second` (0 si < MIN_OVERLAP_CHARS).
+    """
+    tail = first[-max_overlap:]
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = tail.find(probe)
+    while start != -1:
+        if second.startswith(tail[start:]):
+            return len(tail) - start
+        start = tail.find(probe, start + 1)
+    return 0
+
+
+def _segment_key(doc: Document) -> Tuple[Any, Any]:
+    return doc.metadata.get("source"), doc.metadata.get("page")
+
+
+def merge_adjacent(reranked_docs: List[Tuple[Document, float]]) -> List[Dict[str, Any]]:
+    """
+    Regroupe les chunks voisins d'une même source/page (ceux dont les textes se recouvrent,
+    cf. chunk_overlap de splitdocuments) en segments sans le texte dupliqué.
+    Chaque segment garde le meilleur score de ses chunks ; l'ordre est celui des scores.
+    """
+    segments: List[Dict[str, Any]] = []
+    for doc, score in reranked_docs:
+        text = doc.page_content.strip()
+        segment = {"key": _segment_key(doc), "text": text, "score": score, "docs": [doc], "overlap_chars": 0}
+        # Un chunk peut relier deux segments déjà formés : on fusionne jusqu'à stabilité
+        merged = True
+        while merged:
+            merged = False
+            for other in segments:
+                if other["key"] != segment["key"]:
+                    continue
+                joined = _join(other, segment)
+                if joined is not None:
+                    segments.remove(other)
+                    segment = joined
+                    merged = True
+                    break
+        segments.append(segment)
+    segments.sort(key=lambda segment: segment["score"], reverse=True)
+    return segments
+
+
+def _join(first: Dict[str, Any], second: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    for head, tail in ((first, second), (second, first)):
+        overlap = overlap_length(head["text"], tail["text"])
+        if overlap:
+            return {
+                "key": head["key"],
+                "text": head["text"] + tail["text"][overlap:],
+                "score": max(head["score"], tail["score"]),
+                "docs": head["docs"] + tail["docs"],
+                "overlap_chars": head["overlap_chars"] + tail["overlap_chars"] + overlap
+            }
+    return None
+
+
+def pack_context(reranked_docs: List[Tuple[Document, float]], budget: int = CONTEXT_TOKEN_BUDGET,
+                 model: str = "gpt-3.5-turbo") -> Tuple[str, Dict[str, Any]]:
+    """
+    Contexte du prompt dans un budget de `budget` tokens :
+        1. chunks voisins d'une même source/page fusionnés, recouvrement retiré
+        2. segments ajoutés par score décroissant tant qu'ils tiennent entiers dans le budget
+           (un segment trop long est écarté, jamais coupé)
+    Returns:
+        (contexte, rapport : tokens bruts / envoyés / économisés par déduplication / écartés)
+    """
+    raw_tokens = count_tokens(CHUNK_SEPARATOR.join(doc.page_content.strip() for doc, *_ in reranked_docs), model)
+    segments = merge_adjacent(reranked_docs)
+    separator_tokens = count_tokens(CHUNK_SEPARATOR, model)
+
+    parts, used, dropped_tokens, dropped_chunks = [], 0, 0, 0
+    for segment in segments:
+        tokens = count_tokens(segment["text"], model)
+        cost = tokens + (separator_tokens if parts else 0)
+        if used + cost > budget:
+            dropped_tokens += tokens
+            dropped_chunks += len(segment["docs"])
+            continue
+        parts.append(segment["text"])
+        used += cost
+
+    context = CHUNK_SEPARATOR.join(parts)
+    context_tokens = count_tokens(context, model) if parts else 0
+    report = {
+        "budget_tokens": budget,
+        "raw_tokens": raw_tokens,
+        "context_tokens": context_tokens,
+        "tokens_saved": max(raw_tokens - context_tokens, 0),
+        "dedup_tokens_saved": max(raw_tokens - context_tokens - dropped_tokens, 0),
+        "segments": len(parts),
+        "chunks_merged": sum(len(segment["docs"]) - 1 for segment in segments),
+        "chunks_dropped": dropped_chunks
+    }
+    return context, report
@@ -0,0 +1,385 @@
+# modules/docstore.py
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from langchain.schema import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+DOCSTORE_FILENAME = "docstore.sqlite"
+
+# Colonnes de métadonnées interrogeables sans lire le texte des pages
+METADATA_COLUMNS = ("source", "page", "generated_at")
+TAGS_METADATA_KEY = "taxonomy"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id TEXT PRIMARY KEY,
+    position INTEGER,
+    source TEXT,
+    page INTEGER,
+    generated_at TEXT,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_position ON chunks(position);
+CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(source);
+CREATE INDEX IF NOT EXISTS idx_chunks_generated_at ON chunks(generated_at);
+-- Texte séparé des métadonnées : un filtre sur source / page ne lit aucune page de texte
+CREATE TABLE IF NOT EXISTS chunk_texts (
+    id TEXT PRIMARY KEY,
+    page_content TEXT NOT NULL
+);
+-- Labels de taxonomie (metadata["taxonomy"]), une ligne par (chunk, label)
+CREATE TABLE IF NOT EXISTS chunk_tags (
+    id TEXT NOT NULL,
+    label TEXT NOT NULL,
+    PRIMARY KEY (id, label)
+);
+CREATE INDEX IF NOT EXISTS idx_chunk_tags_label ON chunk_tags(label);
+"""
+
+# Index lexical (BM25) sur les textes, maintenu par triggers à chaque insertion / suppression
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS chunk_fts USING fts5(
+    page_content, content='chunk_texts', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS chunk_texts_ai AFTER INSERT ON chunk_texts BEGIN
+    INSERT INTO chunk_fts(rowid, page_content) VALUES (new.rowid, new.page_content);
+END;
+CREATE TRIGGER IF NOT EXISTS chunk_texts_ad AFTER DELETE ON chunk_texts BEGIN
+    INSERT INTO chunk_fts(chunk_fts, rowid, page_content) VALUES ('delete', old.rowid, old.page_content);
+END;
+"""
+
+
+def docstore_path(path: str) -> str:
+    return os.path.join(path, DOCSTORE_FILENAME)
+
+
+def has_sqlite_docstore(path: str) -> bool:
+    return os.path.exists(docstore_path(path))
+
+
+def _has_table(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+
+def _create_schema(conn: sqlite3.Connection):
+    conn.executescript(_SCHEMA)
+    if not _has_table(conn, "chunk_fts"):
+        conn.executescript(_FTS_SCHEMA)
+        # Base créée avant l'index lexical : on indexe les textes déjà présents
+        conn.execute("INSERT INTO chunk_fts(chunk_fts) VALUES ('rebuild')")
+        conn.commit()
+
+
+def _connect(db_path: str, read_only: bool = False) -> sqlite3.Connection:
+    if read_only:
+        return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False, isolation_level=None)
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    _create_schema(conn)
+    return conn
+
+
+def fts_query(text: str) -> str:
+    """
+    Requête FTS5 « OU » sur les termes du texte (guillemets : aucun mot n'est interprété comme opérateur).
+    """
+    terms = dict.fromkeys(re.findall(r"\w+", text.lower()))
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def _row(doc_id: str, position: int, doc: Document) -> tuple:
+    metadata = doc.metadata or {}
+    page = metadata.get("page")
+    return (
+        doc_id,
+        position,
+        metadata.get("source"),
+        page if isinstance(page, int) else None,
+        metadata.get("generated_at"),
+        json.dumps(metadata, ensure_ascii=False, default=str)
+    )
+
+
+def _insert(conn: sqlite3.Connection, rows: List[tuple]):
+    conn.executemany(
+        "INSERT OR REPLACE INTO chunks (id, position, source, page, generated_at, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+        [row for row, _ in rows]
+    )
+    # DELETE puis INSERT (et non INSERT OR REPLACE) pour que les triggers de l'index lexical se déclenchent
+    conn.executemany("DELETE FROM chunk_texts WHERE id = ?", [(row[0],) for row, _ in rows])
+    conn.executemany(
+        "INSERT INTO chunk_texts (id, page_content) VALUES (?, ?)",
+        [(row[0], text) for row, text in rows]
+    )
+    _replace_tags(conn, {row[0]: json.loads(row[5]).get(TAGS_METADATA_KEY) or [] for row, _ in rows})
+
+
+def _replace_tags(conn: sqlite3.Connection, tags_by_id: Dict[str, List[str]]):
+    conn.executemany("DELETE FROM chunk_tags WHERE id = ?", [(doc_id,) for doc_id in tags_by_id])
+    conn.executemany(
+        "INSERT OR IGNORE INTO chunk_tags (id, label) VALUES (?, ?)",
+        [(doc_id, label) for doc_id, labels in tags_by_id.items() for label in labels]
+    )
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    Docstore adossé à SQLite : recherche d'un chunk par ID via la clé primaire, textes lus
+    à la demande, et métadonnées (source, page, generated_at) indexées en colonnes.
+
+    En lecture seule, chaque requête SQL est sa propre transaction (aucun instantané gardé ouvert :
+    le WAL peut être checkpointé). Une ingestion qui réécrit l'index change sa version, et l'index
+    partagé est alors rechargé avec un nouveau docstore (modules.resources.get_shared_index).
+    En écriture, ajouts et suppressions restent en mémoire jusqu'à `write_docstore`.
+    """
+
+    def __init__(self, path: str, read_only: bool = True):
+        self.db_path = docstore_path(path)
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._conn = _connect(self.db_path, read_only=read_only)
+        if read_only:
+            self._conn.execute("PRAGMA query_only = ON")
+        self.has_fts = _has_table(self._conn, "chunk_fts")
+        self.has_tags = _has_table(self._conn, "chunk_tags")
+        self._added: Dict[str, Document] = {}
+        self._deleted = set()
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search in self._added:
+            return self._added[search]
+        if search in self._deleted:
+            return f"ID {search} not found."
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT c.metadata, t.page_content FROM chunks c JOIN chunk_texts t ON t.id = c.id WHERE c.id = ?",
+                (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[1], metadata=json.loads(row[0]))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        for doc_id, doc in texts.items():
+            self._deleted.discard(doc_id)
+            self._added[doc_id] = doc
+
+    def delete(self, ids: List) -> None:
+        for doc_id in ids:
+            self._added.pop(doc_id, None)
+            self._deleted.add(doc_id)
+
+    def id_at(self, position: int) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM chunks WHERE position = ?", (int(position),)).fetchone()
+        return row[0] if row else None
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks WHERE position IS NOT NULL").fetchone()[0]
+
+    def ids_by_position(self) -> Dict[int, str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT position, id FROM chunks WHERE position IS NOT NULL ORDER BY position"
+            ).fetchall()
+        return {position: doc_id for position, doc_id in rows}
+
+    def sparse_search(self, query: str, k: int = 20, labels: List[str] = None) -> List[Tuple[str, float]]: # type: ignore
+        """
+        Recherche lexicale BM25 : (ID, score) des k meilleurs chunks, score croissant avec la pertinence.
+        Avec `labels`, seuls les chunks portant au moins un de ces labels de taxonomie sont considérés.
+        Liste vide si la base a été écrite avant l'index lexical.
+        """
+        match = fts_query(query)
+        if not self.has_fts or not match or k <= 0:
+            return []
+        sql = ("SELECT t.id, -bm25(chunk_fts) AS score FROM chunk_fts "
+               "JOIN chunk_texts t ON t.rowid = chunk_fts.rowid "
+               "JOIN chunks c ON c.id = t.id "
+               "WHERE chunk_fts MATCH ? AND c.position IS NOT NULL ")
+        params: List[Any] = [match]
+        if labels and self.has_tags:
+            sql += f"AND t.id IN (SELECT id FROM chunk_tags WHERE label IN ({', '.join('?' * len(labels))})) "
+            params.extend(labels)
+        sql += "ORDER BY bm25(chunk_fts) LIMIT ?"
+        params.append(int(k))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [(doc_id, score) for doc_id, score in rows if doc_id not in self._deleted]
+
+    def positions_for_ids(self, ids: List[str]) -> List[Optional[int]]:
+        """
+        Position FAISS de chaque ID (None si le chunk n'est pas, ou pas encore, dans l'index enregistré).
+        """
+        ids = list(ids)
+        if not ids:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, position FROM chunks WHERE id IN ({', '.join('?' * len(ids))}) AND position IS NOT NULL",
+                ids
+            ).fetchall()
+        positions = dict(rows)
+        return [None if doc_id in self._deleted else positions.get(doc_id) for doc_id in ids]
+
+    def positions_for_labels(self, labels: List[str]) -> Optional[List[int]]:
+        """
+        Positions FAISS des chunks portant au moins un des labels (partition de recherche).
+        None si la base n'a pas encore de labels.
+        """
+        if not self.has_tags:
+            return None
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT c.position FROM chunk_tags t JOIN chunks c ON c.id = t.id "
+                f"WHERE t.label IN ({', '.join('?' * len(labels))}) AND c.position IS NOT NULL "
+                "ORDER BY c.position",
+                list(labels)
+            ).fetchall()
+        return [position for position, in rows]
+
+    def set_taxonomy(self, tags_by_id: Dict[str, List[str]]):
+        """
+        Ré-étiquette des chunks déjà enregistrés (taxonomie modifiée), sans toucher aux textes
+        ni aux vecteurs. Écrit immédiatement (docstore ouvert en écriture uniquement).
+        """
+        if self.read_only:
+            raise ValueError("Docstore ouvert en lecture seule")
+        with self._lock, self._conn as conn:
+            _replace_tags(conn, tags_by_id)
+            self._set_metadata_field(conn, TAGS_METADATA_KEY, tags_by_id)
+
+    def set_metadata_field(self, key: str, values_by_id: Dict[str, Any]):
+        """
+        Remplace une seule clé des métadonnées JSON des chunks (ex : mots-clés de boost recalculés),
+        sans réécrire le reste de la ligne. Écrit immédiatement (docstore ouvert en écriture uniquement).
+        """
+        if self.read_only:
+            raise ValueError("Docstore ouvert en lecture seule")
+        with self._lock, self._conn as conn:
+            self._set_metadata_field(conn, key, values_by_id)
+
+    def _set_metadata_field(self, conn: sqlite3.Connection, key: str, values_by_id: Dict[str, Any]):
+        conn.executemany(
+            "UPDATE chunks SET metadata = json_set(metadata, '$.' || ?, json(?)) WHERE id = ?",
+            [(key, json.dumps(value, ensure_ascii=False), doc_id) for doc_id, value in values_by_id.items()]
+        )
+        for doc_id, value in values_by_id.items():
+            if doc_id in self._added:
+                self._added[doc_id].metadata[key] = value
+
+    def select_metadata(self, limit: int = None, **filters: Any) -> List[Dict[str, Any]]: # type: ignore
+        """
+        Métadonnées des chunks filtrés sur les colonnes indexées, sans lire aucun texte.
+        Ex : select_metadata(source="propale_20250812_161748.pdf") ou select_metadata(page=0)
+        """
+        unknown = set(filters) - set(METADATA_COLUMNS)
+        if unknown:
+            raise ValueError(f"Colonnes non filtrables : {', '.join(sorted(unknown))}")
+        where = " AND ".join(f"{column} = ?" for column in filters) or "1 = 1"
+        sql = f"SELECT id, position, metadata FROM chunks WHERE {where} ORDER BY position"
+        params: List[Any] = list(filters.values())
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{"id": doc_id, "position": position, "metadata": json.loads(metadata)}
+                for doc_id, position, metadata in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SQLiteIndexToDocstoreId(Mapping):
+    """
+    Correspondance position FAISS → ID de document, résolue à la demande dans SQLite.
+    """
+
+    def __init__(self, docstore: SQLiteDocstore):
+        self._docstore = docstore
+        self._len = docstore.count()
+
+    def __getitem__(self, position: int) -> str:
+        doc_id = self._docstore.id_at(position) if 0 <= position < self._len else None
+        if doc_id is None:
+            raise KeyError(position)
+        return doc_id
+
+    def __iter__(self):
+        return iter(range(self._len))
+
+    def __len__(self) -> int:
+        return self._len
+
+
+def write_docstore(path: str, ids: List[str], docstore: Docstore):
+    """
+    Enregistre les documents de l'index, `ids` étant l'ID à chaque position FAISS.
+
+    - Docstore SQLite de ce même dossier : seuls les ajouts sont insérés (append-only) ;
+      les positions ne sont réécrites que si des chunks ont été retirés.
+    - Autre docstore (index reconstruit, ancien index.pkl) : écriture complète d'une nouvelle base.
+    """
+    os.makedirs(path, exist_ok=True)
+    db_path = docstore_path(path)
+
+    if isinstance(docstore, SQLiteDocstore) and docstore.db_path == db_path and not docstore.read_only:
+        position_of = {doc_id: position for position, doc_id in enumerate(ids)}
+        with docstore._lock, docstore._conn as conn:
+            if docstore._deleted:
+                removed = [(doc_id,) for doc_id in docstore._deleted]
+                conn.executemany("DELETE FROM chunks WHERE id = ?", removed)
+                conn.executemany("DELETE FROM chunk_texts WHERE id = ?", removed)
+                conn.executemany("DELETE FROM chunk_tags WHERE id = ?", removed)
+                # Les positions FAISS ont été décalées par la suppression
+                conn.executemany(
+                    "UPDATE chunks SET position = ? WHERE id = ? AND position IS NOT ?",
+                    [(position, doc_id, position) for doc_id, position in position_of.items()
+                     if doc_id not in docstore._added]
+                )
+            _insert(conn, [
+                (_row(doc_id, position_of[doc_id], doc), doc.page_content)
+                for doc_id, doc in docstore._added.items()
+            ])
+        docstore._added.clear()
+        docstore._deleted.clear()
+        return
+
+    tmp_path = db_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    _create_schema(conn)
+    rows = []
+    for position, doc_id in enumerate(ids):
+        doc = docstore.search(doc_id)
+        if not isinstance(doc, Document):
+            raise ValueError(f"Document introuvable pour l'ID {doc_id}")
+        rows.append((_row(doc_id, position, doc), doc.page_content))
+    with conn:
+        _insert(conn, rows)
+    conn.close()
+
+    # Les fichiers -wal/-shm de la base en service ne sont pas supprimés (des lecteurs peuvent
+    # l'avoir ouverte) : on vide seulement le WAL pour qu'aucune trame ne soit rejouée sur la
+    # nouvelle base, qui reste en journal classique jusqu'à la prochaine ouverture en écriture.
+    if os.path.exists(db_path):
+        live = sqlite3.connect(db_path)
+        try:
+            live.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            live.close()
+    os.replace(tmp_path, db_path)
+
@@ -0,0 +1,218 @@
+# modules/embedding_cache.py
+
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Sequence
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre process
+    fcntl = None
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+KEY_SIZE = 16  # octets par empreinte blake2b
+
+
+class EmbeddingCache:
+    """
+    Cache disque des embeddings, indexé par (nom du modèle, hash du texte du chunk).
+
+    Format (un dossier par modèle) :
+        - vectors.f32 : matrice float32 (une ligne par texte), lue en memory-map
+        - keys.bin    : empreintes blake2b de 16 octets, dans l'ordre des lignes
+        - meta.json   : nom du modèle et dimension des vecteurs
+        - .lock       : verrou (flock) des ajouts, partagé entre process (Streamlit, main.py)
+    Les écritures sont en ajout seul : un nouveau texte coûte une ligne en fin de fichier.
+    Avant chaque ajout, les lignes écrites entre-temps par un autre process sont relues.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str):
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.model_name = model_name
+        self.cache_dir = os.path.join(cache_dir, slug)
+        self.vectors_path = os.path.join(self.cache_dir, "vectors.f32")
+        self.keys_path = os.path.join(self.cache_dir, "keys.bin")
+        self.meta_path = os.path.join(self.cache_dir, "meta.json")
+        self.lock_path = os.path.join(self.cache_dir, ".lock")
+
+        self.dim: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._rows = {}
+        self._count = 0
+        self._matrix = None
+        self._lock = threading.Lock()
+        self._open()
+
+    @staticmethod
+    def text_key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_SIZE).digest()
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.lock_path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _open(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with self._lock, self._file_lock():
+            self._sync()
+            self._remap()
+
+    def _sync(self):
+        """
+        Relit les lignes ajoutées depuis la dernière lecture (par ce process ou un autre) et
+        répare une écriture interrompue. Appelé sous le verrou fichier.
+        """
+        if self.dim is None:
+            if not os.path.exists(self.meta_path):
+                return
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("model_name") != self.model_name:
+                print(f"⚠️ Cache d'embeddings d'un autre modèle ({meta.get('model_name')}), ignoré.")
+                return
+            self.dim = int(meta["dim"])
+
+        tail = b""
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "rb") as f:
+                f.seek(self._count * KEY_SIZE)
+                tail = f.read()
+        keys_size = self._count * KEY_SIZE + len(tail)
+        vectors_size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        count = min(keys_size // KEY_SIZE, vectors_size // (4 * self.dim))
+
+        # Écriture interrompue (clé ou vecteur partiel) : on tronque les deux fichiers à `count` lignes
+        if keys_size != count * KEY_SIZE or vectors_size != count * self.dim * 4:
+            with open(self.keys_path, "ab") as f:
+                f.truncate(count * KEY_SIZE)
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(count * self.dim * 4)
+
+        for i in range(self._count, count):
+            offset = (i - self._count) * KEY_SIZE
+            self._rows[tail[offset:offset + KEY_SIZE]] = i
+        self._count = count
+
+    def _remap(self):
+        if self._count:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self._count, self.dim))
+        else:
+            self._matrix = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        Retourne le vecteur en cache de chaque texte, ou None s'il est absent.
+        """
+        results: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for text in texts:
+                row = self._rows.get(self.text_key(text))
+                if row is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(np.array(self._matrix[row]))
+        return results
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """
+        Ajoute en fin de fichier les vecteurs des textes absents du cache.
+        """
+        if not texts:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock():
+            self._sync()
+            if self.dim is None:
+                self.dim = int(matrix.shape[1])
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model_name": self.model_name, "dim": self.dim}, f)
+
+            new_keys = []
+            new_rows = []
+            for text, vector in zip(texts, matrix):
+                key = self.text_key(text)
+                if key in self._rows:
+                    continue
+                self._rows[key] = self._count + len(new_keys)
+                new_keys.append(key)
+                new_rows.append(vector)
+            if not new_keys:
+                self._remap()
+                return
+
+            # Vecteurs d'abord, clés ensuite : une clé n'existe jamais sans son vecteur
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.asarray(new_rows, dtype=np.float32).tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+            self._count += len(new_keys)
+            self._remap()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "model_name": self.model_name,
+            "entries": self._count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+def cached_encode(cache: EmbeddingCache, texts: Sequence[str],
+                  encode_fn: Callable[[List[str]], Sequence[Sequence[float]]]) -> np.ndarray:
+    """
+    Encode `texts` en ne passant au modèle que les textes absents du cache (en un seul batch).
+    """
+    cached = cache.get_many(texts)
+    missing = [i for i, vector in enumerate(cached) if vector is None]
+    if missing:
+        # Doublons dans un même batch : un seul passage modèle par texte distinct
+        missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+        computed = np.asarray(encode_fn(missing_texts), dtype=np.float32)
+        cache.put_many(missing_texts, computed)
+        by_text = dict(zip(missing_texts, computed))
+        for i in missing:
+            cached[i] = by_text[texts[i]]
+    if not cached:
+        return np.zeros((0, cache.dim or 0), dtype=np.float32)
+    return np.vstack(cached).astype(np.float32)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Encodeur LangChain qui consulte le cache disque avant d'appeler le modèle sous-jacent.
+    """
+
+    def __init__(self, base: Embeddings, cache: EmbeddingCache):
+        self.base = base
+        self.cache = cache
+        self.model_name = cache.model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return cached_encode(self.cache, texts, self.base.embed_documents).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        # Les requêtes utilisateur ne sont pas mises en cache disque (textes uniques)
+        return self.base.embed_query(text)
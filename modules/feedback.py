@@ -3,6 +3,7 @@ from fpdf import FPDF
 import os
 import datetime
 from modules.vector_store import store_generated_proposal
+from modules.telemetry import feedback_total
 
 def handle_feedback(query: str, proposal_text: str):
     """
@@ -37,11 +38,13 @@ def handle_feedback(query: str, proposal_text: str):
             else:
                 print(f"⚠️ Fichier introuvable après création: {filepath}")
                 
+            feedback_total.inc(status="ok")
             return filepath
         else:
             raise Exception("store_generated_proposal a retourné None")
             
     except Exception as e:
+        feedback_total.inc(status="error")
         print(f"❌ Erreur dans handle_feedback: {e}")
         import traceback
         print("🔍 Stack trace complète:")
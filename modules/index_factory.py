@@ -0,0 +1,357 @@
+# modules/index_factory.py
+
+import math
+import time
+from typing import Any, Dict, List
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw")
+QUANTIZATIONS = ("none", "fp16", "sq8", "pq")
+
+DEFAULT_INDEX_PARAMS = {
+    "flat": {},
+    "ivf_flat": {"nlist": None, "nprobe": 8},  # nlist=None : choisi selon la taille du corpus
+    "hnsw": {"M": 32, "ef_construction": 80, "ef_search": 64},
+}
+
+# Stockage des vecteurs, commun à tous les types d'index
+DEFAULT_STORAGE_PARAMS = {
+    "quantization": "none",   # none (float32), fp16, sq8 (scalaire 8 bits) ou pq (produit)
+    "pq_m": 48,               # sous-quantificateurs PQ (doit diviser la dimension)
+    "pq_nbits": 8,            # bits par code PQ
+    "rescore": False,         # re-score exact (float32) des meilleurs candidats
+    "rescore_k_factor": 4,    # candidats re-scorés = k * rescore_k_factor
+}
+
+# Paramètres qui imposent une reconstruction (les autres s'appliquent à la recherche)
+STRUCTURAL_PARAMS = ("nlist", "M", "ef_construction", "quantization", "pq_m", "pq_nbits", "rescore")
+
+_SQ_TYPES = {"fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+
+
+def default_nlist(num_vectors: int) -> int:
+    """
+    Nombre de listes IVF : ~4·√n, borné pour garder au moins 39 vecteurs d'entraînement par liste.
+    """
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+
+def resolve_index_params(index_type: str, index_params: Dict[str, Any] = None) -> Dict[str, Any]: # type: ignore
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Type d'index inconnu : {index_type} (attendu : {', '.join(INDEX_TYPES)})")
+    params = dict(DEFAULT_STORAGE_PARAMS, **DEFAULT_INDEX_PARAMS[index_type])
+    params.update(index_params or {})
+    if params["quantization"] not in QUANTIZATIONS:
+        raise ValueError(f"Quantification inconnue : {params['quantization']} (attendu : {', '.join(QUANTIZATIONS)})")
+    return params
+
+
+def _pq_shape(dim: int, num_vectors: int, params: Dict[str, Any]) -> tuple:
+    pq_m = params["pq_m"]
+    if dim % pq_m:
+        raise ValueError(f"pq_m={pq_m} doit diviser la dimension des vecteurs ({dim})")
+    # Il faut au moins 2^nbits vecteurs pour entraîner chaque sous-quantificateur
+    pq_nbits = max(1, min(params["pq_nbits"], int(math.log2(max(num_vectors, 2)))))
+    if pq_nbits != params["pq_nbits"]:
+        print(f"⚠️ Corpus trop petit pour PQ {params['pq_nbits']} bits : {pq_nbits} bits utilisés.")
+    return pq_m, pq_nbits
+
+
+def make_faiss_index(vectors: np.ndarray, index_type: str = "flat", index_params: Dict[str, Any] = None) -> faiss.Index: # type: ignore
+    """
+    Construit, entraîne (si nécessaire) et remplit un index FAISS L2 du type demandé,
+    avec vecteurs float32, float16, SQ8 ou PQ et, en option, re-score exact des candidats.
+    """
+    params = resolve_index_params(index_type, index_params)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+    quantization = params["quantization"]
+    if quantization == "pq":
+        pq_m, pq_nbits = _pq_shape(dim, num_vectors, params)
+
+    if index_type == "flat":
+        if quantization == "none":
+            index = faiss.IndexFlatL2(dim)
+        elif quantization == "pq":
+            index = faiss.IndexPQ(dim, pq_m, pq_nbits, faiss.METRIC_L2)
+        else:
+            index = faiss.IndexScalarQuantizer(dim, _SQ_TYPES[quantization], faiss.METRIC_L2)
+    elif index_type == "ivf_flat":
+        nlist = params["nlist"] or default_nlist(num_vectors)
+        quantizer = faiss.IndexFlatL2(dim)
+        if quantization == "none":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_L2)
+        elif quantization == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, _SQ_TYPES[quantization], faiss.METRIC_L2)
+        index.nprobe = min(params["nprobe"], nlist)
+    else:
+        if quantization == "none":
+            index = faiss.IndexHNSWFlat(dim, params["M"])
+        elif quantization == "pq":
+            index = faiss.IndexHNSWPQ(dim, pq_m, params["M"], pq_nbits)
+        else:
+            index = faiss.IndexHNSWSQ(dim, _SQ_TYPES[quantization], params["M"])
+        index.hnsw.efConstruction = params["ef_construction"]
+        index.hnsw.efSearch = params["ef_search"]
+
+    if params["rescore"] and quantization != "none":
+        # Vecteurs float32 gardés à part : chargés en memory-map, seules les lignes
+        # des candidats à re-scorer sont lues
+        index = faiss.IndexRefineFlat(index)
+        index.k_factor = float(params["rescore_k_factor"])
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def _quantization_of(index: faiss.Index) -> Dict[str, Any]:
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return {"quantization": "pq", "pq_m": index.pq.M, "pq_nbits": index.pq.nbits}
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        for name, qtype in _SQ_TYPES.items():
+            if index.sq.qtype == qtype:
+                return {"quantization": name}
+    return {"quantization": "none"}
+
+
+def describe_index(index: faiss.Index) -> tuple:
+    """
+    Retrouve (type, paramètres) d'un index FAISS existant, pour le reconstruire à l'identique.
+    """
+    params: Dict[str, Any] = {"rescore": False}
+    if isinstance(index, faiss.IndexRefine):
+        params.update(rescore=True, rescore_k_factor=index.k_factor)
+        index = faiss.downcast_index(index.base_index)
+
+    if isinstance(index, faiss.IndexHNSW):
+        params.update(M=index.hnsw.nb_neighbors(1), ef_construction=index.hnsw.efConstruction,
+                      ef_search=index.hnsw.efSearch)
+        params.update(_quantization_of(faiss.downcast_index(index.storage)))
+        return "hnsw", params
+    if isinstance(index, faiss.IndexIVF):
+        params.update(nlist=index.nlist, nprobe=index.nprobe)
+        params.update(_quantization_of(index))
+        return "ivf_flat", params
+    params.update(_quantization_of(index))
+    return "flat", params
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """
+    Type (au sens de INDEX_TYPES) d'un index FAISS existant.
+    """
+    return describe_index(index)[0]
+
+
+def needs_rebuild(index: faiss.Index, index_type: str = None, index_params: Dict[str, Any] = None) -> bool: # type: ignore
+    """
+    Vrai si le type ou un paramètre structurel demandé diffère de l'index existant.
+    """
+    current_type, current_params = describe_index(index)
+    if index_type and index_type != current_type:
+        return True
+    return any(
+        value is not None and current_params.get(key, DEFAULT_STORAGE_PARAMS.get(key)) != value
+        for key, value in (index_params or {}).items()
+        if key in STRUCTURAL_PARAMS
+    )
+
+
+def supports_inplace_update(index: faiss.Index) -> bool:
+    """
+    Seuls les index « flat » renumérotent les positions après remove_ids, ce que suppose
+    le mapping position → ID de LangChain. Les autres types sont reconstruits.
+    """
+    return isinstance(index, getattr(faiss, "IndexFlatCodes", faiss.IndexFlat))
+
+
+def apply_search_params(index: faiss.Index, index_params: Dict[str, Any] = None): # type: ignore
+    """
+    Applique les paramètres de recherche (nprobe, ef_search) sans reconstruire l'index.
+    """
+    params = index_params or {}
+    if isinstance(index, faiss.IndexRefine):
+        if params.get("rescore_k_factor"):
+            index.k_factor = float(params["rescore_k_factor"])
+        index = faiss.downcast_index(index.base_index)
+    if isinstance(index, faiss.IndexIVF) and params.get("nprobe"):
+        index.nprobe = min(params["nprobe"], index.nlist)
+    if isinstance(index, faiss.IndexHNSW) and params.get("ef_search"):
+        index.hnsw.efSearch = params["ef_search"]
+
+
+def filtered_search_params(index: faiss.Index, positions: np.ndarray) -> tuple:
+    """
+    Paramètres de recherche limitant FAISS aux `positions` (pré-filtrage par IDSelector),
+    avec les nprobe / efSearch / k_factor de l'index. (None, None) si faiss ne les supporte pas (< 1.7.3)
+    ou si l'index refuse les sélecteurs (IndexPQ) : l'appelant filtre alors après coup.
+    Le sélecteur retourné doit rester référencé pendant la recherche.
+    """
+    if not hasattr(faiss, "SearchParameters"):
+        return None, None
+    base = faiss.downcast_index(index.base_index) if isinstance(index, faiss.IndexRefine) else index
+    if isinstance(base, faiss.IndexPQ):
+        # IndexPQ (flat + PQ) refuse tout IDSelector : filtrage après coup par l'appelant
+        return None, None
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(positions, dtype=np.int64))
+    if isinstance(base, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=base.nprobe)
+    elif isinstance(base, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    if isinstance(index, faiss.IndexRefine):
+        params = faiss.IndexRefineSearchParameters(k_factor=index.k_factor, base_index_params=params)
+    return params, selector
+
+
+def check_filtered_search(vectors: np.ndarray, k: int = 4, num_queries: int = 20,
+                          pq_m: int = None) -> List[Dict[str, Any]]: # type: ignore
+    """
+    Recherche pré-filtrée (une position sur trois) sur chaque combinaison type × stockage × re-score
+    que `make_faiss_index` sait construire : la recherche doit aboutir et ne retourner que des positions autorisées.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    positions = np.arange(0, len(vectors), 3)
+    allowed = set(positions.tolist())
+    queries = vectors[:num_queries]
+    results = []
+    for index_type in INDEX_TYPES:
+        for quantization in QUANTIZATIONS:
+            for rescore in ((False,) if quantization == "none" else (False, True)):
+                config = {"index_type": index_type, "quantization": quantization, "rescore": rescore}
+                index_params = {"quantization": quantization, "rescore": rescore}
+                if pq_m:
+                    index_params["pq_m"] = pq_m
+                try:
+                    index = make_faiss_index(vectors, index_type, index_params)
+                    params, selector = filtered_search_params(index, positions)
+                    if params is None:
+                        config.update(ok=True, prefiltered=False)
+                    else:
+                        _, found = index.search(queries, min(k, len(positions)), params=params)
+                        leaked = [int(i) for i in found.ravel() if i >= 0 and int(i) not in allowed]
+                        config.update(ok=not leaked, prefiltered=True)
+                        if leaked:
+                            config["error"] = f"{len(leaked)} positions hors filtre"
+                except (RuntimeError, ValueError) as e:
+                    config.update(ok=False, error=str(e).splitlines()[0])
+                results.append(config)
+    return results
+
+
+def _latencies_ms(index: faiss.Index, queries: np.ndarray, k: int) -> tuple:
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids[0])
+    return np.array(latencies), np.array(results)
+
+
+def benchmark_index(index: faiss.Index, vectors: np.ndarray, k: int = 4, num_queries: int = 100, seed: int = 0) -> Dict[str, Any]:
+    """
+    Mesure recall@k (par rapport à une recherche exacte) et latence p50 / p99 d'une requête,
+    en utilisant un échantillon des vecteurs du corpus comme requêtes.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if len(vectors) == 0:
+        return {"index_type": index_type_of(index), "ntotal": 0}
+
+    k = min(k, len(vectors))
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)
+    queries = vectors[sample]
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    exact_latencies, exact_ids = _latencies_ms(exact, queries, k)
+    ann_latencies, ann_ids = _latencies_ms(index, queries, k)
+
+    recall = np.mean([
+        len(set(expected) & set(found)) / k
+        for expected, found in zip(exact_ids, ann_ids)
+    ])
+
+    return {
+        "index_type": index_type_of(index),
+        "ntotal": int(index.ntotal),
+        "k": k,
+        "num_queries": len(queries),
+        "recall_at_k": round(float(recall), 4),
+        "p50_ms": round(float(np.percentile(ann_latencies, 50)), 4),
+        "p99_ms": round(float(np.percentile(ann_latencies, 99)), 4),
+        "exact_p50_ms": round(float(np.percentile(exact_latencies, 50)), 4),
+        "exact_p99_ms": round(float(np.percentile(exact_latencies, 99)), 4),
+    }
+
+
+def compare_index_types(vectors: np.ndarray, configs: List[Dict[str, Any]] = None, k: int = 4, # type: ignore
+                        num_queries: int = 100) -> List[Dict[str, Any]]:
+    """
+    Construit en mémoire chaque configuration candidate sur les vecteurs réels du corpus
+    et retourne les mesures de chacune, pour choisir le type d'index sur des chiffres.
+    """
+    if configs is None:
+        configs = [{"index_type": index_type} for index_type in INDEX_TYPES]
+
+    results = []
+    for config in configs:
+        index_type = config["index_type"]
+        params = resolve_index_params(index_type, config.get("index_params"))
+        start = time.perf_counter()
+        index = make_faiss_index(vectors, index_type, params)
+        build_time = time.perf_counter() - start
+        result = benchmark_index(index, vectors, k=k, num_queries=num_queries)
+        result["index_params"] = params
+        result["build_seconds"] = round(build_time, 3)
+        result.update(index_footprint(index))
+        results.append(result)
+    return results
+
+
+def index_footprint(index: faiss.Index) -> Dict[str, int]:
+    """
+    Taille sur disque de l'index et estimation (non mesurée) de la mémoire résidente une fois chargé
+    en memory-map : taille sérialisée, moins les vecteurs float32 de re-score qui ne sont lus
+    que pour les candidats.
+    """
+    disk_bytes = len(faiss.serialize_index(index))
+    estimated_ram_bytes = disk_bytes
+    if isinstance(index, faiss.IndexRefine):
+        estimated_ram_bytes -= index.ntotal * index.d * 4
+    return {"disk_bytes": disk_bytes, "estimated_ram_bytes": estimated_ram_bytes}
+
+
+def quantization_report(vectors: np.ndarray, index_type: str = "flat", k: int = 4,
+                        num_queries: int = 100) -> List[Dict[str, Any]]:
+    """
+    Compare chaque stockage (float16, SQ8, PQ, avec ou sans re-score) au float32 :
+    taille disque, RAM estimée, recall@k et latences, avec les ratios par rapport à la référence.
+    """
+    storages = [
+        {"quantization": "none"},
+        {"quantization": "fp16"},
+        {"quantization": "sq8"},
+        {"quantization": "sq8", "rescore": True},
+        {"quantization": "pq"},
+        {"quantization": "pq", "rescore": True},
+    ]
+    results = compare_index_types(
+        vectors, [{"index_type": index_type, "index_params": storage} for storage in storages],
+        k=k, num_queries=num_queries
+    )
+    baseline = results[0]
+    for result in results:
+        result["disk_ratio"] = round(result["disk_bytes"] / baseline["disk_bytes"], 4)
+        result["estimated_ram_ratio"] = round(result["estimated_ram_bytes"] / baseline["estimated_ram_bytes"], 4)
+        result["recall_delta"] = round(result["recall_at_k"] - baseline["recall_at_k"], 4)
+    return results
@@ -0,0 +1,122 @@
+# modules/keyword_boosts.py
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Tuple, Union
+
+from langchain.schema import Document
+
+from modules.keyword_matcher import KeywordAutomaton, normalize_text
+from modules.resources import resources
+
+BOOST_KEYWORDS_PATH = "config/boost_keywords.json"
+BOOST_METADATA_KEY = "boost_keywords"
+DEFAULT_BOOST_WEIGHT = 0.05
+DEFAULT_BOOST_KEYWORDS = [
+    ["objectif", "objectifs"], ["sécurité", "sécurités"],
+    ["gestion de crise", "gestion de crises"], ["exercice simulé", "exercices simulés"]
+]
+
+# Configuration lue, par chemin : (version du fichier, configuration)
+_config_cache: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+
+
+def _file_version(path: str) -> str:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return ""
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def load_boost_config(path: str = BOOST_KEYWORDS_PATH) -> Dict[str, Any]:
+    """
+    Configuration des boosts, relue seulement si le fichier a changé (date de modification + taille).
+    """
+    version = _file_version(path)
+    cached = _config_cache.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    if not version:
+        config = {"weight": DEFAULT_BOOST_WEIGHT, "keywords": DEFAULT_BOOST_KEYWORDS}
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        config = {"weight": raw.get("weight", DEFAULT_BOOST_WEIGHT), "keywords": raw.get("keywords", [])}
+    config["hash"] = keywords_hash(config["keywords"])
+    _config_cache[path] = (version, config)
+    return config
+
+
+def keyword_concepts(keywords: List[Union[str, List[str]]]) -> Dict[str, List[str]]:
+    """
+    Concepts de boost : une entrée est un mot-clé seul ou une liste de variantes (singulier, pluriel…)
+    d'un même concept, nommé par sa première variante.
+    """
+    concepts: Dict[str, List[str]] = {}
+    for entry in keywords:
+        variants = [entry] if isinstance(entry, str) else list(entry)
+        if variants:
+            concepts.setdefault(variants[0], []).extend(variants)
+    return concepts
+
+
+def keywords_hash(keywords: List[Union[str, List[str]]]) -> str:
+    """
+    Empreinte de la liste des concepts et de leurs variantes (le poids n'en fait pas partie :
+    le changer ne demande aucun recalcul à l'ingestion).
+    """
+    normalized = sorted(
+        sorted({normalize_text(variant).strip() for variant in variants})
+        for variants in keyword_concepts(keywords).values()
+    )
+    return hashlib.sha256(json.dumps(normalized).encode("utf-8")).hexdigest()[:16]
+
+
+class KeywordBooster:
+    """
+    Bonus de reranking : `weight` par concept de boost présent dans le chunk (une seule fois par concept,
+    quelle que soit la variante trouvée).
+    Les mots-clés sont cherchés une seule fois, à l'ingestion (automate d'Aho-Corasick, mots entiers),
+    et stockés dans metadata["boost_keywords"] avec l'empreinte de la liste : au reranking,
+    le bonus se lit dans les métadonnées sans parcourir le texte.
+    """
+
+    def __init__(self, keywords: List[Union[str, List[str]]], weight: float = DEFAULT_BOOST_WEIGHT):
+        self.weight = weight
+        self.keywords_hash = keywords_hash(keywords)
+        patterns: Dict[str, List[str]] = {}
+        for concept, variants in keyword_concepts(keywords).items():
+            for variant in variants:
+                patterns.setdefault(variant, []).append(concept)
+        self._automaton = KeywordAutomaton(patterns)
+
+    def matched(self, text: str) -> List[str]:
+        return sorted(self._automaton.find(text))
+
+    def annotate(self, documents: List[Document]) -> List[Document]:
+        for doc in documents:
+            doc.metadata[BOOST_METADATA_KEY] = {"hash": self.keywords_hash, "keywords": self.matched(doc.page_content)}
+        return documents
+
+    def boost(self, doc: Document) -> float:
+        stored = doc.metadata.get(BOOST_METADATA_KEY)
+        if isinstance(stored, dict) and stored.get("hash") == self.keywords_hash:
+            return self.weight * len(stored["keywords"])
+        # Chunk indexé avant la liste actuelle (ou hors index) : recherche à la volée
+        return self.weight * len(self.matched(doc.page_content))
+
+
+def get_keyword_booster(path: str = BOOST_KEYWORDS_PATH) -> KeywordBooster:
+    """
+    Booster partagé, reconstruit seulement si la configuration change (fichier relu seulement s'il a été modifié).
+    """
+    config = load_boost_config(path)
+    key = f"boosts:{path}"
+    booster = resources.get(key, lambda: KeywordBooster(config["keywords"], config["weight"]))
+    if (booster.keywords_hash, booster.weight) != (config["hash"], config["weight"]):
+        # Une seule instance par fichier : l'ancienne est remplacée, pas gardée en mémoire
+        booster = KeywordBooster(config["keywords"], config["weight"])
+        resources.set(key, booster)
+    return booster
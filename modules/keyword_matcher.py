@@ -0,0 +1,78 @@
+# modules/keyword_matcher.py
+
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """
+    Minuscules, accents retirés et apostrophes typographiques unifiées : « Sécurité » et « securite »
+    se comparent à l'identique.
+    """
+    text = unicodedata.normalize("NFKD", text.replace("’", "'").lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+class KeywordAutomaton:
+    """
+    Automate d'Aho-Corasick : trouve en une seule passe sur le texte toutes les occurrences
+    d'un ensemble de mots-clés, quel que soit leur nombre.
+    Chaque mot-clé porte une ou plusieurs valeurs (ex : les labels de taxonomie qu'il déclenche).
+    Seuls les mots entiers sont retenus (« port » ne correspond pas dans « rapport »).
+    """
+
+    def __init__(self, keywords: Dict[str, Iterable[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Tuple[str, ...]]]] = [[]]
+
+        for keyword, values in keywords.items():
+            pattern = normalize_text(keyword).strip()
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._out[state].append((len(pattern), tuple(values)))
+
+        # Liens d'échec en largeur : chaque état hérite des sorties de son suffixe le plus long
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def matches(self, text: str) -> Iterable[Tuple[int, int, Tuple[str, ...]]]:
+        """
+        Occurrences (début, fin, valeurs) des mots-clés dans `text`, en mots entiers.
+        """
+        text = normalize_text(text)
+        state = 0
+        for end, char in enumerate(text, start=1):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, values in self._out[state]:
+                start = end - length
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    yield start, end, values
+
+    def find(self, text: str) -> Set[str]:
+        """
+        Ensemble des valeurs déclenchées par au moins un mot-clé présent dans `text`.
+        """
+        found: Set[str] = set()
+        for _, _, values in self.matches(text):
+            found.update(values)
+        return found
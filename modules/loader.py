@@ -1,8 +1,11 @@
 # modules/loader.py
 from langchain_community.document_loaders import PyPDFLoader
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Dict, Any
 from langchain.schema import Document
+from modules.splitter import splitdocuments
 import os
+import time
 
 def load_pdf(path: str) -> List[Document]:
     """
@@ -16,4 +19,69 @@ def load_pdf(path: str) -> List[Document]:
     for doc in docs:
         doc.metadata["source"] = source_name # type: ignore
 
-    return docs
\ No newline at end of file
+    return docs
+
+
+def default_ingest_workers() -> int:
+    """
+    Nombre de workers d'extraction : variable SKILLIA_INGEST_WORKERS ou nombre de cœurs.
+    """
+    env_value = os.environ.get("SKILLIA_INGEST_WORKERS")
+    if env_value:
+        return max(1, int(env_value))
+    return os.cpu_count() or 1
+
+
+def _load_and_split(args: Tuple[str, int, int]) -> Tuple[List[Document], Dict[str, Any]]:
+    """
+    Worker : lecture + découpage d'un PDF, avec mesure du temps de parsing.
+    """
+    path, chunk_size, chunk_overlap = args
+    start = time.perf_counter()
+    pages = load_pdf(path)
+    parse_time = time.perf_counter() - start
+    chunks = splitdocuments(pages, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    timing = {
+        "file": path,
+        "pages": len(pages),
+        "chunks": len(chunks),
+        "parse_seconds": round(parse_time, 3),
+        "total_seconds": round(time.perf_counter() - start, 3),
+        "size_bytes": os.path.getsize(path)
+    }
+    return chunks, timing
+
+
+def load_and_split_pdfs(paths: List[str], max_workers: int = None, # type: ignore
+                        chunk_size: int = 1000, chunk_overlap: int = 150) -> Tuple[List[List[Document]], List[Dict[str, Any]]]:
+    """
+    Extrait et découpe plusieurs PDF en parallèle dans un pool de processus.
+
+    L'ordre des résultats suit celui de `paths` (indépendamment de l'ordre de fin des workers),
+    et le champ 'source' est fixé par `load_pdf`, ce qui rend l'ingestion déterministe.
+
+    Args:
+        paths: Chemins des PDF à traiter
+        max_workers: Nombre de processus (défaut : `default_ingest_workers()`)
+        chunk_size / chunk_overlap: Paramètres du découpage
+
+    Returns:
+        (chunks par fichier dans l'ordre de `paths`, temps de traitement par fichier)
+    """
+    if max_workers is None:
+        max_workers = default_ingest_workers()
+    max_workers = max(1, min(max_workers, len(paths)))
+    tasks = [(path, chunk_size, chunk_overlap) for path in paths]
+
+    if max_workers == 1:
+        # Pas de pool pour un seul fichier / un seul worker : évite le coût de démarrage des processus
+        results = [_load_and_split(task) for task in tasks]
+    else:
+        print(f"⚙️ Extraction parallèle de {len(paths)} PDF sur {max_workers} processus")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # map() restitue les résultats dans l'ordre de soumission
+            results = list(executor.map(_load_and_split, tasks))
+
+    chunks_per_file = [chunks for chunks, _ in results]
+    timings = [timing for _, timing in results]
+    return chunks_per_file, timings
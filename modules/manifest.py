@@ -0,0 +1,110 @@
+# modules/manifest.py
+
+import datetime
+import hashlib
+import json
+import os
+from typing import Dict, List, Any
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """
+    Hash SHA-256 du contenu d'un fichier (lecture par blocs).
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def relative_key(path: str, data_dir: str) -> str:
+    """
+    Clé stable d'un fichier dans le manifeste : chemin relatif au dossier de données.
+    """
+    return os.path.relpath(path, data_dir).replace(os.sep, "/")
+
+
+def make_chunk_ids(key: str, content_hash: str, num_chunks: int) -> List[str]:
+    """
+    IDs déterministes des chunks d'un fichier (même fichier + même contenu = mêmes IDs).
+    """
+    return [
+        hashlib.sha1(f"{key}:{content_hash}:{i}".encode("utf-8")).hexdigest()
+        for i in range(num_chunks)
+    ]
+
+
+def manifest_path(index_path: str) -> str:
+    return os.path.join(index_path, MANIFEST_FILENAME)
+
+
+def empty_manifest() -> Dict[str, Any]:
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+
+def load_manifest(index_path: str) -> Dict[str, Any]:
+    """
+    Charge le manifeste de l'index, ou un manifeste vide s'il n'existe pas / est illisible.
+    """
+    path = manifest_path(index_path)
+    if not os.path.exists(path):
+        return empty_manifest()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            print(f"⚠️ Version de manifeste inattendue ({manifest.get('version')}), reconstruction complète.")
+            return empty_manifest()
+        return manifest
+    except Exception as e:
+        print(f"⚠️ Manifeste illisible ({e}), reconstruction complète.")
+        return empty_manifest()
+
+
+def save_manifest(index_path: str, manifest: Dict[str, Any]):
+    """
+    Écrit le manifeste de façon atomique à côté de l'index FAISS.
+    """
+    os.makedirs(index_path, exist_ok=True)
+    path = manifest_path(index_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def record_file(manifest: Dict[str, Any], key: str, content_hash: str, chunk_ids: List[str]):
+    """
+    Enregistre (ou remplace) l'entrée d'un fichier dans le manifeste.
+    """
+    manifest["files"][key] = {
+        "hash": content_hash,
+        "chunk_ids": chunk_ids,
+        "indexed_at": datetime.datetime.now().isoformat()
+    }
+
+
+def diff_manifest(manifest: Dict[str, Any], current_hashes: Dict[str, str]) -> Dict[str, List[str]]:
+    """
+    Compare le manifeste avec l'état actuel du dossier.
+
+    Returns:
+        Dictionnaire avec les clés 'new', 'changed', 'unchanged' et 'deleted'
+    """
+    known = manifest.get("files", {})
+    diff = {"new": [], "changed": [], "unchanged": [], "deleted": []}
+
+    for key, content_hash in current_hashes.items():
+        if key not in known:
+            diff["new"].append(key)
+        elif known[key]["hash"] != content_hash:
+            diff["changed"].append(key)
+        else:
+            diff["unchanged"].append(key)
+
+    diff["deleted"] = sorted(key for key in known if key not in current_hashes)
+    return diff
@@ -5,10 +5,61 @@ import json
 import os
 from datetime import datetime
 import streamlit as st
-from typing import List, Tuple, Dict, Any
+from collections.abc import Mapping
+from concurrent.futures import Future
+from typing import List, Tuple, Dict, Any, Callable, Iterator, Optional
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from modules.resources import resources, get_shared_embedder, DEFAULT_EMBEDDING_MODEL
+from modules.query_cache import query_cache
+from modules.answer_cache import answer_cache
+from modules.score_cache import rerank_score_cache
+from modules.reranker import cascade_report
+from modules.metrics_writer import create_metrics_writer
+from modules.metrics_store import MetricsStore, METRICS_DB_PATH, LEGACY_METRICS_FILE
+from modules.timing import RequestTimings, STAGES, STAGE_LABELS, stage_field, stage_histograms
+
+# Entrées du calcul des scores, retirées de l'enregistrement par le thread d'écriture
+SCORING_KEY = "_scoring"
+SCORE_FIELDS = ("relevance_score", "quality_score")
+
+
+def _notify(on_scored: Optional[Callable[[Optional[float]], None]], seconds: Optional[float]):
+    if on_scored is None:
+        return
+    try:
+        on_scored(seconds)
+    except Exception as e:
+        print(f"⚠️ Erreur fin de requête (télémétrie) : {e}")
+
+
+class LoggedMetrics(Mapping):
+    """
+    Métriques d'une requête, telles que mises en file d'écriture. Lecture seule : l'enregistrement est
+    copié à l'envoi, les scores calculés par le thread d'écriture arrivent par `scores` (Future).
+    `status` : "pending" (scores en calcul), "scored" ou "dropped" (file pleine, rien d'enregistré).
+    """
+
+    def __init__(self, record: Dict[str, Any], scores: Future, dropped: bool = False):
+        self._record = dict(record)
+        self.scores = scores
+        self.dropped = dropped
+
+    @property
+    def status(self) -> str:
+        if self.dropped:
+            return "dropped"
+        return "scored" if self.scores.done() else "pending"
+
+    def __getitem__(self, key: str) -> Any:
+        if key in SCORE_FIELDS and self._record.get(key) is None and self.scores.done():
+            return (self.scores.result() or {}).get(key)
+        return self._record[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._record)
+
+    def __len__(self) -> int:
+        return len(self._record)
 
 class RAGMetrics:
     """
@@ -16,16 +67,106 @@ class RAGMetrics:
     """
     
     def __init__(self):
-        self.metrics_file = "metrics_data.json"
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')  # Modèle léger pour les embeddings
-        
-    def calculate_relevance_score(self, query: str, retrieved_chunks: List[Tuple[Any, float]]) -> float:
+        self.metrics_file = LEGACY_METRICS_FILE  # ancien format, repris à la première ouverture du store
+        self.store = MetricsStore(os.getenv("SKILLIA_METRICS_DB", METRICS_DB_PATH), legacy_file=self.metrics_file)
+        self.model_name = DEFAULT_EMBEDDING_MODEL  # même modèle que l'index : encodeur et cache d'embeddings partagés
+        self.writer = create_metrics_writer(self._write_records)
+
+    def _write_records(self, records: List[Dict[str, Any]]):
+        """
+        Thread d'écriture : calcule les scores en attente (encodage de la réponse, des chunks),
+        puis ajoute le lot à l'historique (agrégats mis à jour dans la même transaction).
+        """
+        for record in records:
+            scoring = record.pop(SCORING_KEY, None)
+            if scoring is not None:
+                self._score_record(record, **scoring)
+        self.store.append(records)
+
+    def _score_record(self, record: Dict[str, Any], future: Future, query: str, response: str, chunk_texts: List[str],
+                      query_vector: Optional[np.ndarray] = None, chunk_vectors: Optional[np.ndarray] = None,
+                      on_scored: Optional[Callable[[Optional[float]], None]] = None):
+        start = time.perf_counter()
+        try:
+            relevance, quality = self._score_texts(query, chunk_texts, response, query_vector, chunk_vectors)
+        except Exception as e:
+            print(f"Erreur calcul des scores: {e}")
+            relevance, quality = 0.0, 0.0
+        seconds = time.perf_counter() - start
+        record[stage_field("metrics")] = round(seconds, 4)
+        if on_scored is None:
+            stage_histograms.observe("metrics", seconds)
+        else:
+            _notify(on_scored, seconds)
+        if record["relevance_score"] is None:
+            record["relevance_score"] = round(relevance, 4)
+        if record["quality_score"] is None:
+            record["quality_score"] = round(quality, 4)
+        future.set_result({field: record[field] for field in SCORE_FIELDS})
+
+    @property
+    def embedder(self) -> Any:
+        # Encodeur partagé avec la recherche (chargé une seule fois par process, à la première utilisation)
+        return get_shared_embedder(self.model_name)
+
+    def _encode_chunks(self, chunk_texts: List[str]) -> np.ndarray:
+        """
+        Encode les chunks en réutilisant les vecteurs du cache d'ingestion quand ils existent.
+        """
+        return np.asarray(self.embedder.embed_documents(chunk_texts), dtype=np.float32)
+
+    def score(self, query: str, retrieved_chunks: List[Tuple[Any, float]], response: str,
+              query_vector: np.ndarray = None, chunk_vectors: np.ndarray = None) -> Tuple[float, float]: # type: ignore
+        """
+        Pertinence (query ↔ chunks) et qualité (query ↔ réponse) en une seule passe vectorisée.
+        `query_vector` / `chunk_vectors` : vecteurs déjà calculés par la recherche ; sinon la requête
+        est encodée ici et les chunks sont lus dans le cache d'embeddings. Chaque texte est encodé au plus une fois.
+
+        Returns:
+            (relevance_score, quality_score)
+        """
+        return self._score_texts(query, [doc.page_content for doc, _ in retrieved_chunks], response,
+                                 query_vector, chunk_vectors)
+
+    def _score_texts(self, query: str, chunk_texts: List[str], response: str,
+                     query_vector: np.ndarray = None, chunk_vectors: np.ndarray = None) -> Tuple[float, float]: # type: ignore
+        has_chunks = bool(chunk_texts)
+        has_response = bool(response and response.strip())
+        if not has_chunks and not has_response:
+            return 0.0, 0.0
+
+        if query_vector is None:
+            query_vector = self.embedder.base.embed_query(query)
+        rows = [np.asarray(query_vector, dtype=np.float32).reshape(1, -1)]
+        if has_chunks:
+            if chunk_vectors is None:
+                chunk_vectors = self._encode_chunks(chunk_texts)
+            rows.append(np.asarray(chunk_vectors, dtype=np.float32).reshape(len(chunk_texts), -1))
+        if has_response:
+            rows.append(np.asarray(self.embedder.base.embed_documents([response]), dtype=np.float32))
+
+        # Similarités cosinus de toutes les lignes avec la requête : un seul produit matriciel
+        matrix = np.vstack(rows)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+        similarities = matrix[1:] @ matrix[0]
+
+        relevance = float(np.mean(similarities[:len(chunk_texts)])) if has_chunks else 0.0
+        quality = 0.0
+        if has_response:
+            length_bonus = min(len(response) / 1000, 0.2)  # Bonus pour la longueur (max 20%)
+            quality = float(min(similarities[-1] + length_bonus, 1.0))
+        return relevance, quality
+
+    def calculate_relevance_score(self, query: str, retrieved_chunks: List[Tuple[Any, float]],
+                                  query_vector: np.ndarray = None) -> float: # type: ignore
         """
         Calcule un score de pertinence moyen entre la query et les chunks récupérés
         
         Args:
             query: La requête utilisateur
             retrieved_chunks: Liste des (document, score) récupérés
+            query_vector: Vecteur de la requête déjà calculé (optionnel)
             
         Returns:
             Score de pertinence moyen (0-1)
@@ -33,31 +174,19 @@ class RAGMetrics:
         try:
             if not retrieved_chunks:
                 return 0.0
-            
-            # Encoder la query
-            query_embedding = self.model.encode([query])
-            
-            # Encoder les chunks
-            chunk_texts = [doc.page_content for doc, _ in retrieved_chunks]
-            chunk_embeddings = self.model.encode(chunk_texts)
-            
-            # Calculer la similarité cosinus
-            similarities = cosine_similarity(query_embedding, chunk_embeddings)[0]
-            
-            # Retourner la moyenne
-            return float(np.mean(similarities))
-            
+            return self.score(query, retrieved_chunks, "", query_vector=query_vector)[0]
         except Exception as e:
             print(f"Erreur calcul relevance_score: {e}")
             return 0.0
     
-    def calculate_response_quality(self, query: str, response: str) -> float:
+    def calculate_response_quality(self, query: str, response: str, query_vector: np.ndarray = None) -> float: # type: ignore
         """
         Calcule la qualité de la réponse basée sur la cohérence sémantique avec la query
         
         Args:
             query: La requête utilisateur
             response: La réponse générée
+            query_vector: Vecteur de la requête déjà calculé (optionnel)
             
         Returns:
             Score de qualité (0-1)
@@ -65,25 +194,17 @@ class RAGMetrics:
         try:
             if not response.strip():
                 return 0.0
-            
-            # Encoder query et réponse
-            embeddings = self.model.encode([query, response])
-            
-            # Calculer similarité
-            similarity = cosine_similarity([embeddings[0]], [embeddings[1]])[0][0]
-            
-            # Bonus pour la longueur (réponse substantielle)
-            length_bonus = min(len(response) / 1000, 0.2)  # Max 20% bonus
-            
-            return float(min(similarity + length_bonus, 1.0))
-            
+            return self.score(query, [], response, query_vector=query_vector)[1]
         except Exception as e:
             print(f"Erreur calcul response_quality: {e}")
             return 0.0
     
     def log_metrics(self, query: str, response: str, chunks: List[Tuple[Any, float]], 
                    processing_time: float, relevance_score: float = None, 
-                   quality_score: float = None) -> Dict[str, Any]:
+                   quality_score: float = None, time_to_first_token: float = None,
+                   extra: Dict[str, Any] = None, query_vector: np.ndarray = None,
+                   timings: RequestTimings = None, chunk_vectors: np.ndarray = None, # type: ignore
+                   on_scored: Callable[[Optional[float]], None] = None) -> LoggedMetrics: # type: ignore
         """
         Enregistre les métriques d'une requête
         
@@ -92,110 +213,101 @@ class RAGMetrics:
             response: La réponse générée
             chunks: Les chunks récupérés
             processing_time: Temps de traitement en secondes
-            relevance_score: Score de pertinence (calculé si non fourni)
-            quality_score: Score de qualité (calculé si non fourni)
+            relevance_score: Score de pertinence (calculé en arrière-plan si non fourni)
+            quality_score: Score de qualité (calculé en arrière-plan si non fourni)
+            time_to_first_token: Délai avant le premier token en génération streaming (secondes)
+            extra: Champs additionnels enregistrés tels quels (ex : tokens du contexte)
+            query_vector: Vecteur de la requête calculé par la recherche (évite de la ré-encoder)
+            timings: Durées par étape de la requête (le calcul des scores est mesuré à part, étape "metrics")
+            chunk_vectors: Vecteurs des chunks lus dans l'index FAISS (évite de les ré-encoder)
+            on_scored: Appelé une fois les scores calculés, avec la durée du calcul (None si rien n'est
+                calculé) : fin de la requête pour la télémétrie, étape "metrics" comprise
             
         Returns:
-            Dictionnaire contenant toutes les métriques
+            Métriques en lecture seule (`LoggedMetrics`). Les scores non fournis valent None jusqu'à
+            leur calcul par le thread d'écriture (`status` : "pending" puis "scored", "dropped" si la file était pleine).
         """
         
-        # Calculer les scores si non fournis
-        if relevance_score is None:
-            relevance_score = self.calculate_relevance_score(query, chunks)
-        
-        if quality_score is None:
-            quality_score = self.calculate_response_quality(query, response)
-        
         # Préparer les données
         metrics_data = {
             "timestamp": datetime.now().isoformat(),
-            "query": query[:100] + "..." if len(query) > 100 else query,  # Tronquer pour l'espace
+            "query": query,  # Requête complète : rejouée telle quelle par le benchmark de recherche
             "response_length": len(response),
             "num_chunks_retrieved": len(chunks),
             "processing_time_seconds": round(processing_time, 3),
-            "relevance_score": round(relevance_score, 4),
-            "quality_score": round(quality_score, 4),
+            "relevance_score": round(relevance_score, 4) if relevance_score is not None else None,
+            "quality_score": round(quality_score, 4) if quality_score is not None else None,
             "chunk_scores": [round(score, 4) for _, score in chunks[:5]]  # Top 5 seulement
         }
+        if time_to_first_token is not None:
+            metrics_data["time_to_first_token_seconds"] = round(time_to_first_token, 3)
+        if extra:
+            metrics_data.update(extra)
+        if timings is not None:
+            metrics_data.update(timings.fields())
+        snapshot = dict(metrics_data)
+        scores: Future = Future()
+        if relevance_score is None or quality_score is None:
+            # Scores (encodage de la réponse et des chunks) calculés par le thread d'écriture :
+            # seuls les textes et le vecteur de la requête sont mis en file
+            metrics_data[SCORING_KEY] = {
+                "future": scores, "query": query, "response": response,
+                "chunk_texts": [doc.page_content for doc, _ in chunks], "query_vector": query_vector,
+                "chunk_vectors": chunk_vectors if chunk_vectors is not None and len(chunk_vectors) == len(chunks) else None,
+                "on_scored": on_scored
+            }
+        else:
+            scores.set_result({field: metrics_data[field] for field in SCORE_FIELDS})
+            _notify(on_scored, None)
         
-        # Sauvegarder dans le fichier
-        try:
-            # Charger les données existantes
-            if os.path.exists(self.metrics_file):
-                with open(self.metrics_file, 'r', encoding='utf-8') as f:
-                    all_metrics = json.load(f)
-            else:
-                all_metrics = []
-            
-            # Ajouter les nouvelles métriques
-            all_metrics.append(metrics_data)
-            
-            # Garder seulement les 100 dernières entrées pour éviter un fichier trop gros
-            if len(all_metrics) > 100:
-                all_metrics = all_metrics[-100:]
-            
-            # Sauvegarder
-            with open(self.metrics_file, 'w', encoding='utf-8') as f:
-                json.dump(all_metrics, f, ensure_ascii=False, indent=2)
-                
-        except Exception as e:
-            print(f"Erreur sauvegarde métriques: {e}")
+        # Écriture en arrière-plan (par lots) : la requête n'attend ni les scores ni l'I/O
+        submitted = self.writer.submit(metrics_data)
+        if not submitted:
+            print("⚠️ File des métriques pleine : enregistrement abandonné.")
+            if not scores.done():
+                scores.set_result(None)
+                _notify(on_scored, None)
         
-        return metrics_data
+        return LoggedMetrics(snapshot, scores, dropped=not submitted)
     
     def get_dashboard_stats(self) -> Dict[str, Any]:
         """
-        Récupère les statistiques pour le dashboard
+        Récupère les statistiques pour le dashboard (lues dans les agrégats, coût constant)
         
         Returns:
             Dictionnaire avec les stats globales
         """
+        empty = {
+            "total_queries": 0,
+            "avg_relevance": 0.0,
+            "avg_quality": 0.0,
+            "avg_processing_time": 0.0,
+            "avg_time_to_first_token": 0.0,
+            "processing_time_percentiles": {},
+            "stage_percentiles": {},
+            "recent_queries": []
+        }
         try:
-            if not os.path.exists(self.metrics_file):
-                return {
-                    "total_queries": 0,
-                    "avg_relevance": 0.0,
-                    "avg_quality": 0.0,
-                    "avg_processing_time": 0.0,
-                    "recent_queries": []
-                }
-            
-            with open(self.metrics_file, 'r', encoding='utf-8') as f:
-                all_metrics = json.load(f)
-            
-            if not all_metrics:
-                return {
-                    "total_queries": 0,
-                    "avg_relevance": 0.0,
-                    "avg_quality": 0.0,
-                    "avg_processing_time": 0.0,
-                    "recent_queries": []
-                }
-            
-            # Calculer les moyennes
-            relevance_scores = [m["relevance_score"] for m in all_metrics]
-            quality_scores = [m["quality_score"] for m in all_metrics]
-            processing_times = [m["processing_time_seconds"] for m in all_metrics]
+            summary = self.store.summary()
+            if not summary:
+                return empty
             
-            stats = {
-                "total_queries": len(all_metrics),
-                "avg_relevance": round(np.mean(relevance_scores), 3),
-                "avg_quality": round(np.mean(quality_scores), 3),
-                "avg_processing_time": round(np.mean(processing_times), 3),
-                "recent_queries": all_metrics[-5:]  # 5 dernières queries
+            none = {"count": 0, "mean": 0.0}
+            processing = summary.get("processing_time_seconds", none)
+            return {
+                "total_queries": processing["count"],
+                "avg_relevance": round(summary.get("relevance_score", none)["mean"], 3),
+                "avg_quality": round(summary.get("quality_score", none)["mean"], 3),
+                "avg_processing_time": round(processing["mean"], 3),
+                "avg_time_to_first_token": round(summary.get("time_to_first_token_seconds", none)["mean"], 3),
+                "processing_time_percentiles": {key: value for key, value in processing.items() if key.startswith("p")},
+                "stage_percentiles": {stage: summary[stage_field(stage)] for stage in STAGES if stage_field(stage) in summary},
+                "recent_queries": self.store.recent(5)  # 5 dernières queries
             }
             
-            return stats
-            
         except Exception as e:
             print(f"Erreur récupération stats: {e}")
-            return {
-                "total_queries": 0,
-                "avg_relevance": 0.0,
-                "avg_quality": 0.0,
-                "avg_processing_time": 0.0,
-                "recent_queries": []
-            }
+            return empty
 
 # Instance globale
 rag_metrics = RAGMetrics()
@@ -204,7 +316,7 @@ def display_metrics_dashboard():
     stats = rag_metrics.get_dashboard_stats()
 
     with st.expander("📊 Métriques de performance du RAG – Voir les statistiques"):
-        col1, col2, col3, col4 = st.columns(4)
+        col1, col2, col3, col4, col5 = st.columns(5)
 
         with col1:
             st.metric(
@@ -229,3 +341,125 @@ def display_metrics_dashboard():
                 label="⚡ Temps de réponse moyen",
                 value=f"{stats['avg_processing_time']:.2f} s"
             )
+
+        with col5:
+            st.metric(
+                label="⏳ Premier token (moyenne)",
+                value=f"{stats['avg_time_to_first_token']:.2f} s"
+            )
+
+        percentiles = stats["processing_time_percentiles"]
+        if percentiles:
+            st.caption(f"Temps de réponse sur tout l'historique : p50 {percentiles['p50']:.2f} s • "
+                       f"p95 {percentiles['p95']:.2f} s • p99 {percentiles['p99']:.2f} s")
+
+        # Agrégats par période (pré-calculés à l'écriture)
+        granularity = st.radio("Période", ["hour", "minute"], horizontal=True,
+                               format_func=lambda value: "Par heure" if value == "hour" else "Par minute")
+        periods = rag_metrics.store.rollups(granularity, limit=24 if granularity == "hour" else 60)
+        if periods:
+            none = {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+            st.table([
+                {
+                    "Début": period["start"][:16].replace("T", " "),
+                    "Requêtes": period.get("processing_time_seconds", none)["count"],
+                    "Latence moy. (s)": period.get("processing_time_seconds", none)["mean"],
+                    "p50 (s)": period.get("processing_time_seconds", none)["p50"],
+                    "p95 (s)": period.get("processing_time_seconds", none)["p95"],
+                    "p99 (s)": period.get("processing_time_seconds", none)["p99"],
+                    "Pertinence moy.": period.get("relevance_score", none)["mean"],
+                    "Qualité moy.": period.get("quality_score", none)["mean"]
+                }
+                for period in periods
+            ])
+
+        # Durées par étape : historique (agrégats du store) et process courant (histogrammes en mémoire)
+        stage_stats = stats["stage_percentiles"]
+        if stage_stats:
+            process_stats = stage_histograms.stats()
+            st.markdown("**⏱️ Temps par étape**")
+            st.table([
+                {
+                    "Étape": STAGE_LABELS[stage],
+                    "Mesures": stat["count"],
+                    "Moyenne (s)": stat["mean"],
+                    "p50 (s)": stat["p50"],
+                    "p95 (s)": stat["p95"],
+                    "p99 (s)": stat["p99"],
+                    "p95 process (s)": process_stats[stage]["p95"] if stage in process_stats else "—"
+                }
+                for stage, stat in stage_stats.items()
+            ])
+
+        # Ressources résidentes : un load_count > 1 signale un rechargement sur le chemin chaud
+        resource_stats = resources.stats()
+        if resource_stats:
+            st.markdown("**📦 Ressources partagées**")
+            st.table([
+                {
+                    "Ressource": key,
+                    "Chargements": stat["load_count"],
+                    "Hits": stat["hits"],
+                    "Dernier chargement (s)": stat["last_load_time_seconds"],
+                    "Résidente": "✅" if stat["resident"] else "—"
+                }
+                for key, stat in resource_stats.items()
+            ])
+
+        cache_stats = query_cache.stats()
+        st.markdown("**♻️ Cache de requêtes**")
+        st.table([{
+            "Entrées": f"{cache_stats['entries']} / {cache_stats['maxsize']}",
+            "Hits": cache_stats["hits"],
+            "Misses": cache_stats["misses"],
+            "Taux de hit": f"{cache_stats['hit_rate']:.1%}",
+            "Vecteurs réutilisés": cache_stats["vector_hits"],
+            "Évictions": cache_stats["evictions"]
+        }])
+
+        score_stats = rerank_score_cache.stats()
+        st.markdown("**🎯 Cache des scores du reranker**")
+        st.table([{
+            "Paires en cache": f"{score_stats['entries']} / {score_stats['maxsize']}",
+            "Hits": score_stats["hits"],
+            "Paires scorées": score_stats["misses"],
+            "Taux de hit": f"{score_stats['hit_rate']:.1%}",
+            "Évictions": score_stats["evictions"]
+        }])
+
+        writer_stats = rag_metrics.writer.stats()
+        st.markdown("**🗄️ Écriture des métriques (arrière-plan)**")
+        st.table([{
+            "En attente": f"{writer_stats['backlog']} / {writer_stats['maxsize']}",
+            "Pic d'attente": writer_stats["max_backlog"],
+            "Écrites": writer_stats["written"],
+            "Abandonnées (file pleine)": writer_stats["dropped"],
+            "Lots écrits": writer_stats["flushes"],
+            "Erreurs": writer_stats["errors"],
+            "Dernier lot (s)": writer_stats["last_flush_seconds"]
+        }])
+
+        cascade = cascade_report()
+        if cascade["queries"]:
+            st.markdown("**✂️ Reranking en cascade**")
+            st.table([{
+                "Requêtes": cascade["queries"],
+                "Paires candidates": cascade["candidates"],
+                "Paires évaluées": cascade["evaluated"],
+                "Évaluations évitées": f"{cascade['saved']} ({cascade['saved_ratio']:.1%})",
+                "Écartées par FAISS": cascade["skipped_by_faiss"],
+                "Arrêts anticipés": cascade["early_stops"]
+            }])
+
+        answer_stats = answer_cache.stats()
+        st.markdown("**🧠 Cache sémantique des propositions**")
+        st.table([{
+            "Entrées": f"{answer_stats['entries']} / {answer_stats['maxsize']}",
+            "Seuil cosinus": answer_stats["threshold"],
+            "Hits": answer_stats["hits"],
+            "Taux de hit": f"{answer_stats['hit_rate']:.1%}",
+            "Similarité moyenne (hits)": answer_stats["avg_hit_similarity"],
+            "Contexte différent": answer_stats["context_mismatches"],
+            "Ignoré (bypass)": answer_stats["bypassed"],
+            "Expirées": answer_stats["expired"]
+        }])
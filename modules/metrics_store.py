@@ -0,0 +1,235 @@
+# modules/metrics_store.py
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+METRICS_DB_PATH = "metrics_data.sqlite"
+LEGACY_METRICS_FILE = "metrics_data.json"
+
+GRANULARITIES = {"minute": 60, "hour": 3600}
+TOTAL_GRANULARITY = "all"
+# Durée de conservation des agrégats par granularité (les agrégats horaires sont gardés)
+ROLLUP_RETENTION_SECONDS = {"minute": 48 * 3600}
+
+# Champs agrégés : latences (secondes) et scores
+ROLLUP_FIELDS = ("processing_time_seconds", "time_to_first_token_seconds", "relevance_score", "quality_score")
+PERCENTILES = (50, 95, 99)
+
+# Histogrammes à bornes fixes : les percentiles se calculent sans relire les enregistrements
+LATENCY_EDGES = np.concatenate([[0.0], np.geomspace(0.001, 1000.0, 121)])  # ~12 % de résolution
+SCORE_EDGES = np.linspace(-1.0, 1.2, 441)                                    # pas de 0.005
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    query TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_metrics_ts ON metrics(ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    granularity TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    total REAL NOT NULL,
+    histogram TEXT NOT NULL,
+    PRIMARY KEY (granularity, bucket, field)
+) WITHOUT ROWID;
+"""
+
+
+def histogram_edges(field: str) -> np.ndarray:
+    return LATENCY_EDGES if field.endswith("_seconds") else SCORE_EDGES
+
+
+def histogram_percentile(counts: List[int], edges: np.ndarray, q: float) -> float:
+    """
+    Percentile `q` d'un histogramme (interpolation linéaire dans la classe).
+    """
+    counts_array = np.asarray(counts, dtype=np.float64)
+    total = counts_array.sum()
+    if total == 0:
+        return 0.0
+    rank = q / 100 * total
+    cumulative = np.cumsum(counts_array)
+    i = int(np.searchsorted(cumulative, rank, side="left"))
+    i = min(i, len(counts_array) - 1)
+    before = cumulative[i - 1] if i else 0.0
+    fraction = (rank - before) / counts_array[i] if counts_array[i] else 0.0
+    return float(edges[i] + fraction * (edges[i + 1] - edges[i]))
+
+
+def _timestamp(record: Dict[str, Any]) -> float:
+    try:
+        return datetime.fromisoformat(record["timestamp"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return datetime.now().timestamp()
+
+
+class MetricsStore:
+    """
+    Historique des métriques en ajout seul (SQLite), sans limite de taille, avec des agrégats
+    par minute, par heure et global (nombre, somme, histogramme par champ) mis à jour à chaque ajout.
+    Le tableau de bord lit les agrégats : son coût ne dépend pas de la taille de l'historique.
+    """
+
+    def __init__(self, path: str = METRICS_DB_PATH, legacy_file: str = LEGACY_METRICS_FILE):
+        self.path = path
+        self.legacy_file = legacy_file
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            self._import_legacy()
+        return self._conn
+
+    def _import_legacy(self):
+        # Première ouverture : reprise des 100 dernières entrées de l'ancien fichier JSON
+        if not self.legacy_file or not os.path.exists(self.legacy_file):
+            return
+        if self._conn.execute("SELECT 1 FROM metrics LIMIT 1").fetchone(): # type: ignore
+            return
+        try:
+            with open(self.legacy_file, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            return
+        if records:
+            self._append(records)
+            print(f"🗄️ {len(records)} entrées reprises depuis {self.legacy_file}.")
+
+    def append(self, records: Iterable[Dict[str, Any]]):
+        """
+        Ajoute des enregistrements et met à jour leurs agrégats, dans une seule transaction.
+        """
+        records = list(records)
+        if not records:
+            return
+        with self._lock:
+            self._connection()
+            self._append(records)
+
+    def _append(self, records: List[Dict[str, Any]]):
+        conn = self._conn
+        updates: Dict[tuple, Dict[str, Any]] = {}
+        rows = []
+        latest = 0.0
+        for record in records:
+            ts = _timestamp(record)
+            latest = max(latest, ts)
+            rows.append((ts, record.get("query"), json.dumps(record, ensure_ascii=False)))
+            buckets = [(name, int(ts // size) * size) for name, size in GRANULARITIES.items()]
+            buckets.append((TOTAL_GRANULARITY, 0))
+            for field, value in record.items():
+                if not _is_rollup_field(field) or not isinstance(value, (int, float)):
+                    continue
+                edges = histogram_edges(field)
+                position = int(np.clip(np.searchsorted(edges, value, side="right") - 1, 0, len(edges) - 2))
+                for granularity, bucket in buckets:
+                    update = updates.setdefault((granularity, bucket, field), {"count": 0, "total": 0.0, "bins": {}})
+                    update["count"] += 1
+                    update["total"] += float(value)
+                    update["bins"][position] = update["bins"].get(position, 0) + 1
+
+        with conn: # type: ignore
+            conn.executemany("INSERT INTO metrics (ts, query, record) VALUES (?, ?, ?)", rows) # type: ignore
+            for (granularity, bucket, field), update in updates.items():
+                row = conn.execute( # type: ignore
+                    "SELECT count, total, histogram FROM rollups WHERE granularity = ? AND bucket = ? AND field = ?",
+                    (granularity, bucket, field)
+                ).fetchone()
+                histogram = json.loads(row[2]) if row else [0] * (len(histogram_edges(field)) - 1)
+                for position, count in update["bins"].items():
+                    histogram[position] += count
+                conn.execute( # type: ignore
+                    "INSERT OR REPLACE INTO rollups (granularity, bucket, field, count, total, histogram) VALUES (?, ?, ?, ?, ?, ?)",
+                    (granularity, bucket, field, (row[0] if row else 0) + update["count"],
+                     (row[1] if row else 0.0) + update["total"], json.dumps(histogram))
+                )
+            for granularity, retention in ROLLUP_RETENTION_SECONDS.items():
+                conn.execute( # type: ignore
+                    "DELETE FROM rollups WHERE granularity = ? AND bucket < ?", (granularity, latest - retention)
+                )
+
+    def _field_stats(self, field: str, count: int, total: float, histogram: str) -> Dict[str, float]:
+        counts = json.loads(histogram)
+        stats = {"count": count, "mean": round(total / count, 4) if count else 0.0}
+        for q in PERCENTILES:
+            stats[f"p{q}"] = round(histogram_percentile(counts, histogram_edges(field), q), 4)
+        return stats
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Agrégats sur tout l'historique, par champ : count, mean, p50, p95, p99.
+        """
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT field, count, total, histogram FROM rollups WHERE granularity = ?", (TOTAL_GRANULARITY,)
+            ).fetchall()
+        return {field: self._field_stats(field, count, total, histogram) for field, count, total, histogram in rows}
+
+    def rollups(self, granularity: str = "hour", limit: int = 24) -> List[Dict[str, Any]]:
+        """
+        Les `limit` dernières périodes (minute ou heure), de la plus récente à la plus ancienne.
+        Les minutes ne sont conservées que sur ROLLUP_RETENTION_SECONDS.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularité inconnue : {granularity} (attendu : {', '.join(GRANULARITIES)})")
+        with self._lock:
+            conn = self._connection()
+            buckets = [row[0] for row in conn.execute(
+                "SELECT DISTINCT bucket FROM rollups WHERE granularity = ? ORDER BY bucket DESC LIMIT ?",
+                (granularity, limit)
+            )]
+            rows = conn.execute(
+                f"SELECT bucket, field, count, total, histogram FROM rollups WHERE granularity = ? "
+                f"AND bucket IN ({','.join('?' * len(buckets))})", (granularity, *buckets)
+            ).fetchall() if buckets else []
+        periods: Dict[int, Dict[str, Any]] = {bucket: {"bucket": bucket, "start": datetime.fromtimestamp(bucket).isoformat()}
+                                              for bucket in buckets}
+        for bucket, field, count, total, histogram in rows:
+            periods[bucket][field] = self._field_stats(field, count, total, histogram)
+        return [periods[bucket] for bucket in buckets]
+
+    def recent(self, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Les `limit` derniers enregistrements, du plus ancien au plus récent.
+        """
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT record FROM metrics ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def recent_queries(self, limit: int = 50) -> List[str]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT query FROM metrics WHERE query IS NOT NULL AND query != '' GROUP BY query "
+                "ORDER BY MAX(id) DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT count FROM rollups WHERE granularity = ? AND field = 'processing_time_seconds'",
+                (TOTAL_GRANULARITY,)
+            ).fetchone()
+        return int(row[0]) if row else 0
+
+
+def _is_rollup_field(field: str) -> bool:
+    # Durées par étape du pipeline (stage_<étape>_seconds, cf. modules/timing.py)
+    return field in ROLLUP_FIELDS or (field.startswith("stage_") and field.endswith("_seconds"))
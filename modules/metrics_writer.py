@@ -0,0 +1,125 @@
+# modules/metrics_writer.py
+
+import atexit
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_FLUSH_INTERVAL = 2.0  # secondes
+
+
+class MetricsWriter:
+    """
+    Écriture des métriques hors du chemin de la requête : les enregistrements passent par une file
+    bornée, un thread de fond les écrit par lots (`batch_size` au plus, toutes les `flush_interval` secondes).
+    File pleine : l'enregistrement est abandonné et compté (`dropped`), la requête n'attend jamais.
+    """
+
+    def __init__(self, write_batch: Callable[[List[Dict[str, Any]]], None], maxsize: int = DEFAULT_QUEUE_SIZE,
+                 batch_size: int = DEFAULT_BATCH_SIZE, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.write_batch = write_batch
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.errors = 0
+        self.max_backlog = 0
+        self.last_flush_seconds = 0.0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """
+        Met l'enregistrement en file (sans attendre). False si la file est pleine (enregistrement abandonné).
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._counters_lock:
+                self.dropped += 1
+            return False
+        with self._counters_lock:
+            self.submitted += 1
+            self.max_backlog = max(self.max_backlog, self._queue.qsize())
+        return True
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        batch = [self._queue.get()]  # bloque jusqu'au prochain enregistrement
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            start = time.perf_counter()
+            try:
+                self.write_batch(batch)
+                self.written += len(batch)
+            except Exception as e:
+                self.errors += 1
+                print(f"Erreur sauvegarde métriques: {e}")
+            finally:
+                self.flushes += 1
+                self.last_flush_seconds = round(time.perf_counter() - start, 4)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """
+        Attend l'écriture de tous les enregistrements en file (fin de process, tests).
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backlog": self._queue.qsize(),
+            "maxsize": self.maxsize,
+            "max_backlog": self.max_backlog,
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "last_flush_seconds": self.last_flush_seconds
+        }
+
+
+def create_metrics_writer(write_batch: Callable[[List[Dict[str, Any]]], None]) -> MetricsWriter:
+    """
+    Writer configuré par l'environnement, vidé automatiquement à la fin du process.
+    """
+    writer = MetricsWriter(
+        write_batch,
+        maxsize=int(os.getenv("SKILLIA_METRICS_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)),
+        batch_size=int(os.getenv("SKILLIA_METRICS_BATCH_SIZE", DEFAULT_BATCH_SIZE)),
+        flush_interval=float(os.getenv("SKILLIA_METRICS_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL))
+    )
+    atexit.register(writer.flush)
+    return writer
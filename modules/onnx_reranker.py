@@ -0,0 +1,117 @@
+# modules/onnx_reranker.py
+
+import json
+import os
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+ONNX_MODELS_DIR = "vector_store/reranker_onnx"
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_FILE = "model_int8.onnx"
+ONNX_META_FILE = "reranker_meta.json"
+
+
+def onnx_model_dir(model_name: str, models_dir: str = ONNX_MODELS_DIR) -> str:
+    return os.path.join(models_dir, model_name.replace("/", "__"))
+
+
+def _activation_name(model_name: str) -> str:
+    """
+    Activation appliquée par CrossEncoder aux logits (sigmoid ou identité selon la version
+    de sentence-transformers) : le backend ONNX l'applique aussi pour des scores identiques.
+    """
+    from sentence_transformers import CrossEncoder
+    model = CrossEncoder(model_name)
+    activation = getattr(model, "activation_fct", None) or getattr(model, "default_activation_function", None)
+    return "sigmoid" if type(activation).__name__ == "Sigmoid" else "identity"
+
+
+def export_onnx_reranker(model_name: str, models_dir: str = ONNX_MODELS_DIR, quantize: bool = True) -> str:
+    """
+    Exporte le cross-encoder en ONNX puis le quantifie dynamiquement en int8 (poids des couches linéaires).
+    Returns:
+        Dossier contenant le modèle, le tokenizer et les métadonnées
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    output_dir = onnx_model_dir(model_name, models_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"📦 Export ONNX du reranker {model_name} → {output_dir}")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+    sample = tokenizer(["requête"], ["texte du chunk"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    fp32_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(sample[name] for name in input_names), fp32_path,
+            input_names=input_names, output_names=["logits"],
+            dynamic_axes=dynamic_axes, opset_version=14
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, os.path.join(output_dir, ONNX_QUANTIZED_FILE), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, ONNX_META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"model_name": model_name, "activation": _activation_name(model_name)}, f, indent=2)
+    print("✅ Export ONNX terminé.")
+    return output_dir
+
+
+class OnnxCrossEncoder:
+    """
+    Cross-encoder exécuté par ONNX Runtime (CPU), avec la même interface `predict` que
+    `sentence_transformers.CrossEncoder`. Le modèle est exporté au premier chargement s'il n'existe pas.
+    """
+
+    def __init__(self, model_name: str, max_length: int = 512, quantized: bool = True,
+                 models_dir: str = ONNX_MODELS_DIR, num_threads: int = None): # type: ignore
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_dir = onnx_model_dir(model_name, models_dir)
+        model_file = ONNX_QUANTIZED_FILE if quantized else ONNX_MODEL_FILE
+        if not os.path.exists(os.path.join(model_dir, model_file)):
+            export_onnx_reranker(model_name, models_dir, quantize=quantized)
+
+        with open(os.path.join(model_dir, ONNX_META_FILE), "r", encoding="utf-8") as f:
+            self.activation = json.load(f).get("activation", "identity")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model_name = model_name
+        self.max_length = max_length
+        self.quantized = quantized
+
+    def predict(self, pairs: Sequence[Tuple[str, str]], batch_size: int = 32, **_) -> np.ndarray:
+        scores: List[np.ndarray] = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            encoded = self.tokenizer(
+                [query for query, _ in batch], [text for _, text in batch],
+                padding=True, truncation="longest_first", max_length=self.max_length, return_tensors="np"
+            )
+            inputs = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+            logits = self.session.run(None, inputs)[0]
+            scores.append(logits[:, 0] if logits.ndim == 2 else logits)
+        if not scores:
+            return np.zeros(0, dtype=np.float32)
+        result = np.concatenate(scores)
+        if self.activation == "sigmoid":
+            result = 1 / (1 + np.exp(-result))
+        return result
@@ -0,0 +1,111 @@
+# modules/query_cache.py
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_QUERY_CACHE_SIZE = 256
+
+
+def normalize_query(query: str) -> str:
+    """
+    Clé de cache d'une requête : casse et espaces ignorés (« Plan  PCA » == « plan pca »).
+    """
+    return " ".join(query.lower().split())
+
+
+class QueryCache:
+    """
+    Cache LRU borné des requêtes, indexé par (index, version de l'index, requête normalisée).
+
+    Chaque entrée garde le vecteur de la requête et, par jeu de paramètres de recherche
+    (faiss_k, final_k, mode...), les IDs candidats et le résultat du reranking (ID, score).
+    Une nouvelle version de l'index (ingestion, propale ajoutée) rend les entrées inaccessibles ;
+    `invalidate` les libère immédiatement.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.vector_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(index_path: str, index_version: str, query: str) -> tuple:
+        return os.path.abspath(index_path), index_version, normalize_query(query)
+
+    def _entry(self, key: tuple, create: bool = False) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        elif create:
+            entry = self._entries[key] = {"vector": None, "results": {}}
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def get_results(self, index_path: str, index_version: str, query: str, params: tuple) -> Optional[Dict[str, Any]]:
+        """
+        Candidats et résultat du reranking déjà calculés pour cette requête et ces paramètres.
+        """
+        with self._lock:
+            entry = self._entry(self._key(index_path, index_version, query))
+            results = entry["results"].get(params) if entry else None
+            if results is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return results
+
+    def get_vector(self, index_path: str, index_version: str, query: str) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._entry(self._key(index_path, index_version, query))
+            if entry is None or entry["vector"] is None:
+                return None
+            self.vector_hits += 1
+            return entry["vector"]
+
+    def put_vector(self, index_path: str, index_version: str, query: str, vector: np.ndarray):
+        with self._lock:
+            self._entry(self._key(index_path, index_version, query), create=True)["vector"] = vector # type: ignore
+
+    def put_results(self, index_path: str, index_version: str, query: str, params: tuple,
+                    candidate_ids: List[str], reranked: List[Tuple[str, float]]):
+        with self._lock:
+            entry = self._entry(self._key(index_path, index_version, query), create=True)
+            entry["results"][params] = {"candidate_ids": list(candidate_ids), "reranked": list(reranked)} # type: ignore
+
+    def invalidate(self, index_path: str = None): # type: ignore
+        """
+        Vide le cache (ou seulement les entrées d'un index).
+        """
+        with self._lock:
+            if index_path is None:
+                self._entries.clear()
+                return
+            path = os.path.abspath(index_path)
+            for key in [key for key in self._entries if key[0] == path]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "vector_hits": self.vector_hits,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+# Instance globale (partagée par toutes les sessions Streamlit du process)
+query_cache = QueryCache(int(os.getenv("SKILLIA_QUERY_CACHE_SIZE", DEFAULT_QUERY_CACHE_SIZE)))
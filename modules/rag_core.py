@@ -1,67 +1,238 @@
 # modules/rag_core.py
+import asyncio
+import os
 import time  # AJOUT pour mesurer le temps
+from concurrent.futures import ThreadPoolExecutor
 from itertools import chain
-from modules.vector_store import load_index
-from modules.embedder import get_embedding_model
-from modules.llm_openai import get_llm
+from modules.resources import get_shared_index, get_shared_llm
 from modules.prompt_template import get_proposal_prompt_template
-from modules.reranker import rerank
-from modules.metrics import rag_metrics  # AJOUT du module métriques
+from modules.reranker import rerank, rerank_batch
+from modules.retrieval import (
+    retrieve, retrieve_ids_batch, embed_query, embed_queries, documents_by_id, stored_vectors, DEFAULT_RETRIEVAL_MODE
+)
+from modules.query_cache import query_cache
+from modules.answer_cache import answer_cache
+from modules.metrics import rag_metrics, LoggedMetrics  # AJOUT du module métriques
+from modules.context_packer import pack_context, count_tokens, CONTEXT_TOKEN_BUDGET
+from modules.timing import RequestTimings
+from modules import telemetry
 from langchain.schema import Document
-from typing import List, Tuple
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
 from langchain.chains import LLMChain
 
-def full_rag_pipeline(query: str, index_path: str = "vector_store/propales_index", faiss_k: int = 20, final_k: int = 4) -> Tuple[str, List[Tuple[Document, float]]]:
+LLM_MODEL = "gpt-3.5-turbo"
+
+# Pool des étapes CPU (embedding, FAISS, reranking, métriques) du pipeline asynchrone
+_cpu_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SKILLIA_CPU_WORKERS", "4")), thread_name_prefix="rag-cpu")
+_background_tasks: set = set()
+
+# Endpoint /metrics si SKILLIA_PROMETHEUS_PORT est défini (une fois par process)
+telemetry.start_exporter()
+
+def _cached_reranked(index, cached: dict) -> List[Tuple[Document, float]]:
+    scores = dict(cached["reranked"])
+    reranked_docs = []
+    for doc in documents_by_id(index, scores):
+        doc.metadata["cross_score"] = scores[doc.id]
+        reranked_docs.append((doc, scores[doc.id]))
+    return reranked_docs
+
+def build_context(reranked_docs: List[Tuple[Document, float]]) -> Tuple[str, dict]:
+    """
+    Contexte du prompt : chunks retenus dans le budget de tokens (voisins fusionnés, recouvrements retirés).
+    Returns:
+        (contexte, rapport de remplissage du budget)
+    """
+    context, report = pack_context(reranked_docs, budget=CONTEXT_TOKEN_BUDGET, model=LLM_MODEL)
+    print(f"🧾 Contexte : {report['context_tokens']} / {report['budget_tokens']} tokens "
+          f"({report['tokens_saved']} économisés, {report['chunks_merged']} chunks fusionnés, "
+          f"{report['chunks_dropped']} hors budget)")
+    return context, report
+
+def generate_proposal(query: str, context: str) -> str:
+    prompt = get_proposal_prompt_template()
+    llm = get_shared_llm(LLM_MODEL)
+    chain = LLMChain(llm=llm, prompt=prompt, verbose=True)
+    return chain.run({"context": context, "question": query})
+
+def stream_proposal(query: str, context: str) -> Iterator[str]:
+    """
+    Génération en streaming : fragments de texte au fil de leur arrivée depuis le LLM.
+    """
+    prompt = get_proposal_prompt_template()
+    llm = get_shared_llm(LLM_MODEL)
+    for chunk in llm.stream(prompt.format(context=context, question=query)):
+        text = getattr(chunk, "content", chunk)
+        if text:
+            yield text
+
+def _cached_answer(vector: np.ndarray, context_ids: List[str], use_answer_cache: bool) -> Optional[str]:
+    if not use_answer_cache:
+        answer_cache.record_bypass()
+        return None
+    result = answer_cache.lookup(vector, context_ids, LLM_MODEL)
+    if result is not None:
+        print("♻️ Proposition en cache (brief similaire, même contexte) : appel LLM évité.")
+    return result
+
+def _record_llm_tokens(timings: RequestTimings, query: str, context: str, result: str):
+    prompt = get_proposal_prompt_template().format(context=context, question=query)
+    timings.attributes["llm.prompt_tokens"] = count_tokens(prompt, LLM_MODEL)
+    timings.attributes["llm.completion_tokens"] = count_tokens(result, LLM_MODEL)
+
+def _log_error_metrics(query: str, error_msg: str, processing_time: float, timings: RequestTimings = None): # type: ignore
+    if timings is not None:
+        telemetry.end_request(timings, "error", processing_time)
+    try:
+        rag_metrics.log_metrics(
+            query=query,
+            response=error_msg,
+            chunks=[],
+            processing_time=processing_time,
+            relevance_score=0.0,
+            quality_score=0.0
+        )
+    except:
+        pass  # Ignorer les erreurs de logging si critiques
+
+def _log_metrics(query: str, result: str, reranked_docs: List[Tuple[Document, float]], processing_time: float,
+                 time_to_first_token: float = None, context_report: dict = None, # type: ignore
+                 query_vector: np.ndarray = None, timings: RequestTimings = None, # type: ignore
+                 extra: dict = None, chunk_vectors: np.ndarray = None) -> Optional[LoggedMetrics]: # type: ignore
+    def _end_request(metrics_seconds: Optional[float]):
+        # Appelé par le thread d'écriture une fois les scores calculés : la trace couvre l'étape "metrics"
+        if metrics_seconds is not None:
+            timings.record("metrics", metrics_seconds)
+        telemetry.end_request(timings, "ok", processing_time)
+
+    try:
+        fields = dict(extra or {})
+        if context_report:
+            fields.update(context_tokens=context_report["context_tokens"], context_tokens_saved=context_report["tokens_saved"])
+        metrics_data = rag_metrics.log_metrics(
+            query=query,
+            response=result,
+            chunks=reranked_docs,
+            processing_time=processing_time,
+            time_to_first_token=time_to_first_token,
+            extra=fields or None,
+            query_vector=query_vector,
+            timings=timings,
+            chunk_vectors=chunk_vectors,
+            on_scored=_end_request if timings is not None else None
+        )
+        print("📊 Métriques en file d'écriture (scores calculés en arrière-plan).")
+        return metrics_data
+    except Exception as metrics_error:
+        print(f"⚠️ Erreur enregistrement métriques: {metrics_error}")
+        if timings is not None:
+            telemetry.end_request(timings, "ok", processing_time)
+        return None
+
+def _chunk_vectors(index_path: str, reranked_docs: List[Tuple[Document, float]]) -> Optional[np.ndarray]:
+    """
+    Vecteurs FAISS des chunks retenus, pour le calcul des scores (index déjà résident).
+    """
+    return stored_vectors(get_shared_index(index_path), [doc.id for doc, _ in reranked_docs])
+
+def _rerank_fields(stats: dict) -> dict:
+    """
+    Champs de métriques du reranking de la requête (vide si le résultat venait du cache de requêtes).
+    """
+    if not stats:
+        return {}
+    return {"rerank_candidates": stats["candidates"], "rerank_evaluated": stats["evaluated"], "rerank_saved": stats["saved"]}
+
+def retrieve_context(query: str, index_path: str = "vector_store/propales_index", faiss_k: int = 20, final_k: int = 4,
+                     retrieval_mode: str = DEFAULT_RETRIEVAL_MODE, taxonomy_filter: bool = False,
+                     timings: RequestTimings = None, # type: ignore
+                     rerank_stats: dict = None) -> Tuple[np.ndarray, List[Tuple[Document, float]]]: # type: ignore
+    """
+    Étapes CPU du pipeline : vecteur de la requête, recherche, reranking (avec le cache de requêtes).
+    `timings` reçoit la durée de chaque étape (index_load, embedding, search, rerank).
+    `rerank_stats` : si fourni, reçoit les paires candidates / évaluées / évitées par le reranking.
+    Returns:
+        (vecteur de la requête, liste de (Document, score) retenus pour le contexte)
+    """
+    # Index + Recherche (embedder et index résidents, chargés une seule fois par process)
+    timings = timings or RequestTimings()
+    with timings.span("index_load"):
+        index = get_shared_index(index_path)
+    telemetry.index_vectors.set(index.index.ntotal, index=index_path)
+    version = getattr(index, "index_version", "")
+    search_params = (faiss_k, final_k, retrieval_mode, taxonomy_filter)
+
+    with timings.span("embedding"):
+        vector = query_cache.get_vector(index_path, version, query)
+        if vector is None:
+            vector = embed_query(index, query)
+            query_cache.put_vector(index_path, version, query, vector)
+
+    # Requête déjà traitée sur cette version de l'index : ni FAISS, ni reranking
+    cached = query_cache.get_results(index_path, version, query, search_params)
+    if cached is not None:
+        reranked_docs = _cached_reranked(index, cached)
+        print(f"♻️ Résultat de recherche en cache : {len(reranked_docs)} documents.")
+        return vector, reranked_docs
+
+    with timings.span("search"):
+        retrieved_docs = retrieve(index, query, k=faiss_k, mode=retrieval_mode, partition=taxonomy_filter, vector=vector)
+    print(f"🔍 {len(retrieved_docs)} documents récupérés ({retrieval_mode}).")
+    
+    with timings.span("rerank"):
+        reranked_docs = rerank(query, retrieved_docs, top_k=final_k, stats=rerank_stats)
+    print(f"🏅 {len(reranked_docs)} documents après reranking.")
+    query_cache.put_results(
+        index_path, version, query, search_params,
+        candidate_ids=[doc.id for doc in retrieved_docs],
+        reranked=[(doc.id, score) for doc, score in reranked_docs]
+    )
+    return vector, reranked_docs
+
+def full_rag_pipeline(query: str, index_path: str = "vector_store/propales_index", faiss_k: int = 20, final_k: int = 4,
+                      retrieval_mode: str = DEFAULT_RETRIEVAL_MODE, taxonomy_filter: bool = False,
+                      use_answer_cache: bool = True) -> Tuple[str, List[Tuple[Document, float]]]:
     """
     Pipeline complet : recherche FAISS → reranking → génération LLaMA3 (avec contrôle du contexte)
     AJOUT : Intégration des métriques de performance
+    `retrieval_mode` : "dense" (FAISS), "sparse" (BM25) ou "hybrid" (fusion RRF des deux)
+    `taxonomy_filter` : limite la recherche aux chunks du secteur détecté dans la requête (config/taxonomie.json)
+    `use_answer_cache` : False pour forcer une nouvelle génération (ignore le cache sémantique des propositions)
     """
     
     # AJOUT : Mesure du temps de départ
     start_time = time.time()
+    timings = RequestTimings("full_rag_pipeline")
+    rerank_stats = {}
     
     try:
-        # 1. Index + Recherche
-        embedder = get_embedding_model()
-        index = load_index(index_path, embedder)
-        retrieved_docs = index.similarity_search(query, k=faiss_k)
-        print(f"🔍 {len(retrieved_docs)} documents récupérés par FAISS.")
-        
-        reranked_docs = rerank(query, retrieved_docs, top_k=final_k)
-        print(f"🏅 {len(reranked_docs)} documents après reranking.")
+        # 1. Recherche + reranking
+        vector, reranked_docs = retrieve_context(query, index_path, faiss_k, final_k, retrieval_mode, taxonomy_filter, timings,
+                                                 rerank_stats)
         
         # 2. Préparation du contexte
-        docs = [doc for doc, *_ in reranked_docs]
-        context = "\n\n".join(doc.page_content.strip() for doc in docs)
-        print(f"🧾 Longueur totale du contexte : {len(context)} caractères")
+        with timings.span("context"):
+            context, context_report = build_context(reranked_docs)
         
-        # Option : tronquer si trop long (selon ton modèle)
-        MAX_CONTEXT_CHARS = 12000
-        if len(context) > MAX_CONTEXT_CHARS:
-            print(f"⚠️ Contexte tronqué à {MAX_CONTEXT_CHARS} caractères.")
-            context = context[:MAX_CONTEXT_CHARS]
-        
-        # 3. Appel du modèle avec prompt template
-        prompt = get_proposal_prompt_template()
-        llm = get_llm("gpt-3.5-turbo")
-        chain = LLMChain(llm=llm, prompt=prompt, verbose=True)
-        result = chain.run({"context": context, "question": query})
+        # 3. Brief proche d'un brief déjà traité, avec le même contexte : proposition en cache
+        context_ids = [doc.id for doc, _ in reranked_docs]
+        result = _cached_answer(vector, context_ids, use_answer_cache)
+
+        # 4. Appel du modèle avec prompt template
+        if result is None:
+            with timings.span("llm"):
+                result = generate_proposal(query, context)
+            _record_llm_tokens(timings, query, context, result)
+            answer_cache.store(vector, context_ids, LLM_MODEL, result)
         
         # AJOUT : Calcul du temps de traitement
         processing_time = time.time() - start_time
         print(f"⏱️ Temps de traitement total : {processing_time:.2f}s")
         
         # AJOUT : Enregistrement des métriques
-        try:
-            metrics_data = rag_metrics.log_metrics(
-                query=query,
-                response=result,
-                chunks=reranked_docs,
-                processing_time=processing_time
-            )
-            print(f"📊 Métriques enregistrées - Pertinence: {metrics_data['relevance_score']:.3f}, Qualité: {metrics_data['quality_score']:.3f}")
-        except Exception as metrics_error:
-            print(f"⚠️ Erreur enregistrement métriques: {metrics_error}")
+        _log_metrics(query, result, reranked_docs, processing_time, context_report=context_report, query_vector=vector,
+                     timings=timings, extra=_rerank_fields(rerank_stats), chunk_vectors=_chunk_vectors(index_path, reranked_docs))
         
         return result, reranked_docs
         
@@ -72,21 +243,343 @@ def full_rag_pipeline(query: str, index_path: str = "vector_store/propales_index
         print(f"Erreur RAG: {e}")
         
         # Enregistrer l'erreur dans les métriques
-        try:
-            rag_metrics.log_metrics(
-                query=query,
-                response=error_msg,
-                chunks=[],
-                processing_time=processing_time,
-                relevance_score=0.0,
-                quality_score=0.0
-            )
-        except:
-            pass  # Ignorer les erreurs de logging si critiques
+        _log_error_metrics(query, error_msg, processing_time, timings)
             
         return error_msg, []
 
 
+class ProposalStream:
+    """
+    Fragments d'une proposition générée en streaming. Une fois l'itération terminée,
+    `metrics` contient les métriques enregistrées pour la requête (None en cas d'erreur).
+    """
+
+    def __init__(self, fragments: Iterator[str]):
+        self._fragments = fragments
+        self.metrics: Optional[LoggedMetrics] = None
+
+    def __iter__(self) -> Iterator[str]:
+        self.metrics = yield from self._fragments
+
+def _stream_and_log(query: str, vector: np.ndarray, context: str, context_report: dict,
+                    reranked_docs: List[Tuple[Document, float]], cached_result: Optional[str],
+                    start_time: float, timings: RequestTimings, extra: dict = None, # type: ignore
+                    chunk_vectors: np.ndarray = None) -> Iterator[str]: # type: ignore
+    context_ids = [doc.id for doc, _ in reranked_docs]
+    fragments = []
+    time_to_first_token = None
+    llm_start = time.perf_counter()
+    try:
+        for fragment in ([cached_result] if cached_result is not None else stream_proposal(query, context)):
+            if time_to_first_token is None:
+                time_to_first_token = time.time() - start_time
+                print(f"⚡ Premier token après {time_to_first_token:.2f}s")
+            fragments.append(fragment)
+            yield fragment
+    except Exception as e:
+        processing_time = time.time() - start_time
+        error_msg = f"❌ Erreur dans le pipeline RAG : {str(e)}"
+        print(f"Erreur RAG: {e}")
+        _log_error_metrics(query, error_msg, processing_time, timings)
+        yield ("\n\n" if fragments else "") + error_msg
+        return
+
+    # Texte final assemblé : cache, métriques (export et feedback le reçoivent via l'appelant)
+    result = "".join(fragments)
+    if cached_result is None:
+        timings.record("llm", time.perf_counter() - llm_start)
+        _record_llm_tokens(timings, query, context, result)
+        answer_cache.store(vector, context_ids, LLM_MODEL, result)
+    processing_time = time.time() - start_time
+    print(f"⏱️ Temps de traitement total : {processing_time:.2f}s")
+    return _log_metrics(query, result, reranked_docs, processing_time, time_to_first_token, context_report, vector, timings, # type: ignore
+                        extra, chunk_vectors)
+
+def stream_rag_pipeline(query: str, index_path: str = "vector_store/propales_index", faiss_k: int = 20, final_k: int = 4,
+                        retrieval_mode: str = DEFAULT_RETRIEVAL_MODE, taxonomy_filter: bool = False,
+                        use_answer_cache: bool = True) -> Tuple[ProposalStream, List[Tuple[Document, float]]]:
+    """
+    Variante streaming de `full_rag_pipeline` (mêmes paramètres) : la recherche et le reranking
+    sont faits immédiatement, la proposition arrive ensuite fragment par fragment.
+    Returns:
+        (fragments de la proposition, liste de (Document, score))
+    Le temps jusqu'au premier token et les métriques sont enregistrés quand l'itérateur est épuisé
+    (disponibles ensuite dans `.metrics`) ; l'appelant concatène les fragments pour obtenir le texte final.
+    """
+    start_time = time.time()
+    timings = RequestTimings("stream_rag_pipeline")
+    rerank_stats = {}
+    try:
+        vector, reranked_docs = retrieve_context(query, index_path, faiss_k, final_k, retrieval_mode, taxonomy_filter, timings,
+                                                 rerank_stats)
+        with timings.span("context"):
+            context, context_report = build_context(reranked_docs)
+        cached_result = _cached_answer(vector, [doc.id for doc, _ in reranked_docs], use_answer_cache)
+        chunk_vectors = _chunk_vectors(index_path, reranked_docs)
+    except Exception as e:
+        processing_time = time.time() - start_time
+        error_msg = f"❌ Erreur dans le pipeline RAG : {str(e)}"
+        print(f"Erreur RAG: {e}")
+        _log_error_metrics(query, error_msg, processing_time, timings)
+        return ProposalStream(iter([error_msg])), []
+
+    fragments = _stream_and_log(query, vector, context, context_report, reranked_docs, cached_result, start_time, timings,
+                                _rerank_fields(rerank_stats), chunk_vectors)
+    return ProposalStream(fragments), reranked_docs
+
+
+async def agenerate_proposal(query: str, context: str) -> str:
+    prompt = get_proposal_prompt_template()
+    llm = get_shared_llm(LLM_MODEL)
+    chain = LLMChain(llm=llm, prompt=prompt, verbose=True)
+    return await chain.arun({"context": context, "question": query})
+
+def _run_in_background(loop: asyncio.AbstractEventLoop, fn, *args):
+    future = loop.run_in_executor(_cpu_executor, fn, *args)
+    _background_tasks.add(future)
+    future.add_done_callback(_background_tasks.discard)
+
+async def drain_background_tasks():
+    """
+    Attend la fin des enregistrements de métriques en arrière-plan (arrêt propre du serveur, tests).
+    """
+    if _background_tasks:
+        await asyncio.gather(*list(_background_tasks), return_exceptions=True)
+
+async def afull_rag_pipeline(query: str, index_path: str = "vector_store/propales_index", faiss_k: int = 20, final_k: int = 4,
+                             retrieval_mode: str = DEFAULT_RETRIEVAL_MODE, taxonomy_filter: bool = False,
+                             use_answer_cache: bool = True) -> Tuple[str, List[Tuple[Document, float]]]:
+    """
+    Variante asyncio de `full_rag_pipeline` (mêmes paramètres, même résultat) :
+        - recherche et reranking (CPU) dans un pool de threads, sans bloquer la boucle
+        - appel LLM via le client asynchrone
+        - métriques calculées et écrites après le retour de la réponse
+    Un seul process sert ainsi plusieurs briefs en parallèle (asyncio.gather), sans un thread par utilisateur.
+    """
+    loop = asyncio.get_running_loop()
+    start_time = time.time()
+    timings = RequestTimings("afull_rag_pipeline")
+    rerank_stats = {}
+
+    try:
+        vector, reranked_docs = await loop.run_in_executor(
+            _cpu_executor, retrieve_context, query, index_path, faiss_k, final_k, retrieval_mode, taxonomy_filter, timings,
+            rerank_stats
+        )
+        with timings.span("context"):
+            context, context_report = build_context(reranked_docs)
+        context_ids = [doc.id for doc, _ in reranked_docs]
+        result = _cached_answer(vector, context_ids, use_answer_cache)
+        if result is None:
+            with timings.span("llm"):
+                result = await agenerate_proposal(query, context)
+            _record_llm_tokens(timings, query, context, result)
+            answer_cache.store(vector, context_ids, LLM_MODEL, result)
+
+        processing_time = time.time() - start_time
+        print(f"⏱️ Temps de traitement total : {processing_time:.2f}s")
+        _run_in_background(loop, _log_metrics, query, result, reranked_docs, processing_time, None, context_report, vector, timings,
+                           _rerank_fields(rerank_stats), _chunk_vectors(index_path, reranked_docs))
+        return result, reranked_docs
+
+    except Exception as e:
+        processing_time = time.time() - start_time
+        error_msg = f"❌ Erreur dans le pipeline RAG : {str(e)}"
+        print(f"Erreur RAG: {e}")
+        _run_in_background(loop, _log_error_metrics, query, error_msg, processing_time, timings)
+        return error_msg, []
+
+
+def full_rag_pipeline_batch(queries: List[str], index_path: str = "vector_store/propales_index", faiss_k: int = 20,
+                            final_k: int = 4, retrieval_mode: str = DEFAULT_RETRIEVAL_MODE, taxonomy_filter: bool = False,
+                            use_answer_cache: bool = True, llm_concurrency: int = 4,
+                            rerank_batch_size: int = 64) -> Tuple[List[Tuple[str, List[Tuple[Document, float]]]], dict]:
+    """
+    Pipeline pour plusieurs briefs à la fois :
+        1. un seul passage du modèle d'embedding pour toutes les requêtes absentes du cache
+        2. une seule recherche FAISS multi-vecteurs
+        3. les paires (requête, chunk) de toutes les requêtes partagent les mêmes appels au reranker
+        4. les appels LLM partent en parallèle (`llm_concurrency` au plus)
+
+    Returns:
+        (liste de (proposition, chunks) dans l'ordre des requêtes, rapport de débit par étape)
+    Les métriques sont enregistrées par requête (`batched: True`) : chaque étape commune compte pour
+    sa part (durée / nombre de requêtes), le contexte et l'appel LLM pour leur durée propre.
+    """
+    start_time = time.time()
+    report = {"num_queries": len(queries)}
+    if not queries:
+        return [], report
+    timings = [RequestTimings("rag.batch") for _ in queries]
+
+    def _share(stage_name: str, seconds: float):
+        for request_timings in timings:
+            request_timings.record(stage_name, seconds / len(queries))
+
+    try:
+        stage = time.perf_counter()
+        index = get_shared_index(index_path)
+        _share("index_load", time.perf_counter() - stage)
+        telemetry.index_vectors.set(index.index.ntotal, index=index_path)
+        version = getattr(index, "index_version", "")
+        search_params = (faiss_k, final_k, retrieval_mode, taxonomy_filter)
+
+        # 1. Vecteurs : cache de requêtes, puis un seul batch pour les manquants
+        stage = time.perf_counter()
+        vectors = [query_cache.get_vector(index_path, version, query) for query in queries]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            for i, vector in zip(missing, embed_queries(index, [queries[i] for i in missing])):
+                vectors[i] = vector.reshape(1, -1)
+                query_cache.put_vector(index_path, version, queries[i], vectors[i])
+        matrix = np.vstack(vectors)
+        _share("embedding", time.perf_counter() - stage)
+        report["embedding_seconds"] = round(time.perf_counter() - stage, 4)
+        report["queries_embedded"] = len(missing)
+
+        # 2. Recherche groupée des requêtes absentes du cache de résultats
+        stage = time.perf_counter()
+        reranked: List[List[Tuple[Document, float]]] = [[] for _ in queries]
+        pending = []
+        for i, query in enumerate(queries):
+            cached = query_cache.get_results(index_path, version, query, search_params)
+            if cached is None:
+                pending.append(i)
+            else:
+                reranked[i] = _cached_reranked(index, cached)
+        candidates = []
+        if pending:
+            similarities: List[dict] = []
+            ids_lists = retrieve_ids_batch(index, [queries[i] for i in pending], matrix[pending],
+                                           k=faiss_k, mode=retrieval_mode, partition=taxonomy_filter, similarities=similarities)
+            candidates = [documents_by_id(index, ids, sims) for ids, sims in zip(ids_lists, similarities)]
+        _share("search", time.perf_counter() - stage)
+        report["retrieval_seconds"] = round(time.perf_counter() - stage, 4)
+        report["retrieval_cache_hits"] = len(queries) - len(pending)
+
+        # 3. Reranking : toutes les paires dans les mêmes appels predict
+        stage = time.perf_counter()
+        rerank_stats = [{} for _ in queries]
+        if pending:
+            pending_stats: List[dict] = []
+            ranked_lists = rerank_batch([queries[i] for i in pending], candidates, top_k=final_k,
+                                        batch_size=rerank_batch_size, stats=pending_stats)
+            for i, docs, ranked, stats in zip(pending, candidates, ranked_lists, pending_stats):
+                reranked[i] = ranked
+                rerank_stats[i] = stats
+                query_cache.put_results(
+                    index_path, version, queries[i], search_params,
+                    candidate_ids=[doc.id for doc in docs],
+                    reranked=[(doc.id, score) for doc, score in ranked]
+                )
+        _share("rerank", time.perf_counter() - stage)
+        report["rerank_seconds"] = round(time.perf_counter() - stage, 4)
+        report["rerank_pairs"] = sum(len(docs) for docs in candidates)
+        report["rerank_evaluated"] = sum(stats.get("evaluated", 0) for stats in rerank_stats)
+        print(f"🏅 {len(pending)} requêtes rerankées ensemble ({report['rerank_evaluated']}/{report['rerank_pairs']} paires évaluées).")
+    except Exception as e:
+        print(f"Erreur RAG (batch): {e}")
+        error_msg = f"❌ Erreur dans le pipeline RAG : {str(e)}"
+        elapsed = time.time() - start_time
+        for query, request_timings in zip(queries, timings):
+            _log_error_metrics(query, error_msg, elapsed / len(queries), request_timings)
+        return [(error_msg, []) for _ in queries], report
+
+    # 4. Génération : cache sémantique, puis appels LLM en parallèle
+    shared_seconds = time.time() - start_time
+    stage = time.perf_counter()
+    contexts, context_reports = [], []
+    for docs, request_timings in zip(reranked, timings):
+        with request_timings.span("context"):
+            context, context_report = build_context(docs)
+        contexts.append(context)
+        context_reports.append(context_report)
+    context_ids = [[doc.id for doc, _ in docs] for docs in reranked]
+    results: List[str] = [None] * len(queries) # type: ignore
+    for i in range(len(queries)):
+        if use_answer_cache:
+            results[i] = answer_cache.lookup(matrix[i], context_ids[i], LLM_MODEL) # type: ignore
+        else:
+            answer_cache.record_bypass()
+    to_generate = [i for i, result in enumerate(results) if result is None]
+    report["answer_cache_hits"] = len(queries) - len(to_generate)
+
+    failed = set()
+
+    def _generate(i: int) -> str:
+        try:
+            with timings[i].span("llm"):
+                result = generate_proposal(queries[i], contexts[i])
+            _record_llm_tokens(timings[i], queries[i], contexts[i], result)
+            answer_cache.store(matrix[i], context_ids[i], LLM_MODEL, result)
+            return result
+        except Exception as e:
+            print(f"Erreur RAG: {e}")
+            failed.add(i)
+            return f"❌ Erreur dans le pipeline RAG : {str(e)}"
+
+    if to_generate:
+        with ThreadPoolExecutor(max_workers=max(1, min(llm_concurrency, len(to_generate)))) as pool:
+            for i, result in zip(to_generate, pool.map(_generate, to_generate)):
+                results[i] = result
+    report["llm_calls"] = len(to_generate)
+    report["llm_errors"] = len(failed)
+    report["llm_seconds"] = round(time.perf_counter() - stage, 4)
+
+    processing_time = time.time() - start_time
+    report["duration_seconds"] = round(processing_time, 3)
+    report["throughput_qps"] = round(len(queries) / processing_time, 3) if processing_time else 0.0
+    print(f"⏱️ {len(queries)} requêtes traitées en {processing_time:.2f}s ({report['throughput_qps']:.2f} requêtes/s)")
+
+    for i, (query, result, docs) in enumerate(zip(queries, results, reranked)):
+        # Durée par requête : part des étapes communes + contexte et appel LLM propres
+        query_time = shared_seconds / len(queries) + timings[i].stages.get("context", 0.0) + timings[i].stages.get("llm", 0.0)
+        if i in failed:
+            _log_error_metrics(query, result, query_time, timings[i])
+            continue
+        _log_metrics(query, result, docs, query_time, context_report=context_reports[i], query_vector=matrix[i],
+                     timings=timings[i], extra={"batched": True, "batch_size": len(queries), **_rerank_fields(rerank_stats[i])},
+                     chunk_vectors=stored_vectors(index, [doc.id for doc, _ in docs]))
+
+    return [(result, [] if i in failed else docs) for i, (result, docs) in enumerate(zip(results, reranked))], report
+
+
+def compare_batch_throughput(queries: List[str], index_path: str = "vector_store/propales_index", faiss_k: int = 20,
+                             final_k: int = 4, retrieval_mode: str = DEFAULT_RETRIEVAL_MODE,
+                             rerank_batch_size: int = 64) -> dict:
+    """
+    Débit embedding + recherche + reranking, requête par requête vs en lot (sans caches ni LLM,
+    dont le coût est identique dans les deux cas).
+    """
+    index = get_shared_index(index_path)
+    # Échauffement : modèles chargés avant la mesure
+    rerank(queries[0], retrieve(index, queries[0], k=faiss_k, mode=retrieval_mode), top_k=final_k, use_cache=False)
+
+    start = time.perf_counter()
+    for query in queries:
+        docs = retrieve(index, query, k=faiss_k, mode=retrieval_mode, vector=embed_query(index, query))
+        rerank(query, docs, top_k=final_k, use_cache=False)
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ids_lists = retrieve_ids_batch(index, queries, embed_queries(index, queries), k=faiss_k, mode=retrieval_mode)
+    rerank_batch(queries, [documents_by_id(index, ids) for ids in ids_lists], top_k=final_k, batch_size=rerank_batch_size,
+                 use_cache=False)
+    batched = time.perf_counter() - start
+
+    report = {
+        "num_queries": len(queries),
+        "sequential_seconds": round(sequential, 4),
+        "batch_seconds": round(batched, 4),
+        "sequential_qps": round(len(queries) / sequential, 2) if sequential else 0.0,
+        "batch_qps": round(len(queries) / batched, 2) if batched else 0.0,
+        "speedup": round(sequential / batched, 2) if batched else 0.0
+    }
+    print(f"🚀 {len(queries)} requêtes : une par une {report['sequential_qps']} req/s • "
+          f"en lot {report['batch_qps']} req/s (x{report['speedup']})")
+    return report
+
+
 # AJOUT : Fonction utilitaire pour analyser les performances d'une requête
 def analyze_query_performance(query: str, **kwargs) -> dict:
     """
@@ -124,9 +617,8 @@ def analyze_query_performance(query: str, **kwargs) -> dict:
             "num_chunks": 0
         }
     
-    # Calculer scores avec le module métriques
-    relevance_score = rag_metrics.calculate_relevance_score(query, chunks)
-    quality_score = rag_metrics.calculate_response_quality(query, result)
+    # Calculer scores avec le module métriques (une seule passe)
+    relevance_score, quality_score = rag_metrics.score(query, chunks, result)
     
     return {
         "query": query,
@@ -1,33 +1,307 @@
-from sentence_transformers import CrossEncoder
+import os
+import threading
+import time
 from langchain.schema import Document
-from typing import List
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 import numpy as np
 from sklearn.preprocessing import MinMaxScaler
+from modules.resources import get_shared_reranker
+from modules.score_cache import rerank_score_cache
+from modules.keyword_boosts import KeywordBooster, get_keyword_booster
+from modules.telemetry import reranker_batch_size
 
-# Choisir un modèle puissant et compatible
-reranker = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+FAISS_SCORE_KEY = "faiss_score"  # similarité FAISS du candidat (plus grand = plus proche), renseignée par modules.retrieval
+
+# Choisir un modèle puissant et compatible (chargé une seule fois via le registre partagé)
+RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Backend d'inférence : "torch" (PyTorch float32) ou "onnx" (ONNX Runtime, int8 dynamique)
+RERANKER_BACKENDS = ("torch", "onnx")
+RERANKER_BACKEND = os.getenv("SKILLIA_RERANKER_BACKEND", "torch")
+RERANKER_BATCH_SIZE = int(os.getenv("SKILLIA_RERANKER_BATCH_SIZE", "32"))
+# Tokens max par paire (requête + chunk de 1000 caractères ≈ 300 tokens) ; 0 = limite du modèle
+RERANKER_MAX_LENGTH = int(os.getenv("SKILLIA_RERANKER_MAX_LENGTH", "0"))
+
+
+# Reranking en cascade : lots de paires, arrêt anticipé quand le top-k ne bouge plus
+RERANK_MODES = ("full", "cascade")
+RERANK_MODE = os.getenv("SKILLIA_RERANK_MODE", "full")
+CASCADE_BATCH_SIZE = int(os.getenv("SKILLIA_CASCADE_BATCH_SIZE", "4"))
+CASCADE_PATIENCE = int(os.getenv("SKILLIA_CASCADE_PATIENCE", "2"))  # lots consécutifs sans changement du top-k avant l'arrêt
+CASCADE_MIN_FACTOR = int(os.getenv("SKILLIA_CASCADE_MIN_FACTOR", "2"))  # candidats toujours évalués : top_k × ce facteur
+# Écart de similarité FAISS au meilleur candidat au-delà duquel un candidat est écarté sans être scoré.
+# Heuristique (ce n'est pas une borne sur le score du cross-encoder) : désactivé tant qu'il n'est pas défini
+CASCADE_FAISS_MARGIN = float(os.getenv("SKILLIA_CASCADE_FAISS_MARGIN", "0")) or None
+
+cascade_stats: Dict[str, Any] = {"queries": 0, "candidates": 0, "evaluated": 0, "skipped_by_faiss": 0, "early_stops": 0}
+_cascade_lock = threading.Lock()
+
+
+def get_reranker(backend: str = RERANKER_BACKEND, max_length: int = RERANKER_MAX_LENGTH) -> Any:
+    return get_shared_reranker(RERANKER_MODEL, backend=backend, max_length=max_length or None) # type: ignore
 
 def normalize_scores(scores):
     scaler = MinMaxScaler()
     return scaler.fit_transform(np.array(scores).reshape(-1, 1)).flatten().tolist()
 
-def boost_score(doc: Document, score: float) -> float:
-    boost_keywords = ["objectif", "sécurité", "gestion de crise", "exercice simulé"]
-    content = doc.page_content.lower()
-    boost = sum(1 for kw in boost_keywords if kw in content)
-    return score + 0.05 * boost
+def sigmoid_scores(scores):
+    """
+    Logits → probabilités : score d'une paire indépendant des autres candidats (mode cascade,
+    où tous les candidats ne sont pas scorés).
+    """
+    return (1.0 / (1.0 + np.exp(-np.asarray(scores, dtype=np.float64)))).tolist()
+
+def boost_score(doc: Document, score: float, booster: KeywordBooster = None) -> float: # type: ignore
+    """
+    Score + bonus des mots-clés de config/boost_keywords.json (précalculés à l'ingestion).
+    """
+    return score + (booster or get_keyword_booster()).boost(doc)
 
-def rerank(query: str, documents: List[Document], top_k: int = 4, min_score: float = 0.3) -> List[Document]:
-    pairs = [(query, doc.page_content) for doc in documents]
-    scores = reranker.predict(pairs)
-    scores = normalize_scores(scores)
+def _scored(documents: List[Document], scores, min_score: float, normalize=normalize_scores) -> List[Tuple[Document, float]]:
+    scores = normalize(scores)
 
-    doc_scores = [(doc, boost_score(doc, score)) for doc, score in zip(documents, scores)]
+    booster = get_keyword_booster()
+    doc_scores = [(doc, boost_score(doc, score, booster)) for doc, score in zip(documents, scores)]
     filtered = [(doc, score) for doc, score in doc_scores if score >= min_score]
     filtered.sort(key=lambda x: x[1], reverse=True)
+    return filtered
+
+def _rank(documents: List[Document], scores, top_k: int, min_score: float, normalize=normalize_scores) -> List[Document]:
+    filtered = _scored(documents, scores, min_score, normalize)
 
     for doc, score in filtered:
         doc.metadata["cross_score"] = score
 
     return filtered[:top_k]  # ✅ une liste de (Document, score)
 
+def _model_key(backend: str = RERANKER_BACKEND, max_length: int = RERANKER_MAX_LENGTH) -> str:
+    return f"{RERANKER_MODEL}:{backend}:{max_length or 'max'}"
+
+def cross_scores(queries: List[str], documents_per_query: List[List[Document]], batch_size: int = RERANKER_BATCH_SIZE,
+                 use_cache: bool = True) -> List[np.ndarray]:
+    """
+    Logits bruts du cross-encoder pour chaque (requête, chunk), un vecteur par requête.
+    Les paires déjà scorées sont lues dans le cache persistant ; seules les manquantes
+    (toutes requêtes confondues) passent dans le modèle, en un seul appel predict.
+    `use_cache=False` : toutes les paires passent dans le modèle, sans lire ni écrire le cache (benchmarks).
+    """
+    model_key = _model_key()
+    scores = [np.zeros(len(docs), dtype=np.float32) for docs in documents_per_query]
+    missing = []  # (requête n°, position du chunk)
+    for q, (query, docs) in enumerate(zip(queries, documents_per_query)):
+        cached = rerank_score_cache.get_many(query, [doc.id for doc in docs if doc.id], model_key) if use_cache else {}
+        for i, doc in enumerate(docs):
+            if doc.id in cached:
+                scores[q][i] = cached[doc.id]
+            else:
+                missing.append((q, i))
+
+    if missing:
+        pairs = [(queries[q], documents_per_query[q][i].page_content) for q, i in missing]
+        reranker_batch_size.observe(len(pairs))
+        predicted = get_reranker().predict(pairs, batch_size=batch_size)
+        new_scores: Dict[int, List[Tuple[str, float]]] = {}
+        for (q, i), score in zip(missing, predicted):
+            scores[q][i] = score
+            doc_id = documents_per_query[q][i].id
+            if doc_id and use_cache:
+                new_scores.setdefault(q, []).append((doc_id, float(score)))
+        for q, doc_scores in new_scores.items():
+            rerank_score_cache.put_many(queries[q], doc_scores, model_key)
+    return scores
+
+def _full_stats(documents: List[Document]) -> Dict[str, Any]:
+    return {"candidates": len(documents), "evaluated": len(documents), "saved": 0, "skipped_by_faiss": 0, "early_stop": False}
+
+def rerank(query: str, documents: List[Document], top_k: int = 4, min_score: float = 0.3,
+           mode: str = RERANK_MODE, use_cache: bool = True, stats: Dict[str, Any] = None) -> List[Document]: # type: ignore
+    """
+    `mode` : "full" (tous les candidats passent dans le cross-encoder) ou "cascade" (voir `rerank_cascade`).
+    `use_cache=False` : sans le cache persistant des scores (voir `cross_scores`).
+    `stats` : si fourni, reçoit les paires candidates / évaluées / évitées de la requête.
+    """
+    if mode == "cascade":
+        return rerank_cascade(query, documents, top_k, min_score, use_cache=use_cache, stats=stats)
+    scores = cross_scores([query], [documents], use_cache=use_cache)[0]
+    if stats is not None:
+        stats.update(_full_stats(documents))
+    return _rank(documents, scores, top_k, min_score)
+
+def rerank_cascade(query: str, documents: List[Document], top_k: int = 4, min_score: float = 0.3,
+                   batch_size: int = CASCADE_BATCH_SIZE, patience: int = CASCADE_PATIENCE,
+                   faiss_margin: float = CASCADE_FAISS_MARGIN, use_cache: bool = True, # type: ignore
+                   stats: Dict[str, Any] = None) -> List[Document]: # type: ignore
+    """
+    Reranking en cascade :
+        1. si `faiss_margin` est défini, les candidats dont la similarité FAISS est à plus de `faiss_margin`
+           du meilleur sont écartés (sans appel au cross-encoder), tant qu'il reste au moins `top_k` candidats
+        2. les autres sont scorés par lots de `batch_size`, du plus proche au plus lointain (ordre de la recherche)
+        3. après top_k × CASCADE_MIN_FACTOR candidats, arrêt dès que le top-k est resté identique
+           pendant `patience` lots consécutifs
+    Les scores sont la probabilité du logit (sigmoïde) : contrairement à la normalisation min-max du mode
+    "full", le score d'un chunk (et le seuil `min_score`) ne dépend pas des candidats scorés.
+    `stats` : si fourni, reçoit les paires candidates / évaluées / évitées de la requête.
+    """
+    ranked, query_stats = _cascade([query], [documents], top_k, min_score, batch_size, patience, faiss_margin, use_cache)
+    if stats is not None:
+        stats.update(query_stats[0])
+    return ranked[0]
+
+def _faiss_cut(documents: List[Document], top_k: int, faiss_margin: Optional[float]) -> Tuple[List[Document], int]:
+    similarities = [doc.metadata.get(FAISS_SCORE_KEY) for doc in documents]
+    known = [score for score in similarities if score is not None]
+    if faiss_margin is None or not known or len(documents) <= top_k:
+        return list(documents), 0
+    floor = max(known) - faiss_margin
+    kept = [doc for doc, score in zip(documents, similarities) if score is None or score >= floor]
+    if len(kept) < top_k:
+        return list(documents), 0
+    return kept, len(documents) - len(kept)
+
+def _cascade(queries: List[str], documents_per_query: List[List[Document]], top_k: int, min_score: float,
+             batch_size: int, patience: int, faiss_margin: Optional[float], use_cache: bool,
+             predict_batch_size: int = RERANKER_BATCH_SIZE) -> Tuple[List[List[Document]], List[Dict[str, Any]]]:
+    """
+    Cascade de plusieurs requêtes : à chaque tour, le lot suivant de chaque requête encore active
+    passe dans un même appel au cross-encoder.
+    """
+    states = []
+    for query, documents in zip(queries, documents_per_query):
+        candidates, skipped = _faiss_cut(documents, top_k, faiss_margin)
+        states.append({"query": query, "candidates": candidates, "skipped": skipped, "docs": [], "scores": [],
+                       "top": None, "stable": 0, "done": not candidates})
+    min_evaluated = top_k * CASCADE_MIN_FACTOR
+
+    while True:
+        active = [state for state in states if not state["done"]]
+        if not active:
+            break
+        batches = [state["candidates"][len(state["docs"]):len(state["docs"]) + batch_size] for state in active]
+        scores = cross_scores([state["query"] for state in active], batches, batch_size=predict_batch_size, use_cache=use_cache)
+        for state, batch, batch_scores in zip(active, batches, scores):
+            state["docs"].extend(batch)
+            state["scores"].extend(batch_scores.tolist())
+            if len(state["docs"]) >= len(state["candidates"]):
+                state["done"] = True
+            elif len(state["docs"]) >= min_evaluated:
+                top = {id(doc) for doc, _ in _scored(state["docs"], state["scores"], min_score, sigmoid_scores)[:top_k]}
+                state["stable"] = state["stable"] + 1 if top == state["top"] else 0
+                state["top"] = top
+                state["done"] = state["stable"] >= patience
+
+    ranked, query_stats = [], []
+    for documents, state in zip(documents_per_query, states):
+        ranked.append(_rank(state["docs"], state["scores"], top_k, min_score, sigmoid_scores) if state["docs"] else [])
+        query_stats.append({
+            "candidates": len(documents), "evaluated": len(state["docs"]), "saved": len(documents) - len(state["docs"]),
+            "skipped_by_faiss": state["skipped"], "early_stop": len(state["docs"]) < len(state["candidates"])
+        })
+        _record_cascade(query_stats[-1])
+    return ranked, query_stats
+
+def _record_cascade(query_stats: Dict[str, Any]):
+    with _cascade_lock:
+        cascade_stats["queries"] += 1
+        cascade_stats["candidates"] += query_stats["candidates"]
+        cascade_stats["evaluated"] += query_stats["evaluated"]
+        cascade_stats["skipped_by_faiss"] += query_stats["skipped_by_faiss"]
+        cascade_stats["early_stops"] += int(query_stats["early_stop"])
+    print(f"✂️ Cascade : {query_stats['evaluated']}/{query_stats['candidates']} paires évaluées "
+          f"({query_stats['saved']} évitées, dont {query_stats['skipped_by_faiss']} par FAISS).")
+
+def cascade_report() -> Dict[str, Any]:
+    with _cascade_lock:
+        report = dict(cascade_stats)
+    report["saved"] = report["candidates"] - report["evaluated"]
+    report["saved_ratio"] = round(report["saved"] / report["candidates"], 4) if report["candidates"] else 0.0
+    return report
+
+def rerank_batch(queries: List[str], documents_per_query: List[List[Document]], top_k: int = 4,
+                 min_score: float = 0.3, batch_size: int = 64, use_cache: bool = True,
+                 mode: str = RERANK_MODE, stats: List[Dict[str, Any]] = None) -> List[List[Document]]: # type: ignore
+    """
+    Reranking de plusieurs requêtes : les paires (requête, chunk) de toutes les requêtes absentes du cache
+    passent dans les mêmes appels predict (lots de `batch_size`), puis les scores sont redécoupés par requête.
+    En mode "cascade", chaque tour de la cascade regroupe le lot suivant de toutes les requêtes encore actives.
+    `stats` : si fourni, reçoit (dans l'ordre des requêtes) les paires candidates / évaluées / évitées.
+    """
+    if mode == "cascade":
+        ranked, query_stats = _cascade(queries, documents_per_query, top_k, min_score, CASCADE_BATCH_SIZE,
+                                       CASCADE_PATIENCE, CASCADE_FAISS_MARGIN, use_cache, predict_batch_size=batch_size)
+    else:
+        scores = cross_scores(queries, documents_per_query, batch_size=batch_size, use_cache=use_cache)
+        ranked = [_rank(docs, query_scores, top_k, min_score) if docs else []
+                  for docs, query_scores in zip(documents_per_query, scores)]
+        query_stats = [_full_stats(docs) for docs in documents_per_query]
+    if stats is not None:
+        stats.extend(query_stats)
+    return ranked
+
+
+def _rank_correlation(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Corrélation de Spearman entre deux vecteurs de scores (1.0 : même ordre).
+    """
+    if len(a) < 2:
+        return 1.0
+    ranks_a = np.argsort(np.argsort(a))
+    ranks_b = np.argsort(np.argsort(b))
+    return float(np.corrcoef(ranks_a, ranks_b)[0, 1])
+
+
+def benchmark_reranker_backends(candidates: Sequence[Tuple[str, List[Document]]], backends: Sequence[str] = RERANKER_BACKENDS,
+                                top_k: int = 4, batch_size: int = RERANKER_BATCH_SIZE,
+                                max_length: int = RERANKER_MAX_LENGTH, repeats: int = 3) -> Dict[str, Any]:
+    """
+    Compare les backends du reranker sur des jeux (requête, candidats) :
+        - latence par requête (p50 / p95 / moyenne, en ms)
+        - accord avec le premier backend (référence) : recouvrement du top-k, même top-1, Spearman
+    """
+    raw_scores: Dict[str, List[np.ndarray]] = {}
+    report: Dict[str, Any] = {"queries": len(candidates), "top_k": top_k, "batch_size": batch_size,
+                              "max_length": max_length, "backends": {}}
+
+    for backend in backends:
+        model = get_reranker(backend, max_length)
+        pairs_per_query = [[(query, doc.page_content) for doc in docs] for query, docs in candidates]
+        model.predict(pairs_per_query[0][:1], batch_size=batch_size)  # préchauffage
+
+        latencies, scores = [], []
+        for pairs in pairs_per_query:
+            for _ in range(repeats):
+                start = time.perf_counter()
+                query_scores = np.asarray(model.predict(pairs, batch_size=batch_size), dtype=np.float32)
+                latencies.append(time.perf_counter() - start)
+            scores.append(query_scores)
+        raw_scores[backend] = scores
+
+        latencies_ms = np.array(latencies) * 1000
+        report["backends"][backend] = {
+            "implementation": type(model).__name__,
+            "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+            "mean_ms": round(float(latencies_ms.mean()), 3)
+        }
+
+    reference = backends[0]
+    for backend in backends[1:]:
+        overlaps, top1, correlations = [], [], []
+        for ref, other in zip(raw_scores[reference], raw_scores[backend]):
+            ref_top = set(np.argsort(-ref)[:top_k])
+            other_top = set(np.argsort(-other)[:top_k])
+            overlaps.append(len(ref_top & other_top) / max(len(ref_top), 1))
+            top1.append(float(np.argmax(ref) == np.argmax(other)))
+            correlations.append(_rank_correlation(ref, other))
+        ref_p50 = report["backends"][reference]["p50_ms"]
+        report["backends"][backend].update({
+            "speedup_p50": round(ref_p50 / report["backends"][backend]["p50_ms"], 2) if report["backends"][backend]["p50_ms"] else 0.0,
+            f"top_{top_k}_overlap": round(float(np.mean(overlaps)), 4),
+            "top1_agreement": round(float(np.mean(top1)), 4),
+            "spearman": round(float(np.mean(correlations)), 4)
+        })
+
+    for backend, stats in report["backends"].items():
+        print(f"⚖️ Reranker {backend:>5} : p50 {stats['p50_ms']:.1f} ms | p95 {stats['p95_ms']:.1f} ms"
+              + (f" | ×{stats['speedup_p50']} | top-{top_k} {stats[f'top_{top_k}_overlap']:.2%}"
+                 f" | Spearman {stats['spearman']:.3f}" if backend != reference else " (référence)"))
+    return report
@@ -0,0 +1,175 @@
+# modules/resources.py
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+EMBEDDING_CACHE_DIR = "vector_store/embedding_cache"
+
+
+class ResourceRegistry:
+    """
+    Registre process-wide des ressources lourdes (embedder, index FAISS, reranker, LLM).
+    Chaque ressource est chargée une seule fois puis partagée entre toutes les sessions
+    Streamlit, le script d'ingestion et le feedback.
+    """
+
+    def __init__(self):
+        self._resources: Dict[str, Any] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()  # RLock : un loader peut demander une autre ressource
+
+    def _stat(self, key: str) -> Dict[str, Any]:
+        return self._stats.setdefault(key, {
+            "load_count": 0,
+            "hits": 0,
+            "last_load_time_seconds": 0.0,
+            "total_load_time_seconds": 0.0,
+            "loaded_at": None
+        })
+
+    def get(self, key: str, loader: Callable[[], Any]) -> Any:
+        """
+        Retourne la ressource `key`, en la chargeant via `loader` au premier appel seulement.
+        """
+        with self._lock:
+            if key in self._resources:
+                self._stat(key)["hits"] += 1
+                return self._resources[key]
+
+            print(f"📦 Chargement de la ressource partagée : {key}")
+            start = time.perf_counter()
+            value = loader()
+            elapsed = time.perf_counter() - start
+
+            stat = self._stat(key)
+            stat["load_count"] += 1
+            stat["last_load_time_seconds"] = round(elapsed, 3)
+            stat["total_load_time_seconds"] = round(stat["total_load_time_seconds"] + elapsed, 3)
+            stat["loaded_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            self._resources[key] = value
+            print(f"✅ Ressource {key} chargée en {elapsed:.2f}s")
+            return value
+
+    def set(self, key: str, value: Any):
+        """
+        Remplace une ressource déjà construite (ex : index mis à jour en mémoire) sans la recharger.
+        """
+        with self._lock:
+            self._stat(key)
+            self._resources[key] = value
+
+    def invalidate(self, key: str):
+        """
+        Retire une ressource du registre : elle sera rechargée au prochain `get`.
+        """
+        with self._lock:
+            self._resources.pop(key, None)
+
+    def is_loaded(self, key: str) -> bool:
+        return key in self._resources
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Compteurs de chargement par ressource (nombre de chargements, hits, temps de chargement).
+        """
+        with self._lock:
+            return {
+                key: dict(stat, resident=key in self._resources)
+                for key, stat in self._stats.items()
+            }
+
+
+# Instance globale
+resources = ResourceRegistry()
+
+
+def _index_key(index_path: str) -> str:
+    return f"index:{os.path.abspath(index_path)}"
+
+
+def get_shared_embedding_cache(model_name: str = DEFAULT_EMBEDDING_MODEL) -> Any:
+    """
+    Cache disque des embeddings de chunks pour `model_name`.
+    """
+    from modules.embedding_cache import EmbeddingCache
+    return resources.get(f"embedding_cache:{model_name}", lambda: EmbeddingCache(EMBEDDING_CACHE_DIR, model_name))
+
+
+def get_shared_embedder(model_name: str = DEFAULT_EMBEDDING_MODEL) -> Any:
+    """
+    Encodeur HuggingFace partagé (chargé une seule fois par process), adossé au cache d'embeddings.
+    """
+    def _load():
+        from modules.embedder import get_embedding_model
+        from modules.embedding_cache import CachedEmbeddings
+        return CachedEmbeddings(get_embedding_model(model_name), get_shared_embedding_cache(model_name))
+    return resources.get(f"embedder:{model_name}", _load)
+
+
+def get_shared_index(index_path: str = "vector_store/propales_index") -> Any:
+    """
+    Index FAISS partagé, chargé depuis le disque au premier appel seulement.
+    Rechargé si l'index a été réécrit entre-temps par un autre process (ingestion en ligne de commande).
+    """
+    from modules.vector_store import load_index, index_version
+    key = _index_key(index_path)
+    index = resources.get(key, lambda: load_index(index_path, get_shared_embedder()))
+    if getattr(index, "index_version", None) != index_version(index_path):
+        invalidate_shared_index(index_path)
+        index = resources.get(key, lambda: load_index(index_path, get_shared_embedder()))
+    return index
+
+
+def set_shared_index(index_path: str, index: Any):
+    """
+    Publie une version à jour de l'index (après ajout d'une propale) sans relecture disque.
+    """
+    resources.set(_index_key(index_path), index)
+
+
+def invalidate_shared_index(index_path: str):
+    """
+    Force le rechargement de l'index au prochain appel (après une réindexation)
+    et vide les requêtes en cache pour cet index.
+    """
+    from modules.query_cache import query_cache
+    resources.invalidate(_index_key(index_path))
+    query_cache.invalidate(index_path)
+
+
+def get_shared_reranker(model_name: str = DEFAULT_RERANKER_MODEL, backend: str = "torch",
+                        max_length: int = None) -> Any: # type: ignore
+    """
+    Cross-encoder partagé pour le reranking.
+    `backend` : "torch" (CrossEncoder PyTorch) ou "onnx" (ONNX Runtime, quantifié int8).
+    `max_length` : longueur maximale (tokens) des paires requête/chunk, None = celle du modèle.
+    """
+    def _load_torch():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name, max_length=max_length)
+
+    def _load_onnx():
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            print("⚠️ onnxruntime non installé : reranker PyTorch utilisé.")
+            return get_shared_reranker(model_name, "torch", max_length)
+        from modules.onnx_reranker import OnnxCrossEncoder
+        return OnnxCrossEncoder(model_name, max_length=max_length or 512)
+
+    suffix = f":{max_length}" if max_length else ""
+    if backend == "onnx":
+        return resources.get(f"reranker-onnx:{model_name}{suffix}", _load_onnx)
+    return resources.get(f"reranker:{model_name}{suffix}", _load_torch)
+
+
+def get_shared_llm(model: str = "gpt-3.5-turbo") -> Any:
+    """
+    Client ChatOpenAI partagé.
+    """
+    from modules.llm_openai import get_llm
+    return resources.get(f"llm:{model}", lambda: get_llm(model))
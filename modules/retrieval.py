@@ -0,0 +1,336 @@
+# modules/retrieval.py
+
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+
+from modules.index_factory import filtered_search_params
+from modules.reranker import rerank, FAISS_SCORE_KEY
+from modules.taxonomy import get_taxonomy_tagger
+from modules.metrics_store import MetricsStore, METRICS_DB_PATH, LEGACY_METRICS_FILE
+
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid")
+DEFAULT_RETRIEVAL_MODE = "dense"
+RRF_K = 60  # constante de la reciprocal-rank fusion (valeur usuelle de la littérature)
+TRUNCATED_QUERY_LENGTH = 103  # anciennes métriques : requête coupée à 100 caractères + "..."
+
+
+def query_partition(index: FAISS, query: str, k: int) -> Tuple[List[str], Optional[List[int]]]:
+    """
+    Labels de taxonomie (secteurs) de la requête et positions FAISS de la partition correspondante.
+    (labels, None) : pas de filtrage (requête sans secteur, index non étiqueté ou partition de moins de k chunks).
+    """
+    labels = get_taxonomy_tagger().query_partition(query)
+    lookup = getattr(index.docstore, "positions_for_labels", None)
+    if not labels or lookup is None:
+        return labels, None
+    positions = lookup(labels)
+    if positions is None or len(positions) < k:
+        print(f"🗂️ Partition {labels} trop petite ({0 if positions is None else len(positions)} chunks), recherche sur tout l'index.")
+        return labels, None
+    print(f"🗂️ Partition {labels} : {len(positions)} / {index.index.ntotal} chunks.")
+    return labels, positions
+
+
+def embed_query(index: FAISS, query: str) -> np.ndarray:
+    """
+    Vecteur de la requête (1 x d, float32), normalisé si l'index l'exige.
+    """
+    vector = np.array([index.embedding_function.embed_query(query)], dtype=np.float32) # type: ignore
+    if index._normalize_L2:
+        faiss.normalize_L2(vector)
+    return vector
+
+
+def _hits(index: FAISS, distances: np.ndarray, found: np.ndarray, similarities: Optional[Dict[str, float]],
+          allowed: set = None, k: int = None) -> List[str]: # type: ignore
+    # Similarité croissante avec la proximité, quelle que soit la métrique de l'index
+    sign = 1.0 if index.index.metric_type == faiss.METRIC_INNER_PRODUCT else -1.0
+    ids = []
+    for distance, position in zip(distances, found):
+        if position == -1 or (allowed is not None and position not in allowed):
+            continue
+        if k is not None and len(ids) == k:
+            break
+        doc_id = index.index_to_docstore_id[int(position)]
+        ids.append(doc_id)
+        if similarities is not None:
+            similarities[doc_id] = sign * float(distance)
+    return ids
+
+
+def dense_search(index: FAISS, query: str, k: int, positions: Sequence[int] = None, # type: ignore
+                 vector: np.ndarray = None, similarities: Dict[str, float] = None) -> List[str]: # type: ignore
+    """
+    IDs des k plus proches voisins FAISS de la requête, du plus proche au plus lointain.
+    Avec `positions`, la recherche est restreinte à ces positions (pré-filtrage FAISS).
+    `vector` : vecteur de la requête déjà calculé (cache de requêtes).
+    `similarities` : si fourni, reçoit la similarité FAISS de chaque ID retourné.
+    """
+    if k <= 0 or index.index.ntotal == 0:
+        return []
+    if vector is None:
+        vector = embed_query(index, query)
+    if positions is None:
+        distances, found = index.index.search(vector, min(k, index.index.ntotal))
+        return _hits(index, distances[0], found[0], similarities)
+
+    params, selector = filtered_search_params(index.index, np.asarray(positions))
+    if params is not None:
+        try:
+            distances, found = index.index.search(vector, min(k, len(positions)), params=params)
+            return _hits(index, distances[0], found[0], similarities)
+        except RuntimeError as e:
+            print(f"⚠️ Pré-filtrage FAISS refusé par l'index ({str(e).splitlines()[0]}) : filtrage après coup.")
+    # faiss sans SearchParameters (ou index qui les refuse) : filtrage après coup sur un voisinage élargi
+    distances, found = index.index.search(vector, min(k * 10, index.index.ntotal))
+    return _hits(index, distances[0], found[0], similarities, allowed=set(positions), k=k)
+
+
+def sparse_search(index: FAISS, query: str, k: int, labels: List[str] = None) -> List[str]: # type: ignore
+    """
+    IDs des k meilleurs chunks au sens BM25 (index lexical du docstore SQLite), éventuellement
+    limités aux chunks portant un des `labels`.
+    Vide si l'index n'a pas d'index lexical (ancien format) : le mode hybride retombe alors sur FAISS seul.
+    """
+    search = getattr(index.docstore, "sparse_search", None)
+    if search is None:
+        return []
+    return [doc_id for doc_id, _ in search(query, k, labels=labels)]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], rrf_k: int = RRF_K) -> List[Tuple[str, float]]:
+    """
+    Fusionne plusieurs classements d'IDs : score(id) = Σ 1 / (rrf_k + rang), rang à partir de 1.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def retrieve_ids(index: FAISS, query: str, k: int = 20, mode: str = DEFAULT_RETRIEVAL_MODE,
+                 sparse_k: int = None, partition: bool = False, vector: np.ndarray = None, # type: ignore
+                 similarities: Dict[str, float] = None) -> List[str]: # type: ignore
+    """
+    IDs des k chunks candidats pour le reranking.
+        - "dense"  : FAISS seul
+        - "sparse" : BM25 seul
+        - "hybrid" : top-k FAISS et top-`sparse_k` BM25 fusionnés par RRF, k premiers conservés
+    Avec `partition=True`, la recherche est limitée aux chunks du secteur détecté dans la requête
+    (tout l'index si la partition donne moins de k résultats).
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Mode de recherche inconnu : {mode} (attendu : {', '.join(RETRIEVAL_MODES)})")
+    labels, positions = query_partition(index, query, k) if partition else ([], None)
+    if positions is None:
+        labels = []
+    dense_ids = dense_search(index, query, k, positions, vector, similarities) if mode != "sparse" else []
+    if positions is not None and mode != "sparse" and len(dense_ids) < k:
+        labels, dense_ids = _unpartitioned(index, query, k, labels, dense_ids, vector, similarities)
+    return _combine(index, query, mode, k, sparse_k, labels, dense_ids)
+
+
+def _unpartitioned(index: FAISS, query: str, k: int, labels: List[str], dense_ids: List[str],
+                   vector: np.ndarray = None, similarities: Dict[str, float] = None) -> Tuple[List[str], List[str]]: # type: ignore
+    # Moins de k résultats dans la partition (filtrage après coup) : recherche sur tout l'index
+    print(f"🗂️ Partition {labels} : {len(dense_ids)} résultats sur {k}, recherche sur tout l'index.")
+    if similarities is not None:
+        similarities.clear()
+    return [], dense_search(index, query, k, None, vector, similarities)
+
+
+def _combine(index: FAISS, query: str, mode: str, k: int, sparse_k: Optional[int],
+             labels: List[str], dense_ids: List[str]) -> List[str]:
+    if mode == "dense":
+        return dense_ids
+    if mode == "sparse":
+        return sparse_search(index, query, k, labels)
+    sparse_ids = sparse_search(index, query, sparse_k or k, labels)
+    return [doc_id for doc_id, _ in reciprocal_rank_fusion([dense_ids, sparse_ids])[:k]]
+
+
+def embed_queries(index: FAISS, queries: Sequence[str]) -> np.ndarray:
+    """
+    Vecteurs de plusieurs requêtes en un seul passage du modèle (n x d, float32).
+    """
+    # Encodeur de base : les requêtes ne passent pas par le cache disque des chunks
+    embedder = getattr(index.embedding_function, "base", index.embedding_function)
+    vectors = np.array(embedder.embed_documents(list(queries)), dtype=np.float32).reshape(len(queries), -1) # type: ignore
+    if index._normalize_L2:
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def retrieve_ids_batch(index: FAISS, queries: Sequence[str], vectors: np.ndarray, k: int = 20,
+                       mode: str = DEFAULT_RETRIEVAL_MODE, sparse_k: int = None, # type: ignore
+                       partition: bool = False, similarities: List[Dict[str, float]] = None) -> List[List[str]]: # type: ignore
+    """
+    `retrieve_ids` pour plusieurs requêtes : une seule recherche FAISS multi-vecteurs pour toutes
+    les requêtes sans partition (les requêtes partitionnées gardent leur recherche filtrée).
+    `similarities` : si fourni, reçoit (dans l'ordre des requêtes) la similarité FAISS de chaque ID retourné.
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Mode de recherche inconnu : {mode} (attendu : {', '.join(RETRIEVAL_MODES)})")
+    partitions = [query_partition(index, query, k) if partition else ([], None) for query in queries]
+
+    query_similarities: List[Dict[str, float]] = [{} for _ in queries]
+    if similarities is not None:
+        similarities.extend(query_similarities)
+    dense_ids: List[List[str]] = [[] for _ in queries]
+    if mode != "sparse" and k > 0 and index.index.ntotal:
+        plain = [i for i, (_, positions) in enumerate(partitions) if positions is None]
+        if plain:
+            distances, found = index.index.search(np.ascontiguousarray(vectors[plain]), min(k, index.index.ntotal))
+            for i, row_distances, row in zip(plain, distances, found):
+                dense_ids[i] = _hits(index, row_distances, row, query_similarities[i])
+        for i, (labels, positions) in enumerate(partitions):
+            if positions is not None:
+                dense_ids[i] = dense_search(index, queries[i], k, positions, vectors[i:i + 1], query_similarities[i])
+                if len(dense_ids[i]) < k:
+                    labels, dense_ids[i] = _unpartitioned(index, queries[i], k, labels, dense_ids[i], vectors[i:i + 1],
+                                                          query_similarities[i])
+                    partitions[i] = (labels, None)
+
+    return [
+        _combine(index, query, mode, k, sparse_k, labels if positions is not None else [], ids)
+        for query, (labels, positions), ids in zip(queries, partitions, dense_ids)
+    ]
+
+
+def stored_vectors(index: FAISS, doc_ids: Sequence[str]) -> Optional[np.ndarray]:
+    """
+    Vecteurs des chunks tels que stockés dans l'index FAISS (n x d, float32), sans repasser par le modèle.
+    Approchés pour un stockage quantifié (fp16 / sq8 / pq). None si un chunk n'a pas de position
+    ou si l'index ne sait pas reconstruire ses vecteurs (IVF sans table directe).
+    """
+    if not doc_ids:
+        return None
+    lookup = getattr(index.docstore, "positions_for_ids", None)
+    if lookup is not None:
+        positions = lookup(list(doc_ids))
+    else:
+        position_of = {doc_id: position for position, doc_id in index.index_to_docstore_id.items()}
+        positions = [position_of.get(doc_id) for doc_id in doc_ids]
+    if any(position is None for position in positions):
+        return None
+    try:
+        return np.asarray(index.index.reconstruct_batch(np.asarray(positions, dtype=np.int64)), dtype=np.float32)
+    except RuntimeError:
+        return None
+
+
+def documents_by_id(index: FAISS, ids: Iterable[str], similarities: Dict[str, float] = None) -> List[Document]: # type: ignore
+    """
+    Documents du docstore pour ces IDs (dans l'ordre), avec `doc.id` renseigné.
+    Avec `similarities`, les candidats issus de FAISS portent leur similarité dans `metadata["faiss_score"]`.
+    """
+    docs = []
+    for doc_id in ids:
+        doc = index.docstore.search(doc_id)
+        if isinstance(doc, Document):
+            doc.id = doc_id
+            if similarities and doc_id in similarities:
+                doc.metadata[FAISS_SCORE_KEY] = similarities[doc_id]
+            docs.append(doc)
+    return docs
+
+
+def retrieve(index: FAISS, query: str, k: int = 20, mode: str = DEFAULT_RETRIEVAL_MODE,
+             sparse_k: int = None, partition: bool = False, vector: np.ndarray = None) -> List[Document]: # type: ignore
+    """
+    Chunks candidats (Documents) pour la requête, selon le mode de recherche.
+    Les candidats issus de FAISS portent leur similarité dans `metadata["faiss_score"]`.
+    """
+    similarities: Dict[str, float] = {}
+    return documents_by_id(index, retrieve_ids(index, query, k, mode, sparse_k, partition, vector, similarities), similarities)
+
+
+def _percentile_ms(seconds: List[float], q: float) -> float:
+    return round(float(np.percentile(np.array(seconds) * 1000, q)), 3) if seconds else 0.0
+
+
+def queries_from_metrics(path: str = METRICS_DB_PATH, limit: int = 50) -> List[str]:
+    """
+    Requêtes distinctes de l'historique des métriques, pour le benchmark de recherche.
+    Les anciennes lignes, tronquées à 100 caractères + "...", sont ignorées.
+    """
+    if not os.path.exists(path) and not os.path.exists(LEGACY_METRICS_FILE):
+        return []
+    queries = [query for query in MetricsStore(path).recent_queries(limit)
+               if not (len(query) == TRUNCATED_QUERY_LENGTH and query.endswith("..."))]
+    return list(dict.fromkeys(queries))
+
+
+def benchmark_retrieval(index: FAISS, queries: List[str], k_values: Sequence[int] = (4, 8, 12, 16, 20),
+                        modes: Sequence[str] = ("dense", "hybrid"), reference_k: int = 20,
+                        final_k: int = 4, target_recall: float = 0.95) -> dict:
+    """
+    Mesure si le mode hybride permet de baisser faiss_k sans perdre de rappel.
+
+    Référence par requête : les `final_k` chunks que le reranker retient parmi le top-`reference_k`
+    FAISS et le top-`reference_k` BM25 réunis (ce qu'il choisirait avec un large pool de candidats).
+    Pour chaque (mode, k), le rappel est la part de ces chunks présente parmi les k candidats ;
+    le temps de reranking des k candidats est mesuré.
+    """
+    references = {}
+    for query in queries:
+        pool = retrieve_ids(index, query, reference_k, "dense") + retrieve_ids(index, query, reference_k, "sparse")
+        candidates = documents_by_id(index, dict.fromkeys(pool))
+        reranked = rerank(query, candidates, top_k=final_k, use_cache=False) if candidates else []
+        references[query] = {doc.id for doc, _ in reranked}
+
+    rows = []
+    for mode in modes:
+        for k in k_values:
+            recalls, retrieval_times, rerank_times = [], [], []
+            for query in queries:
+                start = time.perf_counter()
+                docs = retrieve(index, query, k, mode)
+                retrieval_times.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                if docs:
+                    rerank(query, docs, top_k=final_k, use_cache=False)
+                rerank_times.append(time.perf_counter() - start)
+
+                reference = references[query]
+                if reference:
+                    recalls.append(len(reference & {doc.id for doc in docs}) / len(reference))
+
+            rows.append({
+                "mode": mode,
+                "k": k,
+                "recall": round(float(np.mean(recalls)), 4) if recalls else 0.0,
+                "retrieval_p50_ms": _percentile_ms(retrieval_times, 50),
+                "rerank_p50_ms": _percentile_ms(rerank_times, 50),
+                "rerank_p99_ms": _percentile_ms(rerank_times, 99)
+            })
+
+    # Plus petit k atteignant le rappel cible, par mode
+    min_k = {}
+    for mode in modes:
+        reaching = [row["k"] for row in rows if row["mode"] == mode and row["recall"] >= target_recall]
+        min_k[mode] = min(reaching) if reaching else None
+
+    print(f"📊 Benchmark de recherche sur {len(queries)} requêtes (référence : rerank top {final_k} sur dense + BM25 k={reference_k})")
+    for row in rows:
+        print(f"   {row['mode']:<7} k={row['k']:<3} rappel={row['recall']:.3f} "
+              f"recherche p50={row['retrieval_p50_ms']:.1f}ms rerank p50={row['rerank_p50_ms']:.1f}ms")
+    for mode, k in min_k.items():
+        print(f"🎯 {mode} : k minimal pour un rappel ≥ {target_recall} = {k if k is not None else 'non atteint'}")
+
+    return {
+        "num_queries": len(queries),
+        "reference_k": reference_k,
+        "final_k": final_k,
+        "target_recall": target_recall,
+        "results": rows,
+        "min_k": min_k
+    }
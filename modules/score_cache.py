@@ -0,0 +1,135 @@
+# modules/score_cache.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Tuple
+
+from modules.query_cache import normalize_query
+
+RERANK_CACHE_PATH = "vector_store/rerank_scores.sqlite"
+DEFAULT_RERANK_CACHE_SIZE = 200000
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+class RerankScoreCache:
+    """
+    Cache persistant (SQLite) des logits bruts du cross-encoder, indexé par
+    (hash de la requête, ID du chunk, modèle). Les IDs des chunks dépendent de leur contenu :
+    un score en cache reste valable tant que le chunk existe, même après une réindexation.
+    Au-delà de `maxsize` paires, les moins récemment utilisées sont supprimées.
+    """
+
+    def __init__(self, path: str = RERANK_CACHE_PATH, maxsize: int = DEFAULT_RERANK_CACHE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._conn = None
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS rerank_scores (
+                    query_hash TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (query_hash, chunk_id, model)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rerank_scores_last_used ON rerank_scores(last_used)")
+            self._size = self._conn.execute("SELECT COUNT(*) FROM rerank_scores").fetchone()[0]
+        return self._conn
+
+    def get_many(self, query: str, chunk_ids: Iterable[str], model: str) -> Dict[str, float]:
+        """
+        Logits en cache pour les chunks de `chunk_ids` (les absents ne figurent pas dans le résultat).
+        """
+        chunk_ids = list(dict.fromkeys(chunk_ids))
+        if not self.enabled or not chunk_ids:
+            return {}
+        key = query_hash(query)
+        with self._lock:
+            conn = self._connection()
+            placeholders = ",".join("?" * len(chunk_ids))
+            rows = conn.execute(
+                f"SELECT chunk_id, score FROM rerank_scores WHERE query_hash = ? AND model = ? AND chunk_id IN ({placeholders})",
+                [key, model, *chunk_ids]
+            ).fetchall()
+            found = dict(rows)
+            if found:
+                conn.executemany(
+                    "UPDATE rerank_scores SET last_used = ? WHERE query_hash = ? AND chunk_id = ? AND model = ?",
+                    [(time.time(), key, chunk_id, model) for chunk_id in found]
+                )
+                conn.commit()
+            self.hits += len(found)
+            self.misses += len(chunk_ids) - len(found)
+            return found
+
+    def put_many(self, query: str, scores: List[Tuple[str, float]], model: str):
+        if not self.enabled or not scores:
+            return
+        key = query_hash(query)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO rerank_scores (query_hash, chunk_id, model, score, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(key, chunk_id, model, float(score), now) for chunk_id, score in scores]
+            )
+            self._size += conn.total_changes - before
+            # Éviction par paquets (10 %) pour ne pas supprimer à chaque insertion
+            if self._size > self.maxsize:
+                excess = self._size - self.maxsize + max(self.maxsize // 10, 1)
+                conn.execute(
+                    "DELETE FROM rerank_scores WHERE (query_hash, chunk_id, model) IN "
+                    "(SELECT query_hash, chunk_id, model FROM rerank_scores ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self.evictions += excess
+                self._size -= excess
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM rerank_scores")
+            conn.commit()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions
+        }
+
+
+# Instance globale (partagée par toutes les sessions Streamlit du process) ; taille 0 : cache désactivé
+rerank_score_cache = RerankScoreCache(
+    path=os.getenv("SKILLIA_RERANK_CACHE_PATH", RERANK_CACHE_PATH),
+    maxsize=int(os.getenv("SKILLIA_RERANK_CACHE_SIZE", DEFAULT_RERANK_CACHE_SIZE))
+)
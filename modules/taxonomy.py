@@ -0,0 +1,128 @@
+# modules/taxonomy.py
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Set
+
+from langchain.schema import Document
+
+from modules.keyword_matcher import KeywordAutomaton, normalize_text
+from modules.resources import resources
+
+TAXONOMY_PATH = "config/taxonomie.json"
+TAXONOMY_METADATA_KEY = "taxonomy"
+LABEL_SEPARATOR = " > "
+
+# Catégories qui partitionnent le corpus : un chunk hérite de celles de tout son document
+PARTITION_CATEGORIES = ("Secteurs d'activité",)
+# Une requête n'est restreinte à un secteur que sur un mot-clé de plusieurs mots (« transport ferroviaire »)
+# ou sur au moins ce nombre de mots-clés distincts du secteur : un mot générique seul (« port », « train »,
+# « administration ») ne suffit pas
+QUERY_PARTITION_MIN_KEYWORDS = int(os.getenv("SKILLIA_PARTITION_MIN_KEYWORDS", "2"))
+
+
+def load_taxonomy(path: str = TAXONOMY_PATH) -> Dict[str, Dict[str, List[str]]]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _file_version(path: str) -> str:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return ""
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def taxonomy_hash(path: str = TAXONOMY_PATH) -> str:
+    """
+    Empreinte de la taxonomie : une modification déclenche le ré-étiquetage à la prochaine ingestion.
+    """
+    if not os.path.exists(path):
+        return ""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class TaxonomyTagger:
+    """
+    Étiquette un texte avec les labels de la taxonomie (« Catégorie > Label ») dont un mot-clé
+    apparaît dans le texte. Tous les mots-clés sont cherchés en une seule passe (Aho-Corasick).
+    """
+
+    def __init__(self, taxonomy: Dict[str, Dict[str, List[str]]], partition_categories: Iterable[str] = PARTITION_CATEGORIES):
+        keywords: Dict[str, List[str]] = {}
+        for category, labels in taxonomy.items():
+            for label, words in labels.items():
+                for word in words:
+                    keywords.setdefault(word, []).append(f"{category}{LABEL_SEPARATOR}{label}")
+        self._automaton = KeywordAutomaton(keywords)
+        self.partition_prefixes = tuple(f"{category}{LABEL_SEPARATOR}" for category in partition_categories)
+
+    def tag(self, text: str) -> List[str]:
+        return sorted(self._automaton.find(text))
+
+    def partition_labels(self, labels: Iterable[str]) -> List[str]:
+        return sorted(label for label in labels if label.startswith(self.partition_prefixes))
+
+    def tag_documents(self, documents: List[Document]) -> List[Document]:
+        """
+        Étiquette les chunks d'un même document : labels propres à chaque chunk, plus les labels
+        de partition (secteur) trouvés n'importe où dans le document.
+        """
+        own_labels = [self.tag(doc.page_content) for doc in documents]
+        document_partition = set(self.partition_labels(label for labels in own_labels for label in labels))
+        for doc, labels in zip(documents, own_labels):
+            doc.metadata[TAXONOMY_METADATA_KEY] = sorted(document_partition.union(labels))
+        return documents
+
+    def query_partition(self, query: str, min_keywords: int = QUERY_PARTITION_MIN_KEYWORDS) -> List[str]:
+        """
+        Labels de partition de la requête (vide : la recherche porte sur tout le corpus).
+        Un label n'est retenu que sur un mot-clé de plusieurs mots ou `min_keywords` mots-clés distincts.
+        """
+        keywords: Dict[str, Set[str]] = {}
+        strong: Set[str] = set()
+        normalized = normalize_text(query)
+        for start, end, values in self._automaton.matches(query):
+            keyword = normalized[start:end]
+            for label in self.partition_labels(values):
+                keywords.setdefault(label, set()).add(keyword)
+                if " " in keyword or "-" in keyword:
+                    strong.add(label)
+        return sorted(label for label, found in keywords.items() if label in strong or len(found) >= min_keywords)
+
+
+def get_taxonomy_tagger(path: str = TAXONOMY_PATH) -> TaxonomyTagger:
+    """
+    Étiqueteur partagé, reconstruit seulement si le fichier de taxonomie change (date et taille).
+    """
+    def _load() -> TaxonomyTagger:
+        tagger = TaxonomyTagger(load_taxonomy(path))
+        tagger.file_version = version
+        return tagger
+
+    key = f"taxonomy:{path}"
+    version = _file_version(path)
+    tagger = resources.get(key, _load)
+    if getattr(tagger, "file_version", None) != version:
+        # Une seule instance par fichier : l'ancienne est remplacée, pas gardée en mémoire
+        tagger = _load()
+        resources.set(key, tagger)
+    return tagger
+
+
+def tag_by_source(documents: List[Document], tagger: TaxonomyTagger = None) -> List[Document]: # type: ignore
+    """
+    Étiquette des chunks de plusieurs documents, regroupés par `source`.
+    """
+    tagger = tagger or get_taxonomy_tagger()
+    by_source: Dict[str, List[Document]] = {}
+    for doc in documents:
+        by_source.setdefault(str(doc.metadata.get("source")), []).append(doc)
+    for docs in by_source.values():
+        tagger.tag_documents(docs)
+    return documents
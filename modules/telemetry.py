@@ -0,0 +1,290 @@
+# modules/telemetry.py
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from modules.metrics_store import LATENCY_EDGES
+from modules.timing import RequestTimings, stage_histograms
+from modules.resources import resources
+from modules.query_cache import query_cache
+from modules.answer_cache import answer_cache
+from modules.score_cache import rerank_score_cache
+
+# Exporteur Prometheus : désactivé tant que SKILLIA_PROMETHEUS_PORT n'est pas défini
+PROMETHEUS_PORT = os.getenv("SKILLIA_PROMETHEUS_PORT", "")
+PROMETHEUS_HOST = os.getenv("SKILLIA_PROMETHEUS_HOST", "127.0.0.1")
+# Traces (une ligne JSON par span, format proche d'OTLP/JSON) : désactivées si SKILLIA_TRACE_FILE est vide
+TRACE_FILE = os.getenv("SKILLIA_TRACE_FILE", "")
+SERVICE_NAME = "skillia-rag"
+
+# Bornes exportées : une borne sur cinq des histogrammes internes (~4 par décade, de 1 ms à 1000 s)
+LATENCY_BUCKETS = tuple(float(edge) for edge in LATENCY_EDGES[1::5])
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _histogram_lines(name: str, labels: Dict[str, Any], buckets: Sequence[float],
+                     cumulative: Sequence[int], total: float, count: int) -> List[str]:
+    lines = [f"{name}_bucket{_format_labels({**labels, 'le': repr(float(bound))})} {cumulative[i]}"
+             for i, bound in enumerate(buckets)]
+    lines.append(f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return lines
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[Tuple[str, Any], ...], Any] = {}
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(dict(key))} {_format_value(value)}" for key, value in values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float]):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            state = self._values.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = {key: dict(state, counts=list(state["counts"])) for key, state in self._values.items()}
+        lines = []
+        for key, state in values.items():
+            cumulative, running = [], 0
+            for count in state["counts"]:
+                running += count
+                cumulative.append(running)
+            lines += _histogram_lines(self.name, dict(key), self.buckets, cumulative, state["sum"], state["count"])
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Métriques du process au format texte Prometheus : métriques alimentées par le pipeline
+    et collecteurs lus au moment du scrape (caches, histogrammes des étapes).
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def register(self, metric: _Metric) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[str]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            samples = metric.render()
+            if samples:
+                lines += metric.header() + samples
+        for collector in self._collectors:
+            try:
+                lines += collector()
+            except Exception as e:
+                print(f"⚠️ Collecteur de métriques en erreur : {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+requests_total = registry.register(Counter(
+    "skillia_requests_total", "Requêtes RAG traitées, par pipeline et statut."))
+request_duration = registry.register(Histogram(
+    "skillia_request_duration_seconds", "Durée totale des requêtes RAG.", LATENCY_BUCKETS))
+llm_tokens_total = registry.register(Counter(
+    "skillia_llm_tokens_total", "Tokens envoyés au LLM (prompt) et générés (completion)."))
+index_vectors = registry.register(Gauge(
+    "skillia_index_vectors", "Vecteurs dans l'index FAISS chargé."))
+reranker_batch_size = registry.register(Histogram(
+    "skillia_reranker_batch_size", "Paires (requête, chunk) par appel du cross-encoder.", BATCH_SIZE_BUCKETS))
+feedback_total = registry.register(Counter(
+    "skillia_feedback_total", "Propositions enregistrées pour le feedback, par statut."))
+
+
+def _collect_stage_latency() -> List[str]:
+    name = "skillia_stage_duration_seconds"
+    lines = [f"# HELP {name} Durée des étapes du pipeline RAG.", f"# TYPE {name} histogram"]
+    for stage, (counts, total) in stage_histograms.snapshot().items():
+        # La borne exportée n°i est LATENCY_EDGES[1 + 5 i] : cumul des classes situées en dessous
+        cumulative = [int(counts[:1 + 5 * i].sum()) for i in range(len(LATENCY_BUCKETS))]
+        lines += _histogram_lines(name, {"stage": stage}, LATENCY_BUCKETS, cumulative, total, int(counts.sum()))
+    return lines
+
+
+def _collect_caches() -> List[str]:
+    answer_stats = answer_cache.stats()
+    caches = {
+        "query": query_cache.stats(),
+        "answer": dict(answer_stats, misses=answer_stats["lookups"] - answer_stats["hits"]),
+        "rerank_score": rerank_score_cache.stats()
+    }
+    lines = []
+    for metric, documentation, key in (("skillia_cache_hits_total", "Hits des caches.", "hits"),
+                                       ("skillia_cache_misses_total", "Misses des caches.", "misses")):
+        lines += [f"# HELP {metric} {documentation}", f"# TYPE {metric} counter"]
+        lines += [f"{metric}{_format_labels({'cache': cache})} {stats.get(key, 0)}" for cache, stats in caches.items()]
+    loads = "skillia_resource_loads_total"
+    lines += [f"# HELP {loads} Chargements des ressources partagées (modèles, index).", f"# TYPE {loads} counter"]
+    lines += [f"{loads}{_format_labels({'resource': key})} {stat['load_count']}" for key, stat in resources.stats().items()]
+    return lines
+
+
+registry.add_collector(_collect_stage_latency)
+registry.add_collector(_collect_caches)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # pas de ligne par scrape dans la console
+
+
+def start_exporter(port: str = PROMETHEUS_PORT, host: str = PROMETHEUS_HOST) -> Optional[ThreadingHTTPServer]:
+    """
+    Démarre (une fois par process) le endpoint http://<host>:<port>/metrics. Sans port : rien.
+    """
+    if not port:
+        return None
+
+    def _start():
+        try:
+            server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+        except OSError as e:
+            print(f"⚠️ Exporteur Prometheus non démarré sur {host}:{port} : {e}")
+            return None
+        threading.Thread(target=server.serve_forever, name="prometheus-exporter", daemon=True).start()
+        print(f"📡 Métriques Prometheus sur http://{host}:{server.server_address[1]}/metrics")
+        return server
+    return resources.get(f"prometheus_exporter:{host}:{port}", _start)
+
+
+class TraceWriter:
+    """
+    Spans des requêtes en JSON, une ligne par span (trace_id, span_id, parent_span_id, nom, début/fin
+    en ns, attributs, statut), lisibles par un collecteur OpenTelemetry local (récepteur de fichiers).
+    """
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def write(self, timings: RequestTimings, status: str, end_ns: int):
+        # Les étapes faites après la réponse (métriques en arrière-plan) peuvent finir après la requête
+        end_ns = max([end_ns] + [stage_end_ns for _, _, stage_end_ns in timings.spans])
+        trace_id = os.urandom(16).hex()
+        root_id = os.urandom(8).hex()
+        code = "OK" if status == "ok" else "ERROR"
+        base = {"trace_id": trace_id, "resource": {"service.name": SERVICE_NAME}}
+        spans = [{
+            **base, "span_id": root_id, "parent_span_id": None, "name": timings.name,
+            "start_time_unix_nano": timings.start_ns, "end_time_unix_nano": end_ns,
+            "attributes": dict(timings.attributes, **{"rag.status": status}), "status": {"code": code}
+        }]
+        spans += [{
+            **base, "span_id": os.urandom(8).hex(), "parent_span_id": root_id, "name": f"rag.{stage}",
+            "start_time_unix_nano": start_ns, "end_time_unix_nano": stage_end_ns,
+            "attributes": {}, "status": {"code": "OK"}
+        } for stage, start_ns, stage_end_ns in timings.spans]
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(span, ensure_ascii=False) + "\n" for span in spans))
+
+
+# Instance globale
+trace_writer = TraceWriter()
+
+
+def end_request(timings: RequestTimings, status: str, processing_time: float):
+    """
+    Fin d'une requête : compteurs, durée, tokens LLM (attributs llm.*_tokens) et trace si activée.
+    Pour une requête réussie, appelée par le thread d'écriture des métriques après le calcul des scores
+    (la trace contient l'étape "metrics").
+    """
+    requests_total.inc(pipeline=timings.name, status=status)
+    request_duration.observe(processing_time, pipeline=timings.name)
+    for kind in ("prompt", "completion"):
+        tokens = timings.attributes.get(f"llm.{kind}_tokens")
+        if tokens:
+            llm_tokens_total.inc(tokens, kind=kind)
+    if trace_writer.enabled:
+        try:
+            trace_writer.write(timings, status, time.time_ns())
+        except OSError as e:
+            print(f"⚠️ Erreur écriture de la trace : {e}")
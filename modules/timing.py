@@ -0,0 +1,107 @@
+# modules/timing.py
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from modules.metrics_store import LATENCY_EDGES, PERCENTILES, histogram_percentile
+
+# Étapes du pipeline, dans l'ordre d'exécution
+STAGES = ("index_load", "embedding", "search", "rerank", "context", "llm", "metrics")
+STAGE_LABELS = {
+    "index_load": "Chargement de l'index",
+    "embedding": "Embedding de la requête",
+    "search": "Recherche FAISS / BM25",
+    "rerank": "Reranking",
+    "context": "Construction du contexte",
+    "llm": "Génération LLM",
+    "metrics": "Scores des métriques"
+}
+
+
+def stage_field(stage: str) -> str:
+    """
+    Nom du champ d'un enregistrement de métriques pour la durée d'une étape (agrégé par le store).
+    """
+    return f"stage_{stage}_seconds"
+
+
+class StageHistograms:
+    """
+    Histogrammes en mémoire des durées par étape (bornes fixes, comme les agrégats du store) :
+    p50 / p95 / p99 depuis le démarrage du process, sans conserver les mesures.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, np.ndarray] = {}
+        self._totals: Dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float):
+        position = int(np.clip(np.searchsorted(LATENCY_EDGES, seconds, side="right") - 1, 0, len(LATENCY_EDGES) - 2))
+        with self._lock:
+            counts = self._counts.setdefault(stage, np.zeros(len(LATENCY_EDGES) - 1, dtype=np.int64))
+            counts[position] += 1
+            self._totals[stage] = self._totals.get(stage, 0.0) + seconds
+
+    def snapshot(self) -> Dict[str, Tuple[np.ndarray, float]]:
+        """
+        {étape: (effectifs par classe de LATENCY_EDGES, somme des durées)}.
+        """
+        with self._lock:
+            return {stage: (counts.copy(), self._totals[stage]) for stage, counts in self._counts.items()}
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for stage, (counts, total) in self.snapshot().items():
+            count = int(counts.sum())
+            stats = {"count": count, "mean": round(total / count, 4) if count else 0.0, "total": round(total, 4)}
+            for q in PERCENTILES:
+                stats[f"p{q}"] = round(histogram_percentile(counts.tolist(), LATENCY_EDGES, q), 4)
+            result[stage] = stats
+        return result
+
+
+# Instance globale (partagée par toutes les sessions Streamlit du process)
+stage_histograms = StageHistograms()
+
+
+class RequestTimings:
+    """
+    Durées des étapes d'une requête (secondes). Chaque mesure alimente aussi `stage_histograms`.
+    `spans` (étape, début, fin en ns depuis l'epoch) et `attributes` servent à la trace de la requête
+    (modules/telemetry.py).
+    """
+
+    def __init__(self, name: str = "rag.request"):
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.stages: Dict[str, float] = {}
+        self.spans: List[Tuple[str, int, int]] = []
+        self.attributes: Dict[str, Any] = {}
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage: str, seconds: float):
+        """
+        Ajoute une étape qui vient de se terminer et a duré `seconds`.
+        """
+        end_ns = time.time_ns()
+        self.spans.append((stage, end_ns - int(seconds * 1e9), end_ns))
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        stage_histograms.observe(stage, seconds)
+
+    def fields(self) -> Dict[str, Any]:
+        """
+        Champs à enregistrer avec les métriques de la requête.
+        """
+        return {stage_field(stage): round(seconds, 4) for stage, seconds in self.stages.items()}
@@ -7,35 +7,117 @@ import os
 from langchain.docstore.document import Document
 from langchain.vectorstores import FAISS
 from modules.loader import load_pdf 
-from modules.embedder import get_embedding_model
+from modules.resources import get_shared_embedder, invalidate_shared_index
+from modules.manifest import file_hash, relative_key, make_chunk_ids, load_manifest, save_manifest, record_file
+from modules.docstore import has_sqlite_docstore, write_docstore, SQLiteDocstore, SQLiteIndexToDocstoreId
+from modules.index_factory import make_faiss_index
+from modules.taxonomy import get_taxonomy_tagger
+from modules.keyword_boosts import get_keyword_booster
+from langchain_community.docstore.in_memory import InMemoryDocstore
 import datetime
+import uuid
+import faiss
+import numpy as np
 from fpdf import FPDF
 import datetime
 
 
-def build_faiss_index(documents: list[Document], embedding_model: HuggingFaceEmbeddings) -> FAISS:
+def build_faiss_index(documents: list[Document], embedding_model: HuggingFaceEmbeddings, ids: list[str] = None, # type: ignore
+                      index_type: str = "flat", index_params: dict = None) -> FAISS: # type: ignore
     """
     Crée un index FAISS à partir des chunks vectorisés.
+    Les `ids` (optionnels) permettent de retirer plus tard les chunks d'un fichier.
+    `index_type` : "flat" (exact), "ivf_flat" ou "hnsw" (approchés), réglés par `index_params`,
+    qui choisit aussi le stockage des vecteurs (quantization="fp16" / "sq8" / "pq", rescore=True).
     """
-    return FAISS.from_documents(documents, embedding_model) 
-    #vectorise tous les documents (chunks) automatiquement
-    #stocke dans un index FAISS les vecteurs + le contenu texte original
+    if index_type == "flat" and not index_params:
+        return FAISS.from_documents(documents, embedding_model, ids=ids) 
+        #vectorise tous les documents (chunks) automatiquement
+        #stocke dans un index FAISS les vecteurs + le contenu texte original
+
+    ids = ids or [str(uuid.uuid4()) for _ in documents]
+    vectors = np.array(embedding_model.embed_documents([doc.page_content for doc in documents]), dtype=np.float32)
+    return FAISS(
+        embedding_function=embedding_model,
+        index=make_faiss_index(vectors, index_type, index_params),
+        docstore=InMemoryDocstore(dict(zip(ids, documents))),
+        index_to_docstore_id=dict(enumerate(ids))
+    )
+
+def index_vectors(index: FAISS) -> np.ndarray:
+    """
+    Vecteurs exacts de tous les chunks de l'index, dans l'ordre des positions FAISS
+    (relus dans le cache d'embeddings, sans repasser par le modèle).
+    """
+    texts = [index.docstore.search(index.index_to_docstore_id[i]).page_content for i in range(index.index.ntotal)] # type: ignore
+    return np.array(index.embedding_function.embed_documents(texts), dtype=np.float32) # type: ignore
 
 def save_index(index: FAISS, path: str):
     """
-    Sauvegarde l’index FAISS localement.
+    Sauvegarde l’index FAISS localement, au format « memory-map » :
+    index.faiss (vecteurs) + docstore.sqlite (textes et métadonnées, indexés par ID).
+    Un index chargé avec mmap=False n'écrit que les chunks ajoutés / retirés depuis son chargement.
+    Remplace l'ancien index.pkl, qui obligeait à tout désérialiser au chargement.
     """
-    index.save_local(path)
+    os.makedirs(path, exist_ok=True)
+    ids = [index.index_to_docstore_id[i] for i in range(index.index.ntotal)]
+    write_docstore(path, ids, index.docstore)
+
+    faiss_path = os.path.join(path, "index.faiss")
+    faiss.write_index(index.index, faiss_path + ".tmp")
+    os.replace(faiss_path + ".tmp", faiss_path)
 
-def load_index(path: str, embedding_model: HuggingFaceEmbeddings) -> FAISS:
+    legacy_path = os.path.join(path, "index.pkl")
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+
+def index_version(path: str) -> str:
     """
-    Recharge un index FAISS depuis le disque, avec validation explicite de la désérialisation.
+    Version de l'index sur disque (date de modification + taille de index.faiss / index.pkl) :
+    change à chaque sauvegarde, y compris par un autre process.
     """
-    return FAISS.load_local(
-        path,
-        embedding_model,
-        allow_dangerous_deserialization=True  
+    for filename in ("index.faiss", "index.pkl"):
+        file_path = os.path.join(path, filename)
+        if os.path.exists(file_path):
+            stat = os.stat(file_path)
+            return f"{stat.st_mtime_ns}-{stat.st_size}"
+    return ""
+
+def _faiss_read_flags(mmap: bool) -> int:
+    # IO_FLAG_MMAP_IFC (faiss >= 1.8) : vecteurs mappés sans copie ; absent => lecture classique
+    if mmap and hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+    return 0
+
+def load_index(path: str, embedding_model: HuggingFaceEmbeddings, mmap: bool = True) -> FAISS:
+    """
+    Recharge un index FAISS depuis le disque.
+
+    Format memory-map : les vecteurs sont mappés (pas de copie en RAM) et les textes ne sont lus
+    dans SQLite qu'à la demande, pour les seuls chunks retournés par la recherche. Un index chargé avec
+    mmap=True est en lecture seule ; les chemins d'écriture (ingestion, feedback) utilisent mmap=False.
+    L'ancien format index.pkl reste lisible (désérialisation complète).
+    """
+    version = index_version(path)
+    if not has_sqlite_docstore(path):
+        index = FAISS.load_local(
+            path,
+            embedding_model,
+            allow_dangerous_deserialization=True  
+        )
+        index.index_version = version # type: ignore
+        return index
+
+    faiss_index = faiss.read_index(os.path.join(path, "index.faiss"), _faiss_read_flags(mmap))
+    docstore = SQLiteDocstore(path, read_only=mmap)
+    index = FAISS(
+        embedding_function=embedding_model,
+        index=faiss_index,
+        docstore=docstore,
+        index_to_docstore_id=SQLiteIndexToDocstoreId(docstore) if mmap else docstore.ids_by_position() # type: ignore
     )
+    index.index_version = version # type: ignore
+    return index
 
 
 
@@ -104,18 +186,19 @@ def store_generated_proposal(proposal_text: str, index_path: str, metadata: dict
         doc.metadata["source"] = filename
         doc.metadata["generated_at"] = datetime.datetime.now().isoformat()
         doc.metadata["filepath"] = filepath
+        get_taxonomy_tagger().tag_documents([doc])
+        get_keyword_booster().annotate([doc])
         
         print(f"📝 Document chargé avec {len(doc.page_content)} caractères")
         print(f"📋 Métadonnées: {doc.metadata}")
         
-        # Charger le modèle d'embedding
-        print("🤖 Chargement du modèle d'embedding...")
-        embedder = get_embedding_model()
+        # Modèle d'embedding partagé (déjà résident si le pipeline a tourné)
+        embedder = get_shared_embedder()
         
-        # Charger ou créer l'index FAISS
+        # Charger l'index en écriture (l'index partagé est mappé en lecture seule) ou le créer
         try:
             print(f"📂 Chargement de l'index FAISS: {index_path}")
-            index = FAISS.load_local(index_path, embedder, allow_dangerous_deserialization=True)
+            index = load_index(index_path, embedder, mmap=False)
             print("✅ Index FAISS existant chargé")
         except Exception as faiss_load_error:
             print(f"⚠️ FAISS index introuvable. Création d'un nouveau. Erreur: {faiss_load_error}")
@@ -124,13 +207,25 @@ def store_generated_proposal(proposal_text: str, index_path: str, metadata: dict
             temp_doc = Document(page_content="document temporaire", metadata={})
             index = FAISS.from_documents([temp_doc], embedder)
         
-        # Ajouter le document à l'index
+        # Ajouter le document à l'index (ID déterministe pour le manifeste d'ingestion)
         print("➕ Ajout du document à l'index...")
-        index.add_documents([doc])
+        key = relative_key(filepath, "data")
+        content_hash = file_hash(filepath)
+        chunk_ids = make_chunk_ids(key, content_hash, 1)
+        index.add_documents([doc], ids=chunk_ids)
         
         # Sauvegarder l'index
         print("💾 Sauvegarde de l'index FAISS...")
-        index.save_local(index_path)
+        save_index(index, index_path)
+
+        # Les sessions remappent le nouvel index au prochain appel (chargement quasi instantané)
+        invalidate_shared_index(index_path)
+
+        # Référencer la propale dans le manifeste pour qu'une réindexation ne la duplique pas
+        manifest = load_manifest(index_path)
+        if manifest["files"]:
+            record_file(manifest, key, content_hash, chunk_ids)
+            save_manifest(index_path, manifest)
         
         print("✅ Propale indexée et sauvegardée dans FAISS.")
         return filepath
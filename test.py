@@ -7,11 +7,11 @@ import time
 import streamlit as st
 import streamlit.components.v1 as components  
 from modules.loader import load_pdf
-from modules.rag_core import full_rag_pipeline
+from modules.rag_core import stream_rag_pipeline
 from modules.feedback import handle_feedback
 from modules.splitter import splitdocuments
 from modules.vector_store import load_index
-from modules.metrics import display_metrics_dashboard, rag_metrics  
+from modules.metrics import display_metrics_dashboard  
 from main import prepare_index_from_directory
 from fpdf import FPDF
 from pptx import Presentation
@@ -175,23 +175,25 @@ with st.expander("📂 Gestion documentaire – Voir et ajouter des documents"):
 
     # 3. Bouton pour réindexer après ajout
     if st.button("🔄 Réindexer après ajout de documents"):
-        with st.spinner("📥 Lecture des documents, découpage et indexation en cours..."):
-            # Charger les PDF
-            all_documents = []
-            for pdf_path in pdf_files:
-                docs = load_pdf(pdf_path)
-                all_documents.extend(docs)
-
-            st.write(f"📚 **{len(all_documents)} pages extraites** avant découpage.")
-
-            # Chunking
-            chunks = splitdocuments(all_documents)
-            st.write(f"🧩 **{len(chunks)} chunks générés** pour l'indexation.")
-
-            # Ingestion finale
-            prepare_index_from_directory(data_dir, index_path)
-
-        st.success("✅ Index vectoriel reconstruit avec succès à partir des documents !")
+        with st.spinner("📥 Lecture des nouveaux documents, découpage et indexation en cours..."):
+            # Ingestion incrémentale : seuls les fichiers nouveaux ou modifiés sont vectorisés
+            report = prepare_index_from_directory(data_dir, index_path)
+
+        st.write(f"🧩 **{report['chunks_embedded']} chunks vectorisés** "
+                 f"({report['files_new']} nouveaux, {report['files_changed']} modifiés, "
+                 f"{report['files_deleted']} supprimés).")
+        st.write(f"⏭️ **{report['files_skipped']} documents inchangés ignorés** "
+                 f"({report['chunks_reused']} chunks réutilisés) • ⏱️ {report['duration_seconds']:.2f}s")
+        if report["file_timings"]:
+            slowest = report["file_timings"][0]
+            st.write(f"🐢 Parsing le plus long : `{os.path.basename(slowest['file'])}` "
+                     f"({slowest['pages']} pages, {slowest['parse_seconds']:.2f}s)")
+        if report.get("benchmark"):
+            bench = report["benchmark"]
+            st.write(f"📏 Index **{bench['index_type']}** ({bench['ntotal']} vecteurs) • "
+                     f"recall@{bench['k']} = {bench['recall_at_k']:.3f} • "
+                     f"p50 = {bench['p50_ms']:.2f} ms • p99 = {bench['p99_ms']:.2f} ms")
+        st.success("✅ Index vectoriel mis à jour avec succès à partir des documents !")
         
         
 
@@ -224,6 +226,7 @@ st.markdown("<br>", unsafe_allow_html=True)
 col_btn1, col_btn2, col_btn3 = st.columns([1, 2, 1])
 with col_btn2:
     generate_button = st.button("⚡ Générer la propale ", use_container_width=True, type="primary")
+    force_regenerate = st.checkbox("🔄 Forcer une nouvelle génération", help="Ignore les propositions en cache pour un brief similaire.")
 
 # ---------------------------------------------------------------------------------
 # TRAITEMENT ET RÉSULTATS AVEC MÉTRIQUES
@@ -235,20 +238,21 @@ if generate_button:
         with st.spinner("🔍 Analyse des documents en cours..."):
             start_time = time.time()
 
-            # ⚙️ Pipeline RAG (⚠️ Ne re-logge PAS ici)
-            result, top_chunks = full_rag_pipeline(user_query)
+            # ⚙️ Pipeline RAG (⚠️ Ne re-logge PAS ici) : recherche, puis proposition en streaming
+            fragments, top_chunks = stream_rag_pipeline(user_query, use_answer_cache=not force_regenerate)
+
+            live_text = st.empty()
+            result = ""
+            for fragment in fragments:
+                result += fragment
+                live_text.markdown(result + "▌")
+            live_text.empty()
 
             processing_time = time.time() - start_time
 
-            # ✅ Calcul local des scores POUR AFFICHAGE (sans ré-écrire dans metrics_data.json)
-            try:
-                relevance_score = rag_metrics.calculate_relevance_score(user_query, top_chunks)
-            except Exception:
-                relevance_score = 0.0
-            try:
-                quality_score = rag_metrics.calculate_response_quality(user_query, result)
-            except Exception:
-                quality_score = 0.0
+            # ✅ Scores calculés une seule fois, en arrière-plan, par l'écriture des métriques :
+            # ils s'affichent dès qu'ils sont prêts (None : erreur, rien d'enregistré)
+            logged_metrics = fragments.metrics
 
             metrics_view = {
                 "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
@@ -256,8 +260,7 @@ if generate_button:
                 "response_length": len(result or ""),
                 "num_chunks_retrieved": len(top_chunks or []),
                 "processing_time_seconds": round(processing_time, 3),
-                "relevance_score": round(relevance_score, 3),
-                "quality_score": round(quality_score, 3),
+                "logged": logged_metrics,
             }
 
             # Sauvegarder en session pour affichage
@@ -266,7 +269,7 @@ if generate_button:
             st.session_state["last_query"] = user_query
             st.session_state["last_metrics"] = metrics_view
 
-            st.toast(f"✅ Traité en {processing_time:.2f}s - Score: {metrics_view['relevance_score']:.3f}")
+            st.toast(f"✅ Traité en {processing_time:.2f}s")
 
     else:
         st.markdown("""
@@ -338,6 +341,15 @@ if "last_result" in st.session_state and st.session_state.get("last_result", "")
     # Afficher les métriques calculées localement
     if "last_metrics" in st.session_state:
         metrics = st.session_state["last_metrics"]
+        logged = metrics["logged"]
+
+        def _score_label(key: str) -> str:
+            if logged is None or logged.status == "dropped":
+                return "—"
+            value = logged.get(key)
+            return f"{value:.3f}" if value is not None else "⏳ en calcul"
+
+        scores = {key: _score_label(key) for key in ("relevance_score", "quality_score")}
 
         st.markdown(f"""
         <div class="metrics-card">
@@ -345,11 +357,11 @@ if "last_result" in st.session_state and st.session_state.get("last_result", "")
             <div class="metrics-grid">
                 <div class="metric-item">
                     <strong>🎯 Pertinence Query-Chunks</strong>
-                    <span>{metrics['relevance_score']:.3f}</span>
+                    <span>{scores['relevance_score']}</span>
                 </div>
                 <div class="metric-item">
                     <strong>✨ Qualité de la réponse</strong>
-                    <span>{metrics['quality_score']:.3f}</span>
+                    <span>{scores['quality_score']}</span>
                 </div>
                 <div class="metric-item">
                     <strong>⚡ Temps de traitement</strong>
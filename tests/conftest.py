@@ -0,0 +1,7 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Modules du projet importables sans installation (python -m pytest depuis la racine ou ailleurs)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
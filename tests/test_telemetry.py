@@ -0,0 +1,156 @@
+# tests/test_telemetry.py
+
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from modules import telemetry
+from modules.metrics_store import LATENCY_EDGES
+from modules.telemetry import (
+    Counter, Gauge, Histogram, MetricsRegistry, TraceWriter, LATENCY_BUCKETS, _collect_stage_latency
+)
+from modules.timing import RequestTimings, stage_histograms
+
+
+def _samples(text: str) -> dict:
+    """
+    {nom{labels}: valeur} des lignes d'échantillons d'une exposition texte Prometheus.
+    """
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_counter_and_gauge_exposition():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("test_requests_total", "Requêtes."))
+    gauge = registry.register(Gauge("test_vectors", "Vecteurs."))
+    counter.inc(pipeline="rag", status="ok")
+    counter.inc(2, pipeline="rag", status="ok")
+    gauge.set(42, index='a"b\\c')
+
+    text = registry.render()
+    assert "# HELP test_requests_total Requêtes.\n# TYPE test_requests_total counter" in text
+    assert "# TYPE test_vectors gauge" in text
+    samples = _samples(text)
+    assert samples['test_requests_total{pipeline="rag",status="ok"}'] == 3
+    # Guillemets et antislashs échappés dans les valeurs de labels
+    assert samples['test_vectors{index="a\\"b\\\\c"}'] == 42
+    assert text.endswith("\n")
+
+
+def test_histogram_exposition_is_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.register(Histogram("test_duration_seconds", "Durée.", (0.1, 1.0, 10.0)))
+    for value in (0.05, 0.5, 0.5, 5.0, 50.0):
+        histogram.observe(value, pipeline="rag")
+
+    samples = _samples(registry.render())
+    assert samples['test_duration_seconds_bucket{pipeline="rag",le="0.1"}'] == 1
+    assert samples['test_duration_seconds_bucket{pipeline="rag",le="1.0"}'] == 3
+    assert samples['test_duration_seconds_bucket{pipeline="rag",le="10.0"}'] == 4
+    assert samples['test_duration_seconds_bucket{pipeline="rag",le="+Inf"}'] == 5
+    assert samples['test_duration_seconds_count{pipeline="rag"}'] == 5
+    assert samples['test_duration_seconds_sum{pipeline="rag"}'] == pytest.approx(56.05)
+
+
+def test_metric_without_samples_is_not_exported():
+    registry = MetricsRegistry()
+    registry.register(Counter("test_unused_total", "Jamais incrémenté."))
+    assert "test_unused_total" not in registry.render()
+
+
+def test_failing_collector_does_not_break_render():
+    registry = MetricsRegistry()
+    registry.register(Counter("test_ok_total", "OK.")).inc()
+
+    def broken():
+        raise RuntimeError("collecteur en panne")
+
+    registry.add_collector(broken)
+    registry.add_collector(lambda: ["test_collected 1"])
+    samples = _samples(registry.render())
+    assert samples["test_ok_total"] == 1
+    assert samples["test_collected"] == 1
+
+
+def test_stage_latency_collector_matches_internal_histograms():
+    stage = "test_stage_collector"
+    values = (0.002, 0.002, 0.03, 0.4, 7.0)
+    for value in values:
+        stage_histograms.observe(stage, value)
+
+    samples = _samples("\n".join(_collect_stage_latency()))
+    prefix = "skillia_stage_duration_seconds"
+    assert samples[f'{prefix}_count{{stage="{stage}"}}'] == len(values)
+    assert samples[f'{prefix}_sum{{stage="{stage}"}}'] == pytest.approx(sum(values))
+    assert samples[f'{prefix}_bucket{{stage="{stage}",le="+Inf"}}'] == len(values)
+    previous = 0
+    for bound in LATENCY_BUCKETS:
+        count = samples[f'{prefix}_bucket{{stage="{stage}",le="{bound!r}"}}']
+        assert count >= previous  # cumulatif
+        # Classes internes de largeur ~12 % : seules les mesures proches de la borne peuvent différer
+        assert sum(value <= bound / 1.13 for value in values) <= count <= sum(value <= bound for value in values)
+        previous = count
+    assert LATENCY_BUCKETS[0] == pytest.approx(float(LATENCY_EDGES[1]))
+
+
+def test_exporter_serves_metrics_endpoint():
+    server = telemetry.start_exporter(port="0")
+    assert server is not None
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    telemetry.requests_total.inc(pipeline="test_exporter", status="ok")
+    stage_histograms.observe("test_stage_exporter", 0.01)
+
+    with urllib.request.urlopen(f"{base}/metrics") as response:
+        assert response.status == 200
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        body = response.read().decode("utf-8")
+    assert _samples(body)['skillia_requests_total{pipeline="test_exporter",status="ok"}'] == 1
+    assert "# TYPE skillia_stage_duration_seconds histogram" in body
+    assert 'skillia_stage_duration_seconds_count{stage="test_stage_exporter"} 1' in body
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(f"{base}/other")
+    assert error.value.code == 404
+
+
+def test_exporter_disabled_without_port():
+    assert telemetry.start_exporter(port="") is None
+
+
+def test_trace_writer_spans(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    timings = RequestTimings("rag.test")
+    timings.record("search", 0.01)
+    timings.record("metrics", 0.02)
+    timings.attributes["llm.prompt_tokens"] = 12
+    TraceWriter(str(path)).write(timings, "ok", timings.start_ns)
+
+    spans = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    root, children = spans[0], spans[1:]
+    assert root["name"] == "rag.test" and root["parent_span_id"] is None
+    assert root["attributes"] == {"llm.prompt_tokens": 12, "rag.status": "ok"}
+    assert [span["name"] for span in children] == ["rag.search", "rag.metrics"]
+    assert {span["trace_id"] for span in spans} == {root["trace_id"]}
+    assert all(span["parent_span_id"] == root["span_id"] for span in children)
+    # La racine couvre les étapes terminées après la réponse (calcul des scores)
+    assert root["end_time_unix_nano"] >= max(span["end_time_unix_nano"] for span in children)
+
+
+def test_end_request_counts_and_traces(tmp_path, monkeypatch):
+    monkeypatch.setattr(telemetry.trace_writer, "path", str(tmp_path / "traces.jsonl"))
+    timings = RequestTimings("rag.test_end")
+    timings.attributes.update({"llm.prompt_tokens": 30, "llm.completion_tokens": 7})
+    telemetry.end_request(timings, "error", 0.25)
+
+    samples = _samples(telemetry.registry.render())
+    assert samples['skillia_requests_total{pipeline="rag.test_end",status="error"}'] == 1
+    assert samples['skillia_request_duration_seconds_count{pipeline="rag.test_end"}'] == 1
+    spans = [json.loads(line) for line in (tmp_path / "traces.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert spans[0]["status"] == {"code": "ERROR"}